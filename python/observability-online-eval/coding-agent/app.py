@@ -3,26 +3,45 @@ FastAPI application for the Coding Agent cookbook.
 
 Provides a single /chat endpoint that accepts user messages, auto-detects
 the appropriate mode (generate/improve/debug), and returns generated code
-with full Maxim observability and evaluation.
+with full Maxim observability and evaluation. /chat/stream runs the same
+turn but streams progress events as NDJSON.
+
+Turns for the same session run one at a time (FIFO). A request carrying the
+same Idempotency-Key as a running or recently finished turn attaches to that
+turn instead of running the pipeline again. Both are per worker process:
+with several workers, a turn whose session another worker saved meanwhile
+fails with 409 instead of overwriting it.
 """
 
+import asyncio
+import hashlib
+import json
+import time
+import weakref
 from collections import OrderedDict
 from uuid import uuid4
 
 import dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from coding_agent.agent import CodingAgent, SessionState
-from coding_agent.ai import AI
-from coding_agent.files import FilesDict
+from coding_agent.ai import AsyncAI
 from coding_agent.observability import CodingAgentObservability
+from coding_agent.sessions import SessionConflict, session_store_from_env
 
 dotenv.load_dotenv()
 
 app = FastAPI(title="Coding Agent")
 
-MAX_SESSIONS = 50
+# Turns allowed to wait behind the running one, per session
+MAX_QUEUED_TURNS = 8
+# How long finished turns answer duplicate requests
+COMPLETED_TURN_TTL = 600
+MAX_COMPLETED_TURNS = 1000
+# How often expired sessions and unreferenced file blobs are removed
+SESSION_PRUNE_INTERVAL = 3600
 
 
 # ── Request / Response Models ────────────────────────────────────────
@@ -41,12 +60,56 @@ class ChatResponse(BaseModel):
     trace_id: str
 
 
+class Turn:
+    """A chat turn that any number of requests can wait on or stream.
+
+    Every progress event is recorded, so a request that attaches late
+    replays the events it missed before following the live ones.
+    """
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.subscribers: set[asyncio.Queue] = set()
+        self.task: asyncio.Task | None = None
+
+    def publish(self, event: dict | None):
+        if event is not None:
+            self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    async def stream(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.task.done():
+            queue.put_nowait(None)
+        else:
+            self.subscribers.add(queue)
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            self.subscribers.discard(queue)
+
+
 # ── Global State ─────────────────────────────────────────────────────
 
-sessions: OrderedDict[str, SessionState] = OrderedDict()
+# memory (default), sqlite or file; see coding_agent/sessions.py
+sessions = session_store_from_env()
+background_tasks: set[asyncio.Task] = set()
+
+# Locks live as long as a turn holds or waits on them
+session_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+queued_turns: dict[str, int] = {}
+# (session_id, key) -> running turn / (finished turn, finished at)
+inflight_turns: dict[tuple[str, str], Turn] = {}
+completed_turns: OrderedDict[tuple[str, str], tuple[Turn, float]] = OrderedDict()
 
 obs = CodingAgentObservability()
-ai = AI(obs=obs)
+ai = AsyncAI(obs=obs)
 agent = CodingAgent(ai, obs)
 
 
@@ -54,24 +117,172 @@ agent = CodingAgent(ai, obs)
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest, idempotency_key: str | None = Header(default=None)
+):
     """Handle a chat turn: detect mode, generate/improve/debug, evaluate."""
-    session = _get_or_create_session(request.session_id)
+    turn = _start_turn(request, idempotency_key, stream=False)
+    # Shield: a disconnecting client must not cancel a turn others wait on
+    return await asyncio.shield(turn.task)
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest, idempotency_key: str | None = Header(default=None)
+):
+    """Run a chat turn, streaming progress as newline-delimited JSON events.
+
+    Events: mode, file (as soon as each file is complete), hunk (improve-mode
+    diff hunks as they complete), execution (per debug attempt), summary,
+    then a final done (same fields as /chat) or error.
+    """
+    turn = _start_turn(request, idempotency_key, stream=True)
+
+    async def stream():
+        async for event in turn.stream():
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "observability": obs.stats()}
+
+
+@app.get("/session/{session_id}")
+async def get_session(session_id: str):
+    """Retrieve session state (files and history)."""
+    session = await asyncio.to_thread(sessions.load, session_id)
+    if not session:
+        raise HTTPException(404, "Session not found")
+    return {
+        "session_id": session_id,
+        "files": dict(session.files),
+        "history": session.history,
+    }
+
+
+@app.on_event("startup")
+async def startup():
+    task = asyncio.create_task(_prune_sessions())
+    background_tasks.add(task)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    agent.sandboxes.cleanup()
+    agent.fix_cache.close()
+    sessions.close()
+    obs.cleanup()
+
+
+# ── Helpers ──────────────────────────────────────────────────────────
+
+
+def _start_turn(request: ChatRequest, idempotency_key: str | None, stream: bool) -> Turn:
+    """Attach to a matching running/finished turn, or queue a new one.
+
+    Without an Idempotency-Key, an identical message for the same session
+    still attaches to the turn while it is running (client retries), but
+    not after it has finished.
+    """
+    explicit = idempotency_key is not None
+    key = (
+        request.session_id,
+        idempotency_key
+        or hashlib.sha256(request.message.encode()).hexdigest(),
+    )
+
+    turn = inflight_turns.get(key)
+    if turn is not None:
+        return turn
+    _expire_completed_turns()
+    if explicit and key in completed_turns:
+        return completed_turns[key][0]
+
+    # Count includes the running turn
+    if queued_turns.get(request.session_id, 0) > MAX_QUEUED_TURNS:
+        raise HTTPException(429, "Too many queued turns for this session")
+    queued_turns[request.session_id] = queued_turns.get(request.session_id, 0) + 1
+
+    turn = Turn()
+    turn.task = asyncio.create_task(_run_turn(request, turn, stream))
+    inflight_turns[key] = turn
+    # Keep a reference so the turn finishes even if every client disconnects
+    background_tasks.add(turn.task)
+
+    def finished(task: asyncio.Task):
+        background_tasks.discard(task)
+        inflight_turns.pop(key, None)
+        queued_turns[request.session_id] -= 1
+        if not queued_turns[request.session_id]:
+            del queued_turns[request.session_id]
+        # Retrieve the exception even when nobody awaits the task (every
+        # client disconnected), so asyncio doesn't log it as never retrieved
+        failed = task.cancelled() or task.exception() is not None
+        if explicit and not failed:
+            # Late duplicates only need the final "done" event
+            turn.events = turn.events[-1:]
+            completed_turns[key] = (turn, time.monotonic())
+            while len(completed_turns) > MAX_COMPLETED_TURNS:
+                completed_turns.popitem(last=False)
+
+    turn.task.add_done_callback(finished)
+    return turn
+
+
+def _expire_completed_turns():
+    cutoff = time.monotonic() - COMPLETED_TURN_TTL
+    while completed_turns:
+        key, (_, finished_at) = next(iter(completed_turns.items()))
+        if finished_at >= cutoff:
+            break
+        completed_turns.popitem(last=False)
+
+
+async def _run_turn(request: ChatRequest, turn: Turn, stream: bool) -> ChatResponse:
+    """Run one turn under the session lock, publishing events to `turn`."""
+    session_id = request.session_id
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+
+    try:
+        async with lock:
+            return await _execute_turn(request, turn, stream)
+    finally:
+        turn.publish(None)
+
+
+async def _execute_turn(request: ChatRequest, turn: Turn, stream: bool) -> ChatResponse:
     trace_id = uuid4().hex
 
     # Start trace
+    tags = {"session_id": request.session_id}
+    if stream:
+        tags["stream"] = "true"
     trace = obs.start_trace(
         trace_id=trace_id,
         name="Chat Turn",
         input_text=request.message,
         session_id=request.session_id,
-        tags={"session_id": request.session_id},
+        tags=tags,
     )
 
     output_text = "ERROR: turn failed before completion"
     try:
+        session = await _load_session(request.session_id)
+
         # Run agent
-        result = agent.chat(request.message, session, trace)
+        result = await agent.achat(
+            request.message, session, trace, on_event=turn.publish
+        )
+        try:
+            await _save_session(session)
+        except SessionConflict as exc:
+            # Another worker ran a turn on this session meanwhile
+            raise HTTPException(409, str(exc)) from exc
 
         # Format output for evaluators (all files concatenated)
         output_text = result.files.to_display()
@@ -80,50 +291,38 @@ def chat(request: ChatRequest):
         obs.attach_evaluators(trace, request.message, output_text)
     except Exception as exc:
         output_text = f"ERROR: {exc}"
+        turn.publish({"type": "error", "error": str(exc), "trace_id": trace_id})
         raise
     finally:
         # End trace even when agent/evaluator flow fails.
         obs.end_trace(trace, output_text)
 
-    return ChatResponse(
+    response = ChatResponse(
         session_id=request.session_id,
         mode=result.mode,
         files=dict(result.files),
         summary=result.summary,
         trace_id=trace_id,
     )
+    turn.publish({"type": "done", **response.model_dump()})
+    return response
 
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+async def _prune_sessions():
+    """Periodically drop expired sessions and blobs nothing references."""
+    while True:
+        try:
+            await asyncio.to_thread(sessions.prune)
+        except Exception as exc:
+            # Pruning is housekeeping; try again next interval
+            print(f"Session prune failed: {exc!r}")
+        await asyncio.sleep(SESSION_PRUNE_INTERVAL)
 
 
-@app.get("/session/{session_id}")
-def get_session(session_id: str):
-    """Retrieve session state (files and history)."""
-    session = sessions.get(session_id)
-    if not session:
-        raise HTTPException(404, "Session not found")
-    return {
-        "session_id": session_id,
-        "files": dict(session.files),
-        "history": session.history,
-    }
-
-
-@app.on_event("shutdown")
-def shutdown():
-    obs.cleanup()
-
-
-# ── Helpers ──────────────────────────────────────────────────────────
+async def _load_session(session_id: str) -> SessionState:
+    """Get existing session or create a new one (stores may block on I/O)."""
+    return await asyncio.to_thread(sessions.get_or_create, session_id)
 
 
-def _get_or_create_session(session_id: str) -> SessionState:
-    """Get existing session or create a new one, evicting oldest if at capacity."""
-    if session_id not in sessions:
-        if len(sessions) >= MAX_SESSIONS:
-            sessions.popitem(last=False)  # evict oldest
-        sessions[session_id] = SessionState(session_id=session_id)
-    return sessions[session_id]
+async def _save_session(session: SessionState):
+    await asyncio.to_thread(sessions.save, session)
@@ -0,0 +1,204 @@
+"""
+Benchmark: end-to-end CodingAgent turns replayed from recorded LLM fixtures.
+
+Drives CodingAgent.chat through a generate -> improve -> debug session with
+ReplayAI, so no API calls are made, and reports per-stage latency: each LLM
+call (with tokens), response parsing / diff application, code execution and
+whole turns. Use --json to save the results and --baseline to fail (exit 1)
+when a stage got slower than a previous run, e.g. in CI.
+
+Usage:
+    python benchmarks/bench_agent.py [--repeat 5] [--latency]
+    python benchmarks/bench_agent.py --json bench.json --baseline main.json
+    python benchmarks/bench_agent.py --record   # needs OPENAI_API_KEY
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from uuid import uuid4
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import coding_agent.agent as agent_module  # noqa: E402
+from coding_agent.agent import CodingAgent, SessionState  # noqa: E402
+from coding_agent.execution import ExecutionEnvironment  # noqa: E402
+from coding_agent.fix_cache import FixCache  # noqa: E402
+from coding_agent.mode_detection import ModeClassifier  # noqa: E402
+from coding_agent.replay import FixtureStore, ReplayAI  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "agent_session.json")
+
+SCENARIO = [
+    ("generate", "build a command line calculator in python"),
+    ("improve", "add a history command that lists previous results"),
+    ("debug", "it crashes when dividing by zero, fix it"),
+]
+
+
+# ── Stage timing ────────────────────────────────────────────────────
+
+
+class StageTimes:
+    """Thread-safe accumulator of (calls, seconds, tokens) per stage."""
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "tokens": 0})
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, tokens: int = 0):
+        with self._lock:
+            entry = self.stages[stage]
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["tokens"] += tokens
+
+    def timed(self, stage: str, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        return wrapper
+
+
+class TimedReplayAI(ReplayAI):
+    """ReplayAI that reports each chat call as an llm:<generation> stage."""
+
+    def __init__(self, times: StageTimes, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.times = times
+
+    def chat(self, *args, generation_name: str = None, **kwargs):
+        start = time.perf_counter()
+        text, usage = super().chat(*args, generation_name=generation_name, **kwargs)
+        self.times.add(
+            f"llm:{generation_name}", time.perf_counter() - start, usage["total_tokens"]
+        )
+        return text, usage
+
+
+class NullObservability:
+    """Stands in for CodingAgentObservability; records nothing."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def instrument(times: StageTimes):
+    """Time parsing and execution where the agent calls them."""
+    for name in ("parse_chat_to_files", "parse_diffs", "apply_diffs"):
+        setattr(agent_module, name, times.timed("parse", getattr(agent_module, name)))
+    ExecutionEnvironment.execute = times.timed(
+        "execution", ExecutionEnvironment.execute
+    )
+
+
+# ── Runs ────────────────────────────────────────────────────────────
+
+
+def run_session(agent: CodingAgent, times: StageTimes):
+    # Fresh caches so every repeat does the same work
+    agent.fix_cache = FixCache()
+    agent.mode_classifier = ModeClassifier()
+    session = SessionState(session_id=uuid4().hex)
+    for expected, message in SCENARIO:
+        start = time.perf_counter()
+        result = agent.chat(message, session, trace=None)
+        times.add(f"turn:{result.mode}", time.perf_counter() - start)
+        if result.mode != expected:
+            raise AssertionError(f"expected {expected} turn, got {result.mode}")
+
+
+def report(times: StageTimes, repeat: int) -> dict:
+    results = {}
+    print(f"{'stage':<26}{'calls':>7}{'mean':>11}{'total':>11}{'tokens':>9}")
+    for stage in sorted(times.stages):
+        entry = times.stages[stage]
+        mean_ms = entry["seconds"] / entry["calls"] * 1000
+        results[stage] = {
+            "calls": entry["calls"] // repeat,
+            "mean_ms": round(mean_ms, 3),
+            "tokens": entry["tokens"] // repeat,
+        }
+        print(
+            f"{stage:<26}{entry['calls']:>7}{mean_ms:>9.2f}ms"
+            f"{entry['seconds'] * 1000:>9.1f}ms{entry['tokens']:>9}"
+        )
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float, slack_ms: float):
+    """Stages slower than baseline * (1 + tolerance) + slack_ms."""
+    found = []
+    for stage, entry in results.items():
+        before = baseline.get(stage)
+        if before is None or stage.startswith("llm:"):
+            continue  # replayed LLM time only measures fixture lookup
+        limit = before["mean_ms"] * (1 + tolerance) + slack_ms
+        if entry["mean_ms"] > limit:
+            found.append(f"{stage}: {entry['mean_ms']:.2f}ms > {limit:.2f}ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--latency", action="store_true", help="sleep the recorded API latency"
+    )
+    parser.add_argument(
+        "--record", action="store_true", help="call the API for missing fixtures"
+    )
+    parser.add_argument("--json", help="write per-stage results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--slack-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    fixtures = FixtureStore(args.fixtures, "record" if args.record else "replay")
+    times = StageTimes()
+    agent = CodingAgent(
+        TimedReplayAI(times, fixtures, simulate_latency=args.latency),
+        NullObservability(),
+        speculative_fixes=1,
+    )
+    instrument(times)
+
+    try:
+        # Warm-up run (sandbox pool, imports) is not measured
+        run_session(agent, times)
+        times.stages.clear()
+        for _ in range(args.repeat):
+            run_session(agent, times)
+    finally:
+        agent.sandboxes.cleanup()
+        if args.record:
+            fixtures.save()
+
+    results = report(times, args.repeat)
+    print(f"\nfixtures: {fixtures.hits} hits, {fixtures.misses} misses")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(
+                results, json.load(f), args.tolerance, args.slack_ms
+            )
+        if slower:
+            print("\nRegressions:\n  " + "\n  ".join(slower))
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: line-list apply_diffs vs the previous OrderedDict implementation.
+
+Applies many hunks to a large file, once with correct @@ line numbers and
+once with every header off by a few lines (as LLMs often produce), and
+reports time and whether each implementation produced the expected file.
+
+Usage:
+    python benchmarks/bench_apply_diffs.py [--lines 20000] [--hunks 500]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from coding_agent.files import FilesDict, apply_diffs  # noqa: E402
+
+
+# ── Previous implementation (reference) ─────────────────────────────
+
+
+def legacy_apply_diffs(diffs: list[dict], existing_files: FilesDict) -> FilesDict:
+    files = FilesDict(existing_files.copy())
+    REMOVE_FLAG = "<REMOVE_LINE>"
+
+    for diff in diffs:
+        source_name = diff["filename_pre"]
+        source_lines = files[source_name].split("\n")
+        line_dict = OrderedDict((i + 1, line) for i, line in enumerate(source_lines))
+
+        for hunk in diff["hunks"]:
+            current_line = hunk["hunk_start"]
+            for action, content in hunk["lines"]:
+                if action == " ":
+                    current_line += 1
+                elif action == "+":
+                    current_line -= 1
+                    if current_line in line_dict and line_dict[current_line] != REMOVE_FLAG:
+                        line_dict[current_line] += "\n" + content
+                    else:
+                        line_dict[current_line] = content
+                    current_line += 1
+                elif action == "-":
+                    line_dict[current_line] = REMOVE_FLAG
+                    current_line += 1
+
+        line_dict = {k: v for k, v in line_dict.items() if REMOVE_FLAG not in v}
+        files[diff["filename_post"]] = "\n".join(line_dict.values())
+
+    return files
+
+
+# ── Synthetic workload ──────────────────────────────────────────────
+
+
+def make_workload(n_lines: int, n_hunks: int, header_error: int):
+    """Return (files, diffs, expected_content).
+
+    Every hunk replaces one line surrounded by two context lines on each side.
+    """
+    source = [f"    statement_{i} = value({i})" for i in range(n_lines)]
+    expected = list(source)
+    step = n_lines // (n_hunks + 1)
+    hunks = []
+    for h in range(n_hunks):
+        target = (h + 1) * step
+        expected[target] = f"    statement_{target} = patched({target})"
+        hunks.append({
+            "hunk_start": target - 2 + 1 + header_error,
+            "lines": [
+                (" ", source[target - 2]),
+                (" ", source[target - 1]),
+                ("-", source[target]),
+                ("+", expected[target]),
+                (" ", source[target + 1]),
+                (" ", source[target + 2]),
+            ],
+        })
+    diff = {
+        "filename_pre": "big.py",
+        "filename_post": "big.py",
+        "hunks": hunks,
+        "is_new": False,
+    }
+    return FilesDict({"big.py": "\n".join(source)}), [diff], "\n".join(expected)
+
+
+def best_of(fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=20_000)
+    parser.add_argument("--hunks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<18}{'impl':<10}{'time':>10}  correct")
+    for scenario, header_error in (("exact headers", 0), ("headers off by 3", 3)):
+        files, diffs, expected = make_workload(args.lines, args.hunks, header_error)
+        for name, fn in (("legacy", legacy_apply_diffs), ("new", apply_diffs)):
+            elapsed, result = best_of(lambda: fn(diffs, files), args.repeat)
+            ok = result["big.py"] == expected
+            print(f"{scenario:<18}{name:<10}{elapsed * 1000:>8.1f}ms  {ok}")
+
+
+if __name__ == "__main__":
+    main()
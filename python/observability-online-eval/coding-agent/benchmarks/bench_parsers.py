@@ -0,0 +1,225 @@
+"""
+Benchmark: incremental ChatStreamParser vs the previous regex parsers.
+
+Builds multi-hundred-KB multi-file responses, checks that the new
+parse_chat_to_files / parse_diffs return the same result as the old
+regex-based versions, and reports timings (plus chunked streaming).
+
+Usage:
+    python benchmarks/bench_parsers.py [--files 200] [--lines 60] [--repeat 5]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from coding_agent.files import (  # noqa: E402
+    ChatStreamParser,
+    FilesDict,
+    parse_chat_to_files,
+    parse_diffs,
+)
+
+
+# ── Previous regex implementations (reference) ──────────────────────
+
+
+def regex_parse_chat_to_files(chat_response: str) -> FilesDict:
+    regex = r"(\S+)\n\s*```[^\n]*\n(.+?)```"
+    matches = re.finditer(regex, chat_response, re.DOTALL)
+
+    files = FilesDict()
+    for match in matches:
+        path = re.sub(r'[\:<>"|?*]', "", match.group(1))
+        path = re.sub(r"^\[(.*)\]$", r"\1", path)
+        path = re.sub(r"^`(.*)`$", r"\1", path)
+        path = re.sub(r"[\]\:]$", "", path)
+        content = match.group(2)
+        files[path.strip()] = content.strip()
+    return files
+
+
+def regex_parse_diffs(diff_string: str) -> list[dict]:
+    block_pattern = re.compile(
+        r"```(?:diff)?\s*\n(---\s+\S+.*?\n\+\+\+\s+\S+.*?\n(?:@@.*?@@\n(?:[-+ ].*?\n)*?)*?)```",
+        re.DOTALL,
+    )
+
+    diffs = []
+    for block_match in block_pattern.finditer(diff_string):
+        block = block_match.group(1)
+        lines = block.strip().split("\n")
+
+        filename_pre = None
+        filename_post = None
+        hunks = []
+        current_hunk = None
+
+        for line in lines:
+            if line.startswith("--- "):
+                filename_pre = line[4:].strip()
+            elif line.startswith("+++ "):
+                filename_post = line[4:].strip()
+            elif line.startswith("@@ "):
+                header_match = re.match(r"@@ -(\d+)", line)
+                current_hunk = {
+                    "hunk_start": int(header_match.group(1)) if header_match else 1,
+                    "lines": [],
+                }
+                hunks.append(current_hunk)
+            elif current_hunk is not None:
+                if line.startswith("+"):
+                    current_hunk["lines"].append(("+", line[1:]))
+                elif line.startswith("-"):
+                    current_hunk["lines"].append(("-", line[1:]))
+                else:
+                    current_hunk["lines"].append(
+                        (" ", line[1:] if line.startswith(" ") else line)
+                    )
+
+        if filename_post:
+            diffs.append({
+                "filename_pre": filename_pre,
+                "filename_post": filename_post,
+                "hunks": hunks,
+                "is_new": filename_pre == "/dev/null",
+            })
+
+    return diffs
+
+
+# ── Synthetic responses ─────────────────────────────────────────────
+
+
+def make_files_response(n_files: int, n_lines: int) -> str:
+    parts = ["Here is the implementation.\n"]
+    for i in range(n_files):
+        body = "\n".join(
+            f"    value_{j} = compute({i}, {j})  # step {j}" for j in range(n_lines)
+        )
+        parts.append(
+            f"src/pkg_{i % 7}/module_{i}.py\n```python\n"
+            f"def function_{i}():\n{body}\n    return value_0\n```\n"
+        )
+    parts.append("This concludes a fully working implementation.")
+    return "\n".join(parts)
+
+
+def make_diff_response(n_files: int, n_hunks: int) -> str:
+    parts = ["Changes below.\n"]
+    for i in range(n_files):
+        hunks = []
+        for h in range(n_hunks):
+            start = 1 + h * 20
+            hunks.append(
+                f"@@ -{start},4 +{start},5 @@\n"
+                f"     context_a_{h}\n"
+                f"     context_b_{h}\n"
+                f"-    old_line_{h}\n"
+                f"+    new_line_{h}\n"
+                f"+    extra_line_{h}\n"
+                f"     context_c_{h}\n"
+            )
+        parts.append(
+            f"```diff\n--- module_{i}.py\n+++ module_{i}.py\n{''.join(hunks)}```\n"
+        )
+    return "\n".join(parts)
+
+
+EDGE_CASES = [
+    "**main.py**\n```python\nprint(1)\n```\n",
+    "File: `app/util.py`:\n\n\n  ```\nx = 1\n```trailing text\nnext.txt\n```\nok\n```",
+    "[src/a.js]\n```js\nconst a = 1;\n```\nsrc/b.js \n```js\nno filename\n```\n",
+    "```diff\n--- a.py\n+++ a.py\n@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n y = 3\n```\n",
+    "```\n--- /dev/null\n+++ new.py\n@@ -0,0 +1,2 @@\n+a\n+\n```",
+    "```diff\n--- a.py\n+++ b.py\n@@ -3 +3 @@\n-old\n+new\n@@ -10,1 +10,1 @@\n-p\n+q\n```",
+    "```python\n--- not a diff\n```\n",
+    # Empty files (a package's __init__.py)
+    "pkg/__init__.py\n```python\n\n```\npkg/main.py\n```python\nx = 1\n```\n",
+    # Blank lines (and trailing spaces) before the closing fence of a diff
+    "```diff\n--- a.py\n+++ a.py\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 2\n\n```\n",
+    "```diff\n--- a.py\n+++ a.py\n@@ -1 +1 @@\n-x\n+y  \n \n\t\n\n```",
+    "```diff\n--- a.py\n+++ a.py\n@@ -1 +1 @@\n-x\n\n+y\n@@ -5 +5 @@\n\n```\n",
+]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def stream(text: str, chunk_size: int = 64) -> list[dict]:
+    """Feed text to ChatStreamParser in fixed-size chunks."""
+    parser = ChatStreamParser()
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return events + parser.close()
+
+
+def regex_stream(text: str, chunk_size: int = 64) -> int:
+    """Previous streaming approach: re-parse the buffer whenever a fence may close."""
+    buffer = ""
+    seen = set()
+    for i in range(0, len(text), chunk_size):
+        chunk = text[i:i + chunk_size]
+        buffer += chunk
+        if "`" in chunk:
+            seen.update(regex_parse_chat_to_files(buffer))
+    return len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=60)
+    parser.add_argument("--hunks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files_text = make_files_response(args.files, args.lines)
+    diff_text = make_diff_response(args.files, args.hunks)
+
+    # Same results as the regexes, whether parsed at once or streamed. On
+    # diff responses the old file regex reads closing fences as filenames,
+    # so parse_chat_to_files is only compared on file-format responses.
+    for i, text in enumerate([files_text, diff_text, *EDGE_CASES]):
+        if text is not diff_text:
+            assert parse_chat_to_files(text) == regex_parse_chat_to_files(text), i
+        assert parse_diffs(text) == regex_parse_diffs(text), i
+        for chunk_size in (1, 7, 64):
+            assert stream(text, chunk_size) == stream(text, len(text)), (i, chunk_size)
+
+    print(f"{'one-shot parse':<22}{'size':>10}{'regex':>12}{'parser':>12}")
+    rows = [
+        ("parse_chat_to_files", files_text,
+         regex_parse_chat_to_files, parse_chat_to_files),
+        ("parse_diffs", diff_text, regex_parse_diffs, parse_diffs),
+    ]
+    for name, text, old, new in rows:
+        t_old = best_of(lambda: old(text), args.repeat)
+        t_new = best_of(lambda: new(text), args.repeat)
+        print(
+            f"{name:<22}{len(text) // 1024:>8}KB"
+            f"{t_old * 1000:>10.1f}ms{t_new * 1000:>10.1f}ms"
+        )
+
+    print(f"\n{'streamed (64B chunks)':<22}{'size':>10}{'re-parse':>12}{'parser':>12}")
+    t_old = best_of(lambda: regex_stream(files_text), 1)
+    t_new = best_of(lambda: stream(files_text), args.repeat)
+    print(
+        f"{'files':<22}{len(files_text) // 1024:>8}KB"
+        f"{t_old * 1000:>10.1f}ms{t_new * 1000:>10.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -90,6 +90,7 @@ def main():
     except KeyboardInterrupt:
         print()
     finally:
+        agent.sandboxes.cleanup()
         obs.cleanup()
         print("Goodbye!")
 
@@ -9,14 +9,34 @@ Supports three modes:
 Adapted from gpt-engineer's simple_agent + steps, simplified for cookbook clarity.
 """
 
+import asyncio
+import contextvars
 import os
+import re
 from dataclasses import dataclass, field
+from typing import Callable, Mapping
 from uuid import uuid4
 
-from coding_agent.ai import AI
-from coding_agent.execution import ExecutionEnvironment, ExecutionResult
-from coding_agent.files import FilesDict, apply_diffs, parse_chat_to_files, parse_diffs
+from coding_agent.ai import AI, AsyncAI
+from coding_agent.compaction import CompactionState
+from coding_agent.execution import (
+    ExecutionEnvironment,
+    ExecutionResult,
+    SandboxPool,
+)
+from coding_agent.files import (
+    ChatStreamParser,
+    FilesDict,
+    apply_diffs,
+    parse_chat_to_files,
+    parse_diffs,
+)
+from coding_agent.fix_cache import FixCache, FixTracker
+from coding_agent.mode_detection import ModeClassifier, ModeDecision
 from coding_agent.observability import CodingAgentObservability
+from coding_agent.prompting import PromptRegistry, PromptSet
+from coding_agent.retrieval import ProjectIndex
+from coding_agent.steps import StepGraph
 
 
 @dataclass
@@ -31,44 +51,163 @@ class SessionState:
     session_id: str
     history: list[dict] = field(default_factory=list)
     files: FilesDict = field(default_factory=FilesDict)
+    compaction: CompactionState = field(default_factory=CompactionState)
+    index: ProjectIndex = field(default_factory=ProjectIndex)
+    # Store revision this state was loaded at (0: never saved)
+    version: int = 0
+
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+
+# Prompts of the turn being handled, so a hot reload never mixes prompt
+# versions within one turn
+_turn_prompts: contextvars.ContextVar[PromptSet | None] = contextvars.ContextVar(
+    "turn_prompts", default=None
+)
+
+_ERROR_LINE = re.compile(r"error|exception|traceback|failed", re.IGNORECASE)
+
+
+def _error_count(result: ExecutionResult) -> int:
+    """Rough severity of a failed run: number of error-looking output lines."""
+    count = sum(
+        1
+        for line in (result.stderr + "\n" + result.stdout).splitlines()
+        if _ERROR_LINE.search(line)
+    )
+    return max(count, 0 if result.success else 1)
+
+
+def _emit_changed_files(on_event, before: FilesDict, after: FilesDict):
+    """Emit a file event for every file that is new or changed in `after`."""
+    if on_event is None:
+        return
+    for name, content in after.items():
+        if before.get(name) != content:
+            on_event({"type": "file", "name": name, "content": content})
 
 
 class CodingAgent:
-    """Multi-turn coding agent with Maxim observability."""
+    """Multi-turn coding agent with Maxim observability.
 
-    MAX_DEBUG_ATTEMPTS = 5
+    achat() runs a turn on the caller's event loop; chat() is the blocking
+    entry point for sync callers such as the CLI. Both run the same async
+    pipeline, with an AsyncAI or a sync AI.
+    """
 
-    def __init__(self, ai: AI, obs: CodingAgentObservability):
+    MAX_DEBUG_ATTEMPTS = 5
+    # Token budget for the code context in improve mode; larger projects
+    # only send the files relevant to the request
+    IMPROVE_CONTEXT_BUDGET = 24_000
+    # Lines of run output forwarded live per debug attempt
+    MAX_STREAMED_OUTPUT_LINES = 200
+    # Temperature added per extra speculative fix candidate
+    SPECULATIVE_TEMPERATURE_STEP = 0.3
+
+    def __init__(
+        self, ai: AI, obs: CodingAgentObservability, speculative_fixes: int = None
+    ):
         self.ai = ai
         self.obs = obs
-        self.prompts = self._load_prompts()
+        # Fix candidates tried in parallel per failed run (1 = sequential)
+        if speculative_fixes is None:
+            speculative_fixes = int(os.getenv("SPECULATIVE_FIXES", "1"))
+        self.speculative_fixes = max(1, speculative_fixes)
+        # Shared per process; prompt edits are picked up without a restart
+        self.prompt_registry = PromptRegistry.shared(PROMPTS_DIR)
+        # Workdirs (and dependency venvs) reused across debug turns
+        memory_limit = os.getenv("EXECUTION_MEMORY_LIMIT_MB")
+        self.sandboxes = SandboxPool(
+            memory_limit_mb=int(memory_limit) if memory_limit else None
+        )
+        # Patches that fixed a given error before, replayed before fix_code
+        self.fix_cache = FixCache(path=os.getenv("FIX_CACHE_PATH"))
+        # Cheap mode detection in front of the mode_selection LLM call
+        self.mode_classifier = ModeClassifier(os.getenv("MODE_EXAMPLES_PATH"))
 
     def chat(self, message: str, session: SessionState, trace) -> ChatResult:
-        """Handle a single chat turn: detect mode, execute, summarize."""
-        # 1. Detect mode
-        mode = self._detect_mode(message, session, trace)
-
-        # 2. Execute mode
-        if mode == "generate":
-            files = self._generate(message, session, trace)
-        elif mode == "improve":
-            files = self._improve(message, session, trace)
-        else:
-            files = self._debug(message, session, trace)
-
-        # 3. Generate summary
-        summary = self._generate_summary(message, files, mode, trace)
-
-        # 4. Update session state
+        """Handle a single chat turn: detect mode, execute, summarize.
+
+        Runs achat() on a private event loop, so it must not be called from
+        a running one (await achat() there).
+        """
+        return asyncio.run(self.achat(message, session, trace))
+
+    async def achat(
+        self,
+        message: str,
+        session: SessionState,
+        trace,
+        on_event: Callable[[dict], None] = None,
+    ) -> ChatResult:
+        """Async chat turn, with an AsyncAI or a sync AI (run in threads).
+
+        If on_event is given it is called with progress events as the turn
+        runs: {"type": "mode"}, {"type": "file"} as soon as each file is
+        complete, {"type": "hunk"} as each improve-mode diff hunk completes,
+        {"type": "output"} per line of run output and {"type": "execution"}
+        per debug attempt, and {"type": "summary"}. File and hunk events
+        only arrive while the response streams with an AsyncAI; otherwise
+        they follow the complete response.
+        """
+        token = _turn_prompts.set(self.prompt_registry.current())
+        try:
+            mode = await self._detect_mode(message, session, trace)
+            if on_event:
+                on_event({"type": "mode", "mode": mode})
+
+            graph = StepGraph()
+            if mode == "generate":
+                graph.add(
+                    "files", lambda: self._generate(message, session, trace, on_event)
+                )
+                graph.add(
+                    "entrypoint",
+                    lambda files: self._gen_entrypoint(files, trace, on_event),
+                    deps=("files",),
+                )
+            elif mode == "improve":
+                graph.add(
+                    "files", lambda: self._improve(message, session, trace, on_event)
+                )
+            else:
+                graph.add(
+                    "files", lambda: self._debug(message, session, trace, on_event)
+                )
+            graph.add(
+                "summary",
+                lambda files: self._generate_summary(
+                    message, files, mode, trace, on_event
+                ),
+                deps=("files",),
+            )
+            results = await graph.arun()
+            files = results.get("entrypoint", results["files"])
+            summary = results["summary"]
+
+            self._update_session(session, message, summary, files)
+
+            return ChatResult(mode=mode, files=files, summary=summary)
+        finally:
+            _turn_prompts.reset(token)
+
+    def _update_session(
+        self, session: SessionState, message: str, summary: str, files: FilesDict
+    ):
         session.history.append({"role": "user", "content": message})
         session.history.append({"role": "assistant", "content": summary})
         session.files = files
 
-        return ChatResult(mode=mode, files=files, summary=summary)
+    async def _llm(self, *args, on_delta=None, **kwargs) -> tuple[str, dict]:
+        """self.ai.chat(): awaited for an AsyncAI, in a worker thread for a
+        sync AI (which doesn't stream, so on_delta is dropped)."""
+        if isinstance(self.ai, AsyncAI):
+            return await self.ai.chat(*args, on_delta=on_delta, **kwargs)
+        return await asyncio.to_thread(self.ai.chat, *args, **kwargs)
 
     # ── Mode Detection ──────────────────────────────────────────────
 
-    def _detect_mode(self, message: str, session: SessionState, trace) -> str:
+    async def _detect_mode(self, message: str, session: SessionState, trace) -> str:
         """Detect whether to generate, improve, or debug."""
         span = self.obs.start_span(trace, uuid4().hex, "Mode Detection")
         try:
@@ -76,229 +215,563 @@ class CodingAgent:
             if not session.files:
                 return "generate"
 
-            # Use LLM to classify
-            system_prompt = self.prompts["mode_selection"]
-            user_msg = (
-                f"User message: {message}\n\n"
-                f"Project has {len(session.files)} existing file(s): "
-                f"{', '.join(session.files.keys())}"
-            )
+            # Rules / local classifier first; LLM only when they're unsure
+            decision = self.mode_classifier.classify(message)
+            self._log_mode_decision(span, decision)
+            if decision.mode is not None:
+                return decision.mode
 
-            response, _ = self.ai.chat(
+            system_prompt, user_msg = self._mode_prompt(message, session)
+            response, _ = await self._llm(
                 system_prompt,
                 user_msg,
                 parent=span,
                 generation_name="mode_selection",
             )
-
-            mode = response.strip().lower()
-            if mode not in ("generate", "improve", "debug"):
-                mode = "improve"  # safe default
-            return mode
+            # learn() appends to the examples file
+            return await asyncio.to_thread(self._parse_mode, response, message)
         finally:
             self.obs.end_span(span)
 
+    def _mode_prompt(self, message: str, session: SessionState) -> tuple[str, str]:
+        # Stable project description first, volatile user message last
+        user_msg = (
+            f"Project has {len(session.files)} existing file(s): "
+            f"{', '.join(session.files.keys())}\n\n"
+            f"User message: {message}"
+        )
+        return self.system_prompts["mode_selection"], user_msg
+
+    def _parse_mode(self, response: str, message: str) -> str:
+        mode = response.strip().lower()
+        if mode not in ("generate", "improve", "debug"):
+            return "improve"  # safe default
+        # Clean LLM labels become training data for the local classifier
+        self.mode_classifier.learn(message, mode)
+        return mode
+
+    def _log_mode_decision(self, span, decision: ModeDecision):
+        self.obs.log_event(
+            span,
+            uuid4().hex,
+            "mode_decision",
+            metadata={
+                "mode": decision.mode or "llm",
+                "tier": decision.tier,
+                "confidence": round(decision.confidence, 3),
+            },
+        )
+
     # ── Generate ─────────────────────────────────────────────────────
 
-    def _generate(self, message: str, session: SessionState, trace) -> FilesDict:
-        """Generate code from scratch."""
+    async def _generate(
+        self, message: str, session: SessionState, trace, on_event=None
+    ) -> FilesDict:
+        """Generate code from scratch (run.sh is added by _gen_entrypoint)."""
         span = self.obs.start_span(trace, uuid4().hex, "Code Generation")
         try:
-            # Build system prompt: roadmap + generate (with file_format inlined) + philosophy
-            file_format = self.prompts["file_format"]
-            generate_prompt = self.prompts["generate"].replace("FILE_FORMAT", file_format)
-            system_prompt = (
-                f"{self.prompts['roadmap']}\n\n{generate_prompt}\n\n{self.prompts['philosophy']}"
-            )
-
-            response, _ = self.ai.chat(
-                system_prompt,
+            response, _ = await self._llm(
+                self.system_prompts["generate"],
                 message,
                 session.history,
                 parent=span,
+                compaction=session.compaction,
                 generation_name="gen_code",
+                on_delta=self._response_stream(on_event, "file"),
             )
-            files = parse_chat_to_files(response)
+            return parse_chat_to_files(response)
         finally:
             self.obs.end_span(span)
 
-        # Generate entrypoint (run.sh)
-        ent_span = self.obs.start_span(trace, uuid4().hex, "Entrypoint Generation")
+    async def _gen_entrypoint(
+        self, files: FilesDict, trace, on_event=None
+    ) -> FilesDict:
+        """Generate the entrypoint (run.sh). Returns a new FilesDict including it."""
+        span = self.obs.start_span(trace, uuid4().hex, "Entrypoint Generation")
         try:
-            ent_system = self.prompts["entrypoint"]
-            ent_user = (
-                f"Information about the codebase:\n\n{files.to_context()}\n\n"
-                "Write a run.sh that runs this code."
-            )
-            ent_response, _ = self.ai.chat(
-                ent_system,
-                ent_user,
-                parent=ent_span,
+            ent_response, _ = await self._llm(
+                self.system_prompts["entrypoint"],
+                self._entrypoint_user_message(files),
+                parent=span,
                 generation_name="gen_entrypoint",
             )
-
-            # Parse the entrypoint response for a run.sh code block
-            entrypoint_files = parse_chat_to_files(ent_response)
-            if "run.sh" in entrypoint_files:
-                files["run.sh"] = entrypoint_files["run.sh"]
-            elif entrypoint_files:
-                # Use whatever file was returned
-                for name, content in entrypoint_files.items():
-                    files[name] = content
+            merged = self._merge_entrypoint(files, ent_response)
+            _emit_changed_files(on_event, files, merged)
+            return merged
         finally:
-            self.obs.end_span(ent_span)
-        return files
+            self.obs.end_span(span)
+
+    def _entrypoint_user_message(self, files: FilesDict) -> str:
+        return (
+            f"Information about the codebase:\n\n{files.to_context()}\n\n"
+            "Write a run.sh that runs this code."
+        )
+
+    def _response_stream(self, on_event, kind: str) -> Callable[[str], None] | None:
+        """on_delta callback that emits parsed items as soon as they complete.
+
+        kind is "file" (emit each file when its code block closes) or "hunk"
+        (emit each diff hunk as it completes).
+        """
+        if on_event is None:
+            return None
+        parser = ChatStreamParser()
+
+        def on_delta(delta: str):
+            for event in parser.feed(delta):
+                if event["type"] != kind:
+                    continue
+                if kind == "file":
+                    on_event({
+                        "type": "file",
+                        "name": event["path"],
+                        "content": event["content"],
+                    })
+                else:
+                    on_event(event)
+
+        return on_delta
+
+    def _merge_entrypoint(self, files: FilesDict, ent_response: str) -> FilesDict:
+        # Copy rather than mutate: the summary step reads `files` concurrently
+        merged = files.copy()
+
+        # Parse the entrypoint response for a run.sh code block
+        entrypoint_files = parse_chat_to_files(ent_response)
+        if "run.sh" in entrypoint_files:
+            merged["run.sh"] = entrypoint_files["run.sh"]
+        elif entrypoint_files:
+            # Use whatever file was returned
+            for name, content in entrypoint_files.items():
+                merged[name] = content
+        return merged
 
     # ── Improve ──────────────────────────────────────────────────────
 
-    def _improve(self, message: str, session: SessionState, trace) -> FilesDict:
+    async def _improve(
+        self, message: str, session: SessionState, trace, on_event=None
+    ) -> FilesDict:
         """Improve existing code via diffs."""
         span = self.obs.start_span(trace, uuid4().hex, "Code Improvement")
         try:
-            # Build system prompt: roadmap + improve (with file_format_diff inlined) + philosophy
-            file_format_diff = self.prompts["file_format_diff"]
-            improve_prompt = self.prompts["improve"].replace(
-                "FILE_FORMAT", file_format_diff
-            )
-            system_prompt = (
-                f"{self.prompts['roadmap']}\n\n{improve_prompt}\n\n{self.prompts['philosophy']}"
-            )
-
-            files_context = session.files.to_context()
-            user_msg = f"{message}\n\nExisting code:\n{files_context}"
-            response, _ = self.ai.chat(
-                system_prompt,
-                user_msg,
+            user_message, partial = self._improve_user_message(message, session, span)
+            response, _ = await self._llm(
+                self.system_prompts["improve"],
+                user_message,
                 session.history,
                 parent=span,
+                compaction=session.compaction,
                 generation_name="improve_code",
+                on_delta=self._response_stream(on_event, "hunk"),
             )
-
-            # Parse and apply diffs
-            diffs = parse_diffs(response)
-            if diffs:
-                return apply_diffs(diffs, session.files)
-
-            # Fallback: try parsing as full files
-            parsed = parse_chat_to_files(response)
-            updated = FilesDict(session.files.copy())
-            updated.update(parsed)
+            updated = self._apply_improvement(response, session, partial, span)
+            _emit_changed_files(on_event, session.files, updated)
             return updated
         finally:
             self.obs.end_span(span)
 
+    def _improve_user_message(
+        self, message: str, session: SessionState, span
+    ) -> tuple[str, set[str]]:
+        """The improve_code request, and the files not sent in full."""
+        # Code context first so the request doesn't break the cached prefix
+        files_context = session.files.to_context()
+        partial = set()
+        count = self.ai.counter.count
+        if count(files_context) > self.IMPROVE_CONTEXT_BUDGET:
+            selection = session.index.select(
+                message, session.files, self.IMPROVE_CONTEXT_BUDGET, count
+            )
+            files_context = selection.context
+            partial = set(selection.excerpts) | set(selection.omitted)
+            self.obs.log_event(
+                span,
+                uuid4().hex,
+                "Context Selection",
+                metadata={
+                    "files": selection.files,
+                    "excerpts": selection.excerpts,
+                    "omitted": selection.omitted,
+                },
+            )
+        return f"Existing code:\n{files_context}\n\nRequest: {message}", partial
+
+    def _apply_improvement(
+        self, response: str, session: SessionState, partial: set[str], span
+    ) -> FilesDict:
+        # Parse and apply diffs
+        diffs = parse_diffs(response)
+        if diffs:
+            rejected = []
+            updated = apply_diffs(diffs, session.files, rejected)
+            if rejected:
+                self.obs.log_event(
+                    span,
+                    uuid4().hex,
+                    "Unapplied Hunks",
+                    metadata={"hunks": rejected},
+                )
+            return updated
+
+        # Fallback: try parsing as full files. A file the model only saw
+        # excerpts of (or not at all) would be replaced by a partial rewrite,
+        # so only new files and files sent in full are accepted.
+        parsed = parse_chat_to_files(response)
+        rejected = sorted(name for name in parsed if name in partial)
+        if rejected:
+            self.obs.log_event(
+                span,
+                uuid4().hex,
+                "Rejected Full Files",
+                metadata={"files": rejected},
+            )
+        updated = session.files.copy()
+        updated.update({
+            name: content for name, content in parsed.items() if name not in partial
+        })
+        return updated
+
     # ── Debug ────────────────────────────────────────────────────────
 
-    def _debug(self, message: str, session: SessionState, trace) -> FilesDict:
+    async def _debug(
+        self, message: str, session: SessionState, trace, on_event=None
+    ) -> FilesDict:
         """Execute code, detect errors, and auto-fix in a loop."""
         span = self.obs.start_span(trace, uuid4().hex, "Debug Loop")
-        files = FilesDict(session.files.copy())
-        env = ExecutionEnvironment()
+        files = session.files.copy()
+        env = await self._acquire(session.session_id)
+
+        fixes = FixTracker(self.fix_cache, scope=session.session_id)
 
         try:
+            result = None
             for attempt in range(self.MAX_DEBUG_ATTEMPTS):
-                # Write files and execute
-                env.write_files(files)
-                exec_span = self.obs.start_span(
-                    span, uuid4().hex, f"Execution Attempt {attempt + 1}"
-                )
-                try:
-                    result = env.execute()
-                    self.obs.log_event(
-                        exec_span,
-                        uuid4().hex,
-                        "execution_result",
-                        metadata={
-                            "success": result.success,
-                            "return_code": result.return_code,
-                            "stderr": result.stderr[:500],
-                            "stdout": result.stdout[:500],
-                        },
+                if result is None:
+                    # May build a dependency venv; keep it off the event loop
+                    await asyncio.to_thread(env.write_files, files)
+                    exec_span = self.obs.start_span(
+                        span, uuid4().hex, f"Execution Attempt {attempt + 1}"
                     )
-                finally:
-                    self.obs.end_span(exec_span)
-
+                    try:
+                        # Runs in a worker thread; output lines arrive on the loop
+                        result = await env.aexecute(
+                            on_line=self._output_stream(exec_span, attempt, on_event)
+                        )
+                        self._log_execution(exec_span, result)
+                    finally:
+                        self.obs.end_span(exec_span)
+                    if on_event:
+                        on_event(self._execution_event(attempt + 1, result))
+
+                # The fix cache diffs files and may query its database
                 if result.success:
+                    await asyncio.to_thread(fixes.succeeded, files)
                     break
 
-                # Fix: use improve logic with error context
+                patched = await asyncio.to_thread(fixes.lookup, result, files)
+                if patched is not None:
+                    self._log_cached_fix(span, attempt)
+                    _emit_changed_files(on_event, files, patched)
+                    files, result = patched, None
+                    continue
+
+                if self.speculative_fixes > 1:
+                    previous = files
+                    files, result = await self._speculative_fix(
+                        message, files, result, session, span, attempt, on_event
+                    )
+                    _emit_changed_files(on_event, previous, files)
+                    continue
+
                 fix_span = self.obs.start_span(
                     span, uuid4().hex, f"Code Fix {attempt + 1}"
                 )
                 try:
-                    file_format_fix = self.prompts["file_format_fix"]
-                    system_prompt = (
-                        f"{self.prompts['roadmap']}\n\n{file_format_fix}\n\n"
-                        f"{self.prompts['philosophy']}"
-                    )
-                    fix_user = (
-                        f"Original request: {message}\n\n"
-                        f"Current code:\n{files.to_context()}\n\n"
-                        f"Error output:\nstdout: {result.stdout}\nstderr: {result.stderr}\n\n"
-                        f"Please fix the errors in the code."
-                    )
-
-                    fix_response, _ = self.ai.chat(
-                        system_prompt,
-                        fix_user,
+                    fix_response, _ = await self._llm(
+                        self.system_prompts["fix"],
+                        self._fix_user_message(message, files, result),
                         parent=fix_span,
                         generation_name="fix_code",
                     )
-
-                    # Parse fixed files (full file format, not diffs)
                     fixed = parse_chat_to_files(fix_response)
                     if fixed:
+                        previous = files.copy()
                         files.update(fixed)
+                        _emit_changed_files(on_event, previous, files)
                 finally:
                     self.obs.end_span(fix_span)
+                result = None
         finally:
-            env.cleanup()
+            self._release_in_thread(env)
+            self._log_fix_cache(trace, fixes)
             self.obs.end_span(span)
         return files
 
+    # Speculative fixes: N fix_code calls at spread temperatures, each run in
+    # its own sandbox; the first candidate that runs cleanly wins, otherwise
+    # the one with the fewest error lines.
+
+    async def _speculative_fix(
+        self,
+        message: str,
+        files: FilesDict,
+        result: ExecutionResult,
+        session: SessionState,
+        span,
+        attempt: int,
+        on_event=None,
+    ) -> tuple[FilesDict, ExecutionResult]:
+        prompt = self._fix_user_message(message, files, result)
+
+        async def candidate(index: int):
+            cand_span = self.obs.start_span(
+                span, uuid4().hex, f"Code Fix {attempt + 1}.{index + 1}"
+            )
+            env = None
+            try:
+                fix_response, _ = await self._llm(
+                    self.system_prompts["fix"],
+                    prompt,
+                    parent=cand_span,
+                    generation_name="fix_code",
+                    temperature=self._fix_temperature(index),
+                )
+                fixed = self._candidate_files(files, fix_response)
+                if fixed is None:
+                    return None
+                env = await self._acquire(f"{session.session_id}:fix{index}")
+                # May build a dependency venv; keep it off the event loop
+                write = asyncio.ensure_future(asyncio.to_thread(env.write_files, fixed))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # Hand the sandbox back once the worker thread is done
+                    write.add_done_callback(
+                        lambda _, env=env: self._release_in_thread(env)
+                    )
+                    env = None
+                    raise
+                run = asyncio.ensure_future(
+                    env.aexecute(on_line=self._output_stream(cand_span, attempt))
+                )
+                try:
+                    outcome = await asyncio.shield(run)
+                except asyncio.CancelledError:
+                    # The worker thread can't be cancelled: kill the process
+                    # and only hand the sandbox back once it has exited
+                    env.cancel()
+                    run.add_done_callback(
+                        lambda _, env=env: self._release_in_thread(env)
+                    )
+                    env = None
+                    raise
+                self._log_execution(cand_span, outcome)
+                if on_event:
+                    on_event(self._execution_event(attempt + 2, outcome, index + 1))
+                return fixed, outcome
+            finally:
+                if env is not None:
+                    self._release_in_thread(env)
+                self.obs.end_span(cand_span)
+
+        tasks = [
+            asyncio.create_task(candidate(i)) for i in range(self.speculative_fixes)
+        ]
+        finished, errors = [], []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    outcome = await next_done
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                if outcome is not None:
+                    finished.append(outcome)
+                    if outcome[1].success:
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._pick_fix(finished, errors, files, result)
+
+    async def _acquire(self, key: str) -> ExecutionEnvironment:
+        """SandboxPool.acquire in a worker thread (recycling empties a workdir)."""
+        acquire = asyncio.ensure_future(asyncio.to_thread(self.sandboxes.acquire, key))
+        try:
+            return await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The thread still hands out a sandbox; put it back
+            def release(done: asyncio.Future):
+                if not done.cancelled() and done.exception() is None:
+                    self._release_in_thread(done.result())
+
+            acquire.add_done_callback(release)
+            raise
+
+    def _release_in_thread(self, env: ExecutionEnvironment):
+        """SandboxPool.release in a worker thread (eviction deletes workdirs).
+
+        Fire and forget, so it also works from finally blocks of cancelled
+        tasks and from done callbacks; the executor keeps the job alive.
+        """
+        asyncio.get_running_loop().run_in_executor(None, self.sandboxes.release, env)
+
+    def _log_cached_fix(self, span, attempt: int):
+        self.obs.log_event(
+            span,
+            uuid4().hex,
+            "fix_cache_hit",
+            metadata={"attempt": attempt + 1},
+        )
+
+    def _log_fix_cache(self, trace, fixes: FixTracker):
+        if fixes.hits or fixes.misses:
+            self.obs.log_metric(trace, "fix_cache_hits", fixes.hits)
+            self.obs.log_metric(trace, "fix_cache_misses", fixes.misses)
+
+    def _fix_temperature(self, index: int) -> float:
+        # Candidate 0 keeps the default; the rest explore progressively more
+        return min(1.0, self.ai.temperature + self.SPECULATIVE_TEMPERATURE_STEP * index)
+
+    def _candidate_files(self, files: FilesDict, fix_response: str) -> FilesDict | None:
+        fixed = parse_chat_to_files(fix_response)
+        if not fixed:
+            return None
+        candidate = files.copy()
+        candidate.update(fixed)
+        return candidate
+
+    def _pick_fix(
+        self,
+        finished: list[tuple[FilesDict, ExecutionResult]],
+        errors: list[Exception],
+        files: FilesDict,
+        result: ExecutionResult,
+    ) -> tuple[FilesDict, ExecutionResult]:
+        """First successful candidate, else the one with the fewest errors."""
+        if not finished:
+            if errors:
+                raise errors[0]
+            # No candidate produced files; retry from the same state
+            return files, result
+        for candidate in finished:
+            if candidate[1].success:
+                return candidate
+        return min(finished, key=lambda c: _error_count(c[1]))
+
+    def _execution_event(
+        self, attempt: int, result: ExecutionResult, candidate: int = None
+    ) -> dict:
+        event = {
+            "type": "execution",
+            "attempt": attempt,
+            "success": result.success,
+            "return_code": result.return_code,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "wall_time": result.wall_time,
+            "timed_out": result.timed_out,
+        }
+        if candidate is not None:
+            event["candidate"] = candidate
+        return event
+
+    def _output_stream(self, exec_span, attempt: int, on_event=None):
+        """Line callback that forwards run output to the trace and on_event.
+
+        Only the first MAX_STREAMED_OUTPUT_LINES lines are forwarded; the full
+        (head/tail capped) output is still in the execution result.
+        """
+        forwarded = 0
+
+        def on_line(stream: str, line: str):
+            nonlocal forwarded
+            if forwarded >= self.MAX_STREAMED_OUTPUT_LINES:
+                return
+            forwarded += 1
+            self.obs.log_event(
+                exec_span,
+                uuid4().hex,
+                "execution_output",
+                metadata={"stream": stream, "line": line[:500]},
+            )
+            if on_event:
+                on_event({
+                    "type": "output",
+                    "attempt": attempt + 1,
+                    "stream": stream,
+                    "line": line,
+                })
+
+        return on_line
+
+    def _log_execution(self, exec_span, result: ExecutionResult):
+        self.obs.log_event(
+            exec_span,
+            uuid4().hex,
+            "execution_result",
+            metadata={
+                "success": result.success,
+                "return_code": result.return_code,
+                "stderr": result.stderr[:500],
+                "stdout": result.stdout[:500],
+                "wall_time_s": round(result.wall_time, 3),
+                "cpu_time_s": round(result.cpu_time, 3),
+                "peak_rss_kb": result.peak_rss_kb,
+                "output_truncated": result.truncated,
+                "timed_out": result.timed_out,
+            },
+        )
+
+    def _fix_user_message(
+        self, message: str, files: FilesDict, result: ExecutionResult
+    ) -> str:
+        return (
+            f"Current code:\n{files.to_context()}\n\n"
+            f"Original request: {message}\n\n"
+            f"Error output:\nstdout: {result.stdout}\nstderr: {result.stderr}\n\n"
+            f"Please fix the errors in the code."
+        )
+
     # ── Summary ──────────────────────────────────────────────────────
 
-    def _generate_summary(
-        self, message: str, files: FilesDict, mode: str, trace
+    async def _generate_summary(
+        self, message: str, files: FilesDict, mode: str, trace, on_event=None
     ) -> str:
         """Generate a short summary of what was done."""
         span = self.obs.start_span(trace, uuid4().hex, "Summary Generation")
         try:
-            system_prompt = (
-                "You are a coding assistant. Summarize what was done in 2-3 sentences. "
-                "Be specific about files created or modified."
-            )
-            user_msg = (
-                f"Mode: {mode}\n"
-                f"User request: {message}\n"
-                f"Files: {', '.join(files.keys())}"
-            )
-
-            response, _ = self.ai.chat(
+            system_prompt, user_msg = self._summary_prompt(message, files, mode)
+            response, _ = await self._llm(
                 system_prompt,
                 user_msg,
                 parent=span,
                 generation_name="generate_summary",
             )
+            if on_event:
+                on_event({"type": "summary", "summary": response})
             return response
         finally:
             self.obs.end_span(span)
 
-    # ── Prompt Loading ───────────────────────────────────────────────
-
-    def _load_prompts(self) -> dict[str, str]:
-        """Load all .md prompt files from the prompts/ directory.
-
-        Keys are the stem (e.g. "generate"), values are the file contents.
-        """
-        prompts_dir = os.path.join(os.path.dirname(__file__), "prompts")
-        prompts = {}
-        for filename in os.listdir(prompts_dir):
-            if not filename.endswith(".md"):
-                continue
-            filepath = os.path.join(prompts_dir, filename)
-            if os.path.isfile(filepath):
-                with open(filepath) as f:
-                    # Strip the .md extension for the key
-                    prompts[filename.removesuffix(".md")] = f.read()
-        return prompts
+    def _summary_prompt(
+        self, message: str, files: FilesDict, mode: str
+    ) -> tuple[str, str]:
+        filenames = list(files.keys())
+        if mode == "generate" and "run.sh" not in files:
+            # Summary runs in parallel with entrypoint generation
+            filenames.append("run.sh")
+        user_msg = (
+            f"Mode: {mode}\n"
+            f"User request: {message}\n"
+            f"Files: {', '.join(filenames)}"
+        )
+        return self.system_prompts["summary"], user_msg
+
+    # ── Prompts ──────────────────────────────────────────────────────
+
+    @property
+    def system_prompts(self) -> Mapping[str, str]:
+        """Composed prompts of the current turn (the latest outside a turn)."""
+        prompts = _turn_prompts.get() or self.prompt_registry.current()
+        return prompts.system
@@ -2,10 +2,12 @@
 OpenAI SDK wrapper with context compaction support.
 """
 
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Callable
 from uuid import uuid4
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from coding_agent.compaction import CompactionState, TokenCounter
 
 if TYPE_CHECKING:
     from coding_agent.observability import CodingAgentObservability
@@ -14,20 +16,25 @@ if TYPE_CHECKING:
 class AI:
     """Thin wrapper around OpenAI chat completions."""
 
-    # Rough token limit before compaction kicks in
+    # Token limit before compaction kicks in
     COMPACTION_THRESHOLD = 80_000
-    CHARS_PER_TOKEN = 4
+    # Most recent history messages never folded into the summary
+    KEEP_RECENT = 4
+
+    client_class = OpenAI
 
     def __init__(
         self,
         model: str = "gpt-4.1",
         temperature: float = 0.1,
         obs: "CodingAgentObservability" = None,
+        client=None,
     ):
-        self.client = OpenAI()
+        self.client = client or self.client_class()
         self.model = model
         self.temperature = temperature
         self.obs = obs
+        self.counter = TokenCounter(model)
 
     def chat(
         self,
@@ -36,28 +43,78 @@ class AI:
         history: list[dict] = None,
         parent: Any = None,
         generation_name: str = None,
+        compaction: CompactionState = None,
+        temperature: float = None,
     ) -> tuple[str, dict]:
         """Single LLM call. Returns (response_text, usage_dict).
 
-        usage_dict contains prompt_tokens, completion_tokens, total_tokens.
+        usage_dict contains prompt_tokens, completion_tokens, total_tokens and
+        cached_tokens (prompt tokens served from the provider's prompt cache).
+        Pass the session's CompactionState alongside its history so long
+        sessions are compacted incrementally. temperature overrides the
+        instance default for this call.
         """
+        if temperature is None:
+            temperature = self.temperature
+        history = history or []
+        compaction = compaction or CompactionState()
+        self._maybe_compact(system_prompt, user_message, history, compaction)
+        messages = self._build_messages(
+            system_prompt, user_message, history, compaction
+        )
+
+        response_text, raw_usage = self._complete(
+            self._request(messages, temperature)
+        )
+        return self._finish(
+            response_text, raw_usage, messages, parent, generation_name, temperature
+        )
+
+    def _request(self, messages: list[dict], temperature: float) -> dict:
+        return {"model": self.model, "messages": messages, "temperature": temperature}
+
+    def _complete(self, request: dict) -> tuple[str, Any]:
+        """Send one completion request. Returns (response_text, raw_usage).
+
+        This is the only method that talks to the API (chat and compaction
+        both go through it), so record/replay and test doubles override it.
+        """
+        response = self.client.chat.completions.create(**request)
+        return response.choices[0].message.content, response.usage
+
+    def _build_messages(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: list[dict],
+        compaction: CompactionState,
+    ) -> list[dict]:
         messages = [{"role": "system", "content": system_prompt}]
-        if history:
-            messages.extend(history)
+        if compaction.summary:
+            messages.append({
+                "role": "assistant",
+                "content": f"[Conversation summary]: {compaction.summary}",
+            })
+        messages.extend(history[compaction.folded:])
         messages.append({"role": "user", "content": user_message})
-        messages = self._maybe_compact(messages)
+        return messages
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-        )
+    def _finish(
+        self,
+        response_text: str,
+        raw_usage,
+        messages: list[dict],
+        parent: Any,
+        generation_name: str,
+        temperature: float,
+    ) -> tuple[str, dict]:
+        """Build the usage dict and log the call as a generation."""
         usage = {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens,
+            "prompt_tokens": getattr(raw_usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(raw_usage, "completion_tokens", 0),
+            "total_tokens": getattr(raw_usage, "total_tokens", 0),
+            "cached_tokens": self._cached_tokens(raw_usage),
         }
-        response_text = response.choices[0].message.content
 
         if self.obs and parent is not None and generation_name:
             self.obs.log_generation(
@@ -68,53 +125,176 @@ class AI:
                 messages=messages,
                 response_text=response_text,
                 usage=usage,
-                model_parameters={"temperature": self.temperature},
+                model_parameters={"temperature": temperature},
             )
 
         return response_text, usage
 
-    def _maybe_compact(self, messages: list[dict]) -> list[dict]:
-        """Compact messages if context exceeds the threshold.
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        """Prompt tokens served from the provider's prompt cache (0 if unreported)."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        return getattr(details, "cached_tokens", None) or 0
 
-        Uses a simple summarization approach: keeps system + last few messages
-        and summarizes the middle via an LLM call.
+    def _maybe_compact(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: list[dict],
+        compaction: CompactionState,
+    ) -> None:
+        """Fold aged-out history into the rolling summary if over the threshold.
+
+        Only messages that aged out since the last compaction are summarized,
+        together with the existing summary, so the cost is proportional to
+        the new turns rather than the whole history.
         """
-        total_chars = sum(len(m.get("content", "")) for m in messages)
-        estimated_tokens = total_chars // self.CHARS_PER_TOKEN
+        end = self._compaction_end(system_prompt, user_message, history, compaction)
+        if end is None:
+            return
+
+        aged_out = history[compaction.folded:end]
+        try:
+            summary, _ = self._complete(
+                self._summary_request(compaction.summary, aged_out)
+            )
+            summary = summary or ""
+        except Exception:
+            # Drop the aged-out turns but keep the previous summary
+            summary = compaction.summary
+        compaction.fold(history, end, summary, self.counter)
+
+    def _compaction_end(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: list[dict],
+        compaction: CompactionState,
+    ) -> int | None:
+        """Return the history index to fold up to, or None if within budget."""
+        total_tokens = (
+            self.counter.count(system_prompt)
+            + self.counter.count(compaction.summary)
+            + compaction.history_tokens(history, self.counter)
+            + self.counter.count(user_message)
+        )
+        if total_tokens <= self.COMPACTION_THRESHOLD:
+            return None
+
+        end = len(history) - self.KEEP_RECENT
+        if end <= compaction.folded:
+            return None
+        return end
+
+    def _summary_request(self, summary: str, new_messages: list[dict]) -> dict:
+        """Build the completion kwargs that fold new messages into the summary."""
+        new_text = "\n".join(
+            f"{m['role']}: {m.get('content', '')}" for m in new_messages
+        )
+        if summary:
+            system = (
+                "Update the running conversation summary with the new turns. "
+                "Keep it concise, preserving key decisions and code context:"
+            )
+            user = f"Current summary:\n{summary}\n\nNew turns:\n{new_text}"
+        else:
+            system = "Summarize the following conversation concisely, preserving key decisions and code context:"
+            user = new_text
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": 0.0,
+            "max_tokens": 2000,
+        }
+
+
+class AsyncAI(AI):
+    """Async variant of AI built on AsyncOpenAI.
 
-        if estimated_tokens <= self.COMPACTION_THRESHOLD:
-            return messages
+    Same interface as AI, but chat() is a coroutine so many sessions can share
+    one event loop instead of each holding a worker thread.
+    """
 
-        # Keep system message and last 4 messages, summarize the rest
-        system = messages[0]
-        middle = messages[1:-4]
-        recent = messages[-4:]
+    client_class = AsyncOpenAI
 
-        if not middle:
-            return messages
+    async def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: list[dict] = None,
+        parent: Any = None,
+        generation_name: str = None,
+        compaction: CompactionState = None,
+        on_delta: Callable[[str], None] = None,
+        temperature: float = None,
+    ) -> tuple[str, dict]:
+        """Single async LLM call. Returns (response_text, usage_dict).
 
-        middle_text = "\n".join(
-            f"{m['role']}: {m.get('content', '')}" for m in middle
+        If on_delta is given the completion is streamed and on_delta is called
+        with each text chunk as it arrives; the full text is still returned.
+        """
+        if temperature is None:
+            temperature = self.temperature
+        history = history or []
+        compaction = compaction or CompactionState()
+        await self._maybe_compact(system_prompt, user_message, history, compaction)
+        messages = self._build_messages(
+            system_prompt, user_message, history, compaction
+        )
+
+        response_text, raw_usage = await self._complete(
+            self._request(messages, temperature), on_delta
+        )
+        return self._finish(
+            response_text, raw_usage, messages, parent, generation_name, temperature
+        )
+
+    async def _complete(
+        self, request: dict, on_delta: Callable[[str], None] = None
+    ) -> tuple[str, Any]:
+        """Send one completion request, streamed if on_delta is given."""
+        if on_delta is None:
+            response = await self.client.chat.completions.create(**request)
+            return response.choices[0].message.content, response.usage
+
+        stream = await self.client.chat.completions.create(
+            **request,
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        chunks = []
+        raw_usage = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                raw_usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                on_delta(delta)
+        return "".join(chunks), raw_usage
+
+    async def _maybe_compact(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: list[dict],
+        compaction: CompactionState,
+    ) -> None:
+        end = self._compaction_end(system_prompt, user_message, history, compaction)
+        if end is None:
+            return
+
+        aged_out = history[compaction.folded:end]
         try:
-            summary_response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Summarize the following conversation concisely, preserving key decisions and code context:",
-                    },
-                    {"role": "user", "content": middle_text},
-                ],
-                temperature=0.0,
-                max_tokens=2000,
+            summary, _ = await self._complete(
+                self._summary_request(compaction.summary, aged_out)
             )
-            summary = summary_response.choices[0].message.content or ""
+            summary = summary or ""
         except Exception:
-            return [system, *recent]
-
-        return [
-            system,
-            {"role": "assistant", "content": f"[Conversation summary]: {summary}"},
-            *recent,
-        ]
+            summary = compaction.summary
+        compaction.fold(history, end, summary, self.counter)
@@ -0,0 +1,104 @@
+"""
+Token counting and incremental history compaction.
+
+A session keeps a CompactionState: a rolling summary of the turns that have
+aged out of the context window plus a running token count of the turns that
+have not. When a call would exceed the threshold, only the newly aged-out
+turns are folded into the existing summary instead of re-summarizing the
+whole history every time.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import tiktoken
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer, caching counts per content.
+
+    The tokenizer is loaded on first use. If it can't be loaded (tiktoken
+    downloads encodings on first use, which fails offline), counts fall back
+    to a chars-per-token estimate.
+    """
+
+    # Per-message framing tokens added by the chat format
+    MESSAGE_OVERHEAD = 4
+    MAX_CACHE_ENTRIES = 4096
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._encoding_loaded = False
+        self._cache: OrderedDict[int, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._encoding_loaded:
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                self._encoding = None
+            self._encoding_loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        """Token count of a string (cached by content hash)."""
+        if not text:
+            return 0
+        key = hash(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        if self.encoding is not None:
+            n = len(self.encoding.encode(text, disallowed_special=()))
+        else:
+            n = len(text) // self.CHARS_PER_TOKEN
+        with self._lock:
+            self._cache[key] = n
+            if len(self._cache) > self.MAX_CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+        return n
+
+    def count_message(self, message: dict) -> int:
+        return self.count(message.get("content", "")) + self.MESSAGE_OVERHEAD
+
+
+@dataclass
+class CompactionState:
+    """Rolling summary and running token count for one session's history.
+
+    history[:folded] is represented by `summary`; `tokens` is the token count
+    of history[folded:counted]. Both only ever move forward as history grows.
+    """
+
+    summary: str = ""
+    folded: int = 0
+    counted: int = 0
+    tokens: int = 0
+
+    def history_tokens(self, history: list[dict], counter: TokenCounter) -> int:
+        """Token count of the unfolded history, counting only new messages."""
+        if len(history) < self.counted:
+            # History was replaced underneath us; start over
+            self.summary, self.folded, self.counted, self.tokens = "", 0, 0, 0
+        for message in history[self.counted:]:
+            self.tokens += counter.count_message(message)
+        self.counted = len(history)
+        return self.tokens
+
+    def fold(
+        self, history: list[dict], end: int, summary: str, counter: TokenCounter
+    ) -> None:
+        """Mark history[folded:end] as folded into `summary`."""
+        for message in history[self.folded:end]:
+            self.tokens -= counter.count_message(message)
+        self.folded = end
+        self.summary = summary
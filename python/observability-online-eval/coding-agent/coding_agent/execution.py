@@ -2,15 +2,36 @@
 Subprocess execution environment for running generated code.
 
 Adapted from gpt-engineer's DiskExecutionEnv, simplified for cookbook clarity.
+
+A SandboxPool keeps workdirs alive between debug attempts and turns: each
+workdir tracks a content-hash manifest so only changed files are rewritten,
+and Python dependencies are installed into venvs cached by requirements, so
+`pip install -r requirements.txt` in run.sh is a no-op. Cached venvs live in
+a private per-user directory and are read-only once built, so generated code
+can't change the packages other sessions run against.
+
+POSIX only: runs use process groups, wait4() and ulimit.
 """
 
+import asyncio
+import hashlib
 import os
+import resource
+import selectors
 import shlex
 import shutil
+import signal
+import stat
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+import venv
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
 
 from coding_agent.files import FilesDict
 
@@ -21,52 +42,578 @@ class ExecutionResult:
     stdout: str
     stderr: str
     return_code: int
+    wall_time: float = 0.0  # seconds
+    cpu_time: float = 0.0  # user + system seconds, including child processes
+    peak_rss_kb: int = 0
+    truncated: bool = False  # output exceeded the head/tail caps
+    timed_out: bool = False
+
+
+class _BoundedOutput:
+    """Keeps the first `head` and last `tail` bytes of a stream.
+
+    Also splits the stream into lines for live callbacks; a line longer than
+    MAX_LINE bytes is emitted in pieces.
+    """
+
+    MAX_LINE = 8192
+
+    def __init__(self, head: int, tail: int):
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self._partial = bytearray()
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.head_limit + self.tail_limit
+
+    def feed(self, chunk: bytes) -> list[str]:
+        self.total += len(chunk)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk_tail = chunk[room:]
+        else:
+            chunk_tail = chunk
+        if chunk_tail:
+            self.tail += chunk_tail
+            if len(self.tail) > self.tail_limit:
+                del self.tail[: len(self.tail) - self.tail_limit]
+        return self._split(chunk)
+
+    def finish(self) -> list[str]:
+        if not self._partial:
+            return []
+        line = self._partial.decode(errors="replace")
+        self._partial.clear()
+        return [line]
+
+    def _split(self, chunk: bytes) -> list[str]:
+        self._partial += chunk
+        *complete, rest = self._partial.split(b"\n")
+        lines = [line.decode(errors="replace") for line in complete]
+        while len(rest) > self.MAX_LINE:
+            lines.append(rest[: self.MAX_LINE].decode(errors="replace"))
+            rest = rest[self.MAX_LINE:]
+        self._partial = bytearray(rest)
+        return lines
+
+    def text(self) -> str:
+        if not self.truncated:
+            return (self.head + self.tail).decode(errors="replace")
+        omitted = self.total - len(self.head) - len(self.tail)
+        return (
+            self.head.decode(errors="replace")
+            + f"\n... [{omitted} bytes truncated] ...\n"
+            + self.tail.decode(errors="replace")
+        )
+
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _rmtree(path: Path):
+    """rmtree that also removes read-only cached venvs."""
+    for dirpath, _, _ in os.walk(path):
+        os.chmod(dirpath, stat.S_IRWXU)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _make_read_only(path: Path):
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            target = os.path.join(dirpath, name)
+            if not os.path.islink(target):
+                mode = os.lstat(target).st_mode
+                os.chmod(target, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        os.chmod(dirpath, stat.S_IRUSR | stat.S_IXUSR)
+
+
+class VenvCache:
+    """Virtualenvs shared across workdirs, keyed by requirements content.
+
+    Each venv is built with its requirements installed and then made
+    read-only. Venvs beyond MAX_VENVS that haven't been used for
+    EVICT_IDLE_S are removed when a new one is built.
+    """
+
+    REQUIREMENTS_FILE = "requirements.txt"
+    MAX_VENVS = 8
+    # Never evict a venv used this recently (it may be running)
+    EVICT_IDLE_S = 3600
+    PIP_TIMEOUT_S = 600
+
+    def __init__(self, root: str = None):
+        if root is None:
+            # Per-user, so other local users can't pre-create or tamper with it
+            root = os.path.join(
+                tempfile.gettempdir(), f"coding_agent_venvs-{os.getuid()}"
+            )
+        self.root = Path(root)
+        self.root.mkdir(mode=stat.S_IRWXU, parents=True, exist_ok=True)
+        info = os.lstat(self.root)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{self.root} is not a directory owned by this user")
+        os.chmod(self.root, stat.S_IRWXU)
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def key(requirements: str) -> str:
+        """Hash of the requirement lines, ignoring order, comments and blanks."""
+        lines = sorted(
+            line.strip()
+            for line in requirements.splitlines()
+            if line.strip() and not line.strip().startswith("#")
+        )
+        return hashlib.sha256("\n".join(lines).encode()).hexdigest()[:16]
+
+    def get(self, requirements: str) -> Path | None:
+        """Path of the venv for these requirements, building it on first use.
+
+        Returns None when the requirements can't be installed; the caller
+        then needs a venv of its own for run.sh to report the error in.
+        """
+        key = self.key(requirements)
+        path = self.root / key
+        if not path.exists():
+            with self._locks_guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+            with lock:
+                if not path.exists() and not self._build(path, requirements):
+                    return None
+                self._evict(keep=path)
+        self._touch(path)
+        return path
+
+    def _build(self, path: Path, requirements: str) -> bool:
+        # Build next to the final path and rename, so a crash never leaves a
+        # half-built venv under the cache key
+        staging = Path(tempfile.mkdtemp(prefix=f"{path.name}_", dir=self.root))
+        try:
+            create_venv(staging)
+            requirements_path = staging / self.REQUIREMENTS_FILE
+            requirements_path.write_text(requirements)
+            install = subprocess.run(
+                [
+                    str(_venv_python(staging)), "-m", "pip", "install",
+                    "--disable-pip-version-check", "-q", "-r", str(requirements_path),
+                ],
+                # Relative requirements (e.g. "-e .") must not resolve
+                # against the agent's own directory
+                cwd=staging,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.PIP_TIMEOUT_S,
+            )
+            if install.returncode != 0:
+                _rmtree(staging)
+                return False
+            requirements_path.unlink()
+            _make_read_only(staging)
+            staging.rename(path)
+        except subprocess.TimeoutExpired:
+            _rmtree(staging)
+            return False
+        except OSError:
+            # Another process won the race
+            _rmtree(staging)
+            if not path.exists():
+                raise
+        return True
+
+    @staticmethod
+    def _touch(path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self, keep: Path):
+        """Remove the least recently used venvs beyond MAX_VENVS."""
+        venvs = []
+        for entry in os.scandir(self.root):
+            # Staging dirs are "<key>_<random>"; leave them to their builder
+            if entry.is_dir(follow_symlinks=False) and "_" not in entry.name:
+                if entry.path != str(keep):
+                    venvs.append((entry.stat(follow_symlinks=False).st_mtime, entry.path))
+        venvs.sort(reverse=True)
+        cutoff = time.time() - self.EVICT_IDLE_S
+        # `keep` was just built and counts as the most recently used
+        for used, venv_path in venvs[self.MAX_VENVS - 1:]:
+            if used < cutoff:
+                _rmtree(Path(venv_path))
+
+
+def create_venv(path: Path):
+    venv.EnvBuilder(with_pip=True, symlinks=True).create(path)
+
+
+def _venv_python(path: Path) -> Path:
+    return path / "bin" / "python"
 
 
 class ExecutionEnvironment:
     """Manages a temp directory for writing and executing generated code."""
 
-    def __init__(self, workdir: str = None):
+    # Bytes of each output stream kept from the start and the end
+    OUTPUT_HEAD_BYTES = 32 * 1024
+    OUTPUT_TAIL_BYTES = 32 * 1024
+    READ_SIZE = 64 * 1024
+    # How long to wait for pipes to close after killing on timeout
+    KILL_GRACE_S = 1.0
+
+    def __init__(
+        self,
+        workdir: str = None,
+        venv_cache: VenvCache = None,
+        memory_limit_mb: int | None = None,
+        cpu_limit_s: int | None = 60,
+    ):
         self.workdir = workdir or tempfile.mkdtemp(prefix="coding_agent_")
+        # Address-space limit; off by default because Node, the JVM and Go
+        # reserve far more virtual memory than they use
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit_s = cpu_limit_s
+        self.venv_cache = venv_cache
+        self.venv: Path | None = None
+        self.pool_key: str | None = None
+        self._process: subprocess.Popen | None = None
+        # Set by cancel(); kills a command that is still starting up
+        self._cancelled = threading.Event()
+        # filename -> (content hash, mtime_ns, size) as last written
+        self._manifest: dict[str, tuple[str, int, int]] = {}
+
+    def write_files(self, files: FilesDict) -> list[str]:
+        """Write files to disk, creating subdirectories as needed.
 
-    def write_files(self, files: FilesDict):
-        """Write files to disk, creating subdirectories as needed."""
+        Files whose content matches the manifest (and weren't touched on disk
+        since) are skipped, and files no longer in `files` are removed.
+        Returns the names that were written.
+        """
         workdir_path = Path(self.workdir).resolve()
+        written = []
         for filename, content in files.items():
             filepath = (workdir_path / filename).resolve()
             try:
                 filepath.relative_to(workdir_path)
             except ValueError as exc:
                 raise ValueError(f"Invalid path outside workdir: {filename}") from exc
+            digest = hashlib.sha256(content.encode()).hexdigest()
+            if self._unchanged(filepath, filename, digest):
+                continue
             filepath.parent.mkdir(parents=True, exist_ok=True)
             with filepath.open("w") as f:
                 f.write(content)
+            info = filepath.stat()
+            self._manifest[filename] = (digest, info.st_mtime_ns, info.st_size)
+            written.append(filename)
+
+        for filename in [name for name in self._manifest if name not in files]:
+            del self._manifest[filename]
+            (workdir_path / filename).unlink(missing_ok=True)
+
+        if self.venv_cache is not None:
+            requirements = files.get(VenvCache.REQUIREMENTS_FILE)
+            self.venv = self.venv_cache.get(requirements) if requirements else None
+            if requirements and self.venv is None:
+                self.venv = self._private_venv()
+        return written
 
-    def execute(self, command: str = "bash run.sh", timeout: int = 30) -> ExecutionResult:
-        """Run command via subprocess, capture stdout/stderr."""
+    def _private_venv(self) -> Path:
+        """An empty venv in the workdir, used when the cached one can't be built.
+
+        run.sh installs into it and reports the pip error, without touching
+        the interpreter the agent runs in.
+        """
+        path = Path(self.workdir) / ".venv"
+        if not _venv_python(path).exists():
+            create_venv(path)
+        return path
+
+    def _unchanged(self, filepath: Path, filename: str, digest: str) -> bool:
+        entry = self._manifest.get(filename)
+        if entry is None or entry[0] != digest:
+            return False
         try:
-            result = subprocess.run(
-                shlex.split(command),
-                cwd=self.workdir,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-            )
-            return ExecutionResult(
-                success=result.returncode == 0,
-                stdout=result.stdout,
-                stderr=result.stderr,
-                return_code=result.returncode,
-            )
-        except subprocess.TimeoutExpired:
-            return ExecutionResult(
-                success=False,
-                stdout="",
-                stderr=f"Execution timed out after {timeout}s",
-                return_code=-1,
-            )
+            info = filepath.stat()
+        except FileNotFoundError:
+            return False
+        # The previous run may have rewritten its own sources
+        return (info.st_mtime_ns, info.st_size) == entry[1:]
+
+    def _env(self) -> dict | None:
+        if self.venv is None:
+            return None
+        bin_dir = self.venv / "bin"
+        env = dict(os.environ)
+        env["VIRTUAL_ENV"] = str(self.venv)
+        env["PATH"] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+        env["PIP_DISABLE_PIP_VERSION_CHECK"] = "1"
+        env.pop("PYTHONHOME", None)
+        return env
+
+    def execute(
+        self,
+        command: str = "bash run.sh",
+        timeout: int = 30,
+        on_line: Callable[[str, str], None] = None,
+    ) -> ExecutionResult:
+        """Run command via subprocess, capture stdout/stderr.
+
+        Output is read as it is produced: on_line(stream, line) is called for
+        every line ("stdout" or "stderr"), and only the first and last
+        OUTPUT_HEAD_BYTES / OUTPUT_TAIL_BYTES of each stream are kept. The
+        process runs in its own session under the memory/CPU rlimits, and the
+        whole process group is killed on timeout.
+        """
+        started = time.monotonic()
+        process = subprocess.Popen(
+            self._with_limits(shlex.split(command)),
+            cwd=self.workdir,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self._env(),
+            start_new_session=True,
+        )
+        self._process = process
+        if self._cancelled.is_set():
+            _kill_group(process)
+        outputs = {
+            "stdout": _BoundedOutput(self.OUTPUT_HEAD_BYTES, self.OUTPUT_TAIL_BYTES),
+            "stderr": _BoundedOutput(self.OUTPUT_HEAD_BYTES, self.OUTPUT_TAIL_BYTES),
+        }
+        deadline = started + timeout
+        timed_out = self._pump(process, outputs, deadline, on_line)
+        status, usage, killed = self._reap(process, deadline)
+        timed_out = timed_out or killed
+        process.returncode = os.waitstatus_to_exitcode(status)
+        self._process = None
+        wall_time = time.monotonic() - started
+
+        stdout = outputs["stdout"].text()
+        stderr = outputs["stderr"].text()
+        if timed_out:
+            stderr = f"{stderr}\nExecution timed out after {timeout}s".lstrip("\n")
+        return ExecutionResult(
+            success=process.returncode == 0 and not timed_out,
+            stdout=stdout,
+            stderr=stderr,
+            return_code=-1 if timed_out else process.returncode,
+            wall_time=wall_time,
+            cpu_time=usage.ru_utime + usage.ru_stime,
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            peak_rss_kb=usage.ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+            truncated=any(o.truncated for o in outputs.values()),
+            timed_out=timed_out,
+        )
+
+    async def aexecute(
+        self,
+        command: str = "bash run.sh",
+        timeout: int = 30,
+        on_line: Callable[[str, str], None] = None,
+    ) -> ExecutionResult:
+        """execute() in a worker thread; on_line is called on the event loop."""
+        if on_line is None:
+            return await asyncio.to_thread(self.execute, command, timeout)
+        loop = asyncio.get_running_loop()
+
+        def forward(stream: str, line: str):
+            loop.call_soon_threadsafe(on_line, stream, line)
+
+        return await asyncio.to_thread(self.execute, command, timeout, forward)
+
+    def cancel(self):
+        """Kill the running command's process group (thread-safe).
+
+        A command that hasn't started yet is killed as soon as it does;
+        the sandbox stays cancelled until the pool hands it out again.
+        """
+        # Flag first: execute() stores the process before checking it
+        self._cancelled.set()
+        process = self._process
+        if process is not None:
+            _kill_group(process)
+
+    def _with_limits(self, argv: list[str]) -> list[str]:
+        """Wrap argv in a shell that sets the rlimits and execs it.
+
+        preexec_fn isn't safe while other threads run, and execute() is
+        called from worker threads.
+        """
+        limits = []
+        if self.cpu_limit_s:
+            # SIGXCPU at the soft limit, SIGKILL a second later (the soft
+            # limit goes first: a hard limit below it is rejected)
+            limits.append(f"ulimit -S -t {self.cpu_limit_s}")
+            limits.append(f"ulimit -H -t {self.cpu_limit_s + 1}")
+        if self.memory_limit_mb:
+            limits.append(f"ulimit -v {self.memory_limit_mb * 1024}")
+        if not limits:
+            return argv
+        script = " && ".join(limits + ['exec "$@"'])
+        return ["/bin/sh", "-c", script, "sh", *argv]
+
+    def _pump(
+        self,
+        process: subprocess.Popen,
+        outputs: dict,
+        deadline: float,
+        on_line: Callable[[str, str], None] | None,
+    ) -> bool:
+        """Read both pipes until EOF or the deadline. Returns True on timeout."""
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+        timed_out = False
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if timed_out:
+                        # Something outside the process group still holds
+                        # the pipes open; stop waiting for it
+                        break
+                    timed_out = True
+                    _kill_group(process)
+                    deadline = time.monotonic() + self.KILL_GRACE_S
+                    continue
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, self.READ_SIZE)
+                    output = outputs[key.data]
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        lines = output.finish()
+                    else:
+                        lines = output.feed(chunk)
+                    if on_line is not None:
+                        for line in lines:
+                            on_line(key.data, line)
+        finally:
+            selector.close()
+            process.stdout.close()
+            process.stderr.close()
+        if timed_out:
+            _kill_group(process)
+        return timed_out
+
+    def _reap(
+        self, process: subprocess.Popen, deadline: float
+    ) -> tuple[int, resource.struct_rusage, bool]:
+        """Wait for the process to exit, killing its group at the deadline.
+
+        The pipes reaching EOF doesn't mean the process is done (it may have
+        closed or redirected them), so this polls against the same deadline
+        as _pump. Returns (wait status, rusage, killed).
+        """
+        killed = False
+        delay = 0.001
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                return status, usage, killed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not killed:
+                killed = True
+                _kill_group(process)
+                # SIGKILL can't be ignored; the grace period only bounds how
+                # long reaping may take
+                deadline = time.monotonic() + self.KILL_GRACE_S
+                continue
+            if remaining <= 0:
+                # Still not reaped after SIGKILL (e.g. stuck in the kernel)
+                _, status, usage = os.wait4(process.pid, 0)
+                return status, usage, killed
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+    def reset(self):
+        """Empty the workdir so it can be reused for an unrelated project."""
+        for entry in os.scandir(self.workdir):
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+        self._manifest.clear()
+        self.venv = None
 
     def cleanup(self):
         """Remove temp directory."""
         if os.path.exists(self.workdir):
             shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SandboxPool:
+    """Reusable ExecutionEnvironments keyed by session.
+
+    acquire(key) returns the idle workdir last used with that key when there
+    is one, so consecutive debug turns only rewrite the files that changed.
+    Otherwise it recycles the least recently used idle workdir (emptied
+    first) or creates a new one.
+    """
+
+    def __init__(
+        self,
+        max_idle: int = 8,
+        cache_venvs: bool = True,
+        memory_limit_mb: int | None = None,
+        cpu_limit_s: int | None = 60,
+    ):
+        self.max_idle = max_idle
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit_s = cpu_limit_s
+        self.venv_cache = VenvCache() if cache_venvs else None
+        self._idle: OrderedDict[str, ExecutionEnvironment] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str = None) -> ExecutionEnvironment:
+        """Take a workdir for `key` out of the pool (or create one)."""
+        recycled = False
+        with self._lock:
+            env = self._idle.pop(key, None) if key is not None else None
+            if env is None and self._idle:
+                _, env = self._idle.popitem(last=False)
+                recycled = True
+        if recycled:
+            env.reset()
+        elif env is None:
+            env = ExecutionEnvironment(
+                venv_cache=self.venv_cache,
+                memory_limit_mb=self.memory_limit_mb,
+                cpu_limit_s=self.cpu_limit_s,
+            )
+        # Anonymous acquisitions are pooled under their own workdir
+        env.pool_key = key or env.workdir
+        env._cancelled.clear()
+        return env
+
+    def release(self, env: ExecutionEnvironment):
+        """Return a workdir to the pool, evicting the oldest if it's full."""
+        evicted = []
+        with self._lock:
+            previous = self._idle.pop(env.pool_key, None)
+            if previous is not None:
+                evicted.append(previous)
+            self._idle[env.pool_key] = env
+            while len(self._idle) > self.max_idle:
+                evicted.append(self._idle.popitem(last=False)[1])
+        for old in evicted:
+            old.cleanup()
+
+    def cleanup(self):
+        """Remove all idle workdirs."""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for env in idle:
+            env.cleanup()
@@ -6,31 +6,139 @@ for cookbook clarity.
 """
 
 import re
-from collections import OrderedDict
+from bisect import bisect_left
 from pathlib import Path
 from typing import Union
 
 
 class FilesDict(dict):
-    """Dict mapping filename -> content. Type-checked keys/values."""
+    """Dict mapping filename -> content. Type-checked keys/values.
+
+    Each file carries a version that is bumped whenever its content changes
+    (versions keep counting across delete/re-add, so they never repeat).
+    The numbered rendering used by to_context() is memoized per file and
+    version, and carried over by copy(), so only edited files are re-rendered.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._versions: dict[str, int] = {}
+        self._rendered: dict[str, tuple[int, str]] = {}
+        self._context: tuple[tuple, str] = ((), "")
+        source = args[0] if len(args) == 1 and not kwargs else None
+        if isinstance(source, FilesDict):
+            # Already validated; keep versions so cached renderings stay valid
+            super().update(source)
+            self._versions.update(source._versions)
+            self._rendered.update(source._rendered)
+        else:
+            self.update(*args, **kwargs)
 
     def __setitem__(self, key: Union[str, Path], value: str):
         if not isinstance(key, (str, Path)):
             raise TypeError("Keys must be strings or Paths")
         if not isinstance(value, str):
             raise TypeError("Values must be strings")
-        super().__setitem__(str(key), value)
+        key = str(key)
+        if key in self:
+            current = super().__getitem__(key)
+            if current is value or current == value:
+                return
+        self._versions[key] = self._versions.get(key, 0) + 1
+        super().__setitem__(key, value)
 
-    def to_context(self) -> str:
-        """Format files for LLM context with line numbers."""
-        parts = []
-        for filename, content in self.items():
-            lines = content.split("\n")
-            numbered = "\n".join(
-                f"{i + 1} {line}" for i, line in enumerate(lines)
-            )
-            parts.append(f"File: {filename}\n{numbered}")
-        return "\n\n".join(parts)
+    def __delitem__(self, key: str):
+        super().__delitem__(key)
+        self._rendered.pop(key, None)
+
+    def pop(self, key: str, *default):
+        self._rendered.pop(key, None)
+        return super().pop(key, *default)
+
+    def clear(self):
+        super().clear()
+        self._rendered.clear()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def popitem(self) -> tuple[str, str]:
+        key, value = super().popitem()
+        self._rendered.pop(key, None)
+        return key, value
+
+    def __ior__(self, other):
+        # dict's |= bypasses __setitem__, which would leave versions stale
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def setdefault(self, key: Union[str, Path], default: str = ""):
+        if str(key) not in self:
+            self[key] = default
+        return self[str(key)]
+
+    def copy(self) -> "FilesDict":
+        return FilesDict(self)
+
+    def __reduce__(self):
+        # Rebuild through __init__ so pickle/deepcopy don't hit __setitem__
+        # before the version tables exist
+        return (FilesDict, (dict(self),))
+
+    def version(self, filename: str) -> int:
+        """Current version of a file (0 if it doesn't exist)."""
+        return self._versions.get(filename, 0) if filename in self else 0
+
+    def versions(self) -> dict[str, int]:
+        """Snapshot of filename -> version, for detecting changed files later."""
+        return {name: self._versions[name] for name in self}
+
+    def changed_since(self, versions: dict[str, int]) -> list[str]:
+        """Filenames added or modified since a versions() snapshot."""
+        return [
+            name for name in self
+            if versions.get(name) != self._versions[name]
+        ]
+
+    def to_context(self, only=None) -> str:
+        """Format files for LLM context with line numbers.
+
+        Pass `only` (an iterable of filenames) to render just those files,
+        in project order.
+        """
+        if only is None:
+            names = list(self)
+        else:
+            wanted = set(only)
+            names = [name for name in self if name in wanted]
+
+        key = tuple((name, self._versions[name]) for name in names)
+        if self._context[0] == key:
+            return self._context[1]
+        context = "\n\n".join(self._render(name) for name in names)
+        self._context = (key, context)
+        return context
+
+    def _render(self, filename: str) -> str:
+        version = self._versions[filename]
+        cached = self._rendered.get(filename)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        lines = super().__getitem__(filename).split("\n")
+        numbered = "\n".join(
+            f"{i + 1} {line}" for i, line in enumerate(lines)
+        )
+        rendered = f"File: {filename}\n{numbered}"
+        self._rendered[filename] = (version, rendered)
+        return rendered
 
     def to_display(self) -> str:
         """Format for user-facing output."""
@@ -40,20 +148,238 @@ class FilesDict(dict):
         return "\n\n".join(parts)
 
 
+class ChatStreamParser:
+    """Single-pass, incremental parser for LLM responses.
+
+    Feed the response in chunks of any size; events are returned as soon as
+    they are complete:
+
+      - {"type": "file", "path": ..., "content": ...} for every fenced code
+        block preceded by a filename line
+      - {"type": "hunk", "filename": ..., "hunk": {...}} for each diff hunk
+      - {"type": "diff", "diff": {...}} for each complete diff block (same
+        shape as parse_diffs() items)
+
+    Plain code blocks are skipped with a single str.find for the closing
+    fence; only diff blocks are processed line by line.
+    """
+
+    FENCE = "```"
+
+    def __init__(self):
+        self._buf = ""
+        # Last whitespace-separated token of the previous non-blank line
+        self._filename = None
+        # Open code block state, or None when outside a fence
+        self._block = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume a chunk and return the events it completed."""
+        events = []
+        self._buf += chunk
+        self._consume(events, final=False)
+        return events
+
+    def close(self) -> list[dict]:
+        """Flush the trailing partial line (the response has ended).
+
+        A code block that was never closed is dropped.
+        """
+        events = []
+        self._consume(events, final=True)
+        self._buf = ""
+        self._block = None
+        return events
+
+    def _consume(self, events: list[dict], final: bool):
+        buf = self._buf
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            block = self._block
+            if block is not None and block["kind"] != "pending":
+                end = buf.find(self.FENCE, pos)
+                if end == -1:
+                    if block["kind"] == "plain":
+                        # Hold back a possible partial fence at the chunk end
+                        keep = max(pos, size - (len(self.FENCE) - 1))
+                    else:
+                        # Diffs are processed in whole lines
+                        keep = buf.rfind("\n", pos) + 1 or pos
+                    self._add_to_block(buf[pos:keep], events)
+                    pos = keep
+                    break
+                # Closing fence: the block ends at the first ``` in the text.
+                # The text before it on the same line is content, not a diff line.
+                line_start = buf.rfind("\n", pos, end) + 1 or pos
+                self._add_to_block(buf[pos:line_start], events)
+                block["parts"].append(buf[line_start:end])
+                pos = end + len(self.FENCE)
+                self._close_block(events)
+                continue
+
+            newline = buf.find("\n", pos)
+            if newline == -1:
+                if not final:
+                    break
+                line, pos, last = buf[pos:], size, True
+            else:
+                line, pos, last = buf[pos:newline], newline + 1, False
+
+            if block is None:
+                self._process_outside(line, last)
+            else:
+                self._process_header(line, events, last)
+        self._buf = buf[pos:]
+
+    def _process_outside(self, line: str, last: bool):
+        stripped = line.lstrip()
+        if stripped.startswith(self.FENCE) and not last:
+            info = stripped[len(self.FENCE):].strip()
+            self._block = {
+                "filename": self._filename,
+                "parts": [],
+                # ``` and ```diff blocks may hold a diff; decided by the headers
+                "kind": "pending" if info in ("", "diff") else "plain",
+                "header": [],
+                "pre": None,
+                "post": None,
+                "hunks": [],
+                "hunk": None,
+            }
+            self._filename = None
+        elif stripped:
+            # A filename must end right before the newline: "(\S+)\n"
+            self._filename = None if line[-1].isspace() else line.split()[-1]
+
+    def _process_header(self, line: str, events: list[dict], last: bool):
+        """Handle the first lines of a ``` / ```diff block to tell diffs apart."""
+        block = self._block
+        fence_at = line.find(self.FENCE)
+        if fence_at != -1:
+            block["parts"].append(line[:fence_at])
+            self._close_block(events)
+            rest = line[fence_at + len(self.FENCE):]
+            if rest.strip():
+                self._process_outside(rest, last)
+            return
+
+        block["parts"].append(line + "\n")
+        header = block["header"]
+        header.append(line)
+        # A diff block must open with "--- <file>" then "+++ <file>"
+        if not (_DIFF_PRE if len(header) == 1 else _DIFF_POST).match(line):
+            block["kind"] = "plain"
+        elif len(header) == 2:
+            block["kind"] = "diff"
+            self._diff_lines(header, events)
+
+    def _add_to_block(self, text: str, events: list[dict]):
+        """Append complete text to the open block (parsing it if it's a diff)."""
+        if not text:
+            return
+        self._block["parts"].append(text)
+        if self._block["kind"] == "diff":
+            self._diff_lines(text[:-1].split("\n"), events)
+
+    def _diff_lines(self, lines: list[str], events: list[dict]):
+        block = self._block
+        hunk = block["hunk"]
+        for line in lines:
+            first = line[:1]
+            if first == "-" and line.startswith("--- "):
+                block["pre"] = line[4:].strip()
+            elif first == "+" and line.startswith("+++ "):
+                block["post"] = line[4:].strip()
+            elif first == "@" and line.startswith("@@ "):
+                self._finish_hunk(events)
+                header_match = _HUNK_HEADER.match(line)
+                hunk = block["hunk"] = {
+                    "hunk_start": int(header_match.group(1)) if header_match else 1,
+                    "lines": [],
+                }
+            elif hunk is not None:
+                if first == "+" or first == "-" or first == " ":
+                    hunk["lines"].append((first, line[1:]))
+                else:
+                    hunk["lines"].append((" ", line))
+
+    def _finish_hunk(self, events: list[dict]):
+        block = self._block
+        if block["hunk"] is None:
+            return
+        block["hunks"].append(block["hunk"])
+        events.append({"type": "hunk", "filename": block["post"], "hunk": block["hunk"]})
+        block["hunk"] = None
+
+    def _close_block(self, events: list[dict]):
+        block = self._block
+        if block["filename"] is not None:
+            # Empty blocks are files too (e.g. a package's __init__.py)
+            events.append({
+                "type": "file",
+                "path": _clean_path(block["filename"]),
+                "content": "".join(block["parts"]).strip(),
+            })
+        if block["kind"] == "diff":
+            if block["hunk"] is not None:
+                _strip_trailing_blank(block["hunk"]["lines"])
+            self._finish_hunk(events)
+            if block["post"]:
+                events.append({
+                    "type": "diff",
+                    "diff": {
+                        "filename_pre": block["pre"],
+                        "filename_post": block["post"],
+                        "hunks": block["hunks"],
+                        "is_new": block["pre"] == "/dev/null",
+                    },
+                })
+        self._block = None
+
+
+def _strip_trailing_blank(lines: list[tuple[str, str]]):
+    """Drop the blank lines LLMs leave before a diff's closing fence.
+
+    They would be read as empty context lines that the file doesn't have.
+    Trailing whitespace of the last line goes too (the block is stripped).
+    """
+    while lines and lines[-1][0] == " " and not lines[-1][1].strip():
+        lines.pop()
+    if lines:
+        action, text = lines[-1]
+        lines[-1] = (action, text.rstrip())
+
+
+_DIFF_PRE = re.compile(r"---\s+\S+")
+_DIFF_POST = re.compile(r"\+\+\+\s+\S+")
+_HUNK_HEADER = re.compile(r"@@ -(\d+)")
+_PATH_CHARS = re.compile(r'[\:<>"|?*]')
+_PATH_BRACKETS = re.compile(r"^\[(.*)\]$")
+_PATH_BACKTICKS = re.compile(r"^`(.*)`$")
+_PATH_TRAILING = re.compile(r"[\]\:]$")
+
+
+def _clean_path(path: str) -> str:
+    path = _PATH_CHARS.sub("", path)
+    path = _PATH_BRACKETS.sub(r"\1", path)
+    path = _PATH_BACKTICKS.sub(r"\1", path)
+    path = _PATH_TRAILING.sub("", path)
+    return path.strip()
+
+
+def parse_response(chat_response: str) -> list[dict]:
+    """Parse a complete response into ChatStreamParser events."""
+    parser = ChatStreamParser()
+    return parser.feed(chat_response) + parser.close()
+
+
 def parse_chat_to_files(chat_response: str) -> FilesDict:
     """Parse LLM response (filename + code blocks) into FilesDict."""
-    regex = r"(\S+)\n\s*```[^\n]*\n(.+?)```"
-    matches = re.finditer(regex, chat_response, re.DOTALL)
-
     files = FilesDict()
-    for match in matches:
-        # Clean the file path
-        path = re.sub(r'[\:<>"|?*]', "", match.group(1))
-        path = re.sub(r"^\[(.*)\]$", r"\1", path)
-        path = re.sub(r"^`(.*)`$", r"\1", path)
-        path = re.sub(r"[\]\:]$", "", path)
-        content = match.group(2)
-        files[path.strip()] = content.strip()
+    for event in parse_response(chat_response):
+        if event["type"] == "file":
+            files[event["path"]] = event["content"]
     return files
 
 
@@ -66,97 +392,171 @@ def parse_diffs(diff_string: str) -> list[dict]:
       - hunks: list of (action, line) tuples where action is +, -, or ' '
       - is_new: whether this is a new file
     """
-    # Match diff blocks fenced with ```
-    block_pattern = re.compile(
-        r"```(?:diff)?\s*\n(---\s+\S+.*?\n\+\+\+\s+\S+.*?\n(?:@@.*?@@\n(?:[-+ ].*?\n)*?)*?)```",
-        re.DOTALL,
-    )
-
-    diffs = []
-    for block_match in block_pattern.finditer(diff_string):
-        block = block_match.group(1)
-        lines = block.strip().split("\n")
-
-        filename_pre = None
-        filename_post = None
-        hunks = []
-        current_hunk = None
-
-        for line in lines:
-            if line.startswith("--- "):
-                filename_pre = line[4:].strip()
-            elif line.startswith("+++ "):
-                filename_post = line[4:].strip()
-            elif line.startswith("@@ "):
-                header_match = re.match(r"@@ -(\d+)", line)
-                current_hunk = {
-                    "hunk_start": int(header_match.group(1)) if header_match else 1,
-                    "lines": [],
-                }
-                hunks.append(current_hunk)
-            elif current_hunk is not None:
-                if line.startswith("+"):
-                    current_hunk["lines"].append(("+", line[1:]))
-                elif line.startswith("-"):
-                    current_hunk["lines"].append(("-", line[1:]))
-                else:
-                    current_hunk["lines"].append((" ", line[1:] if line.startswith(" ") else line))
-
-        if filename_post:
-            diffs.append({
-                "filename_pre": filename_pre,
-                "filename_post": filename_post,
-                "hunks": hunks,
-                "is_new": filename_pre == "/dev/null",
-            })
+    return [
+        event["diff"]
+        for event in parse_response(diff_string)
+        if event["type"] == "diff"
+    ]
 
-    return diffs
 
+def apply_diffs(
+    diffs: list[dict], existing_files: FilesDict, rejected: list[dict] | None = None
+) -> FilesDict:
+    """Apply parsed diffs to existing files. Returns updated FilesDict.
 
-def apply_diffs(diffs: list[dict], existing_files: FilesDict) -> FilesDict:
-    """Apply parsed diffs to existing files. Returns updated FilesDict."""
-    files = FilesDict(existing_files.copy())
-    REMOVE_FLAG = "<REMOVE_LINE>"
+    Hunks are anchored by their content (context + removed lines), so wrong
+    @@ line numbers from the LLM are tolerated. Hunks that can't be anchored
+    are skipped rather than applied at a guessed position; if `rejected` is
+    given, {"filename", "hunk_start"} is appended to it for each of them.
+    """
+    files = existing_files.copy()
 
     for diff in diffs:
         if diff["is_new"]:
             # New file: collect all added lines from all hunks
             content = "\n".join(
-                line for hunk in diff["hunks"] for action, line in hunk["lines"] if action == "+"
+                line
+                for hunk in diff["hunks"]
+                for action, line in hunk["lines"]
+                if action == "+"
             )
             files[diff["filename_post"]] = content
         else:
             source_name = diff["filename_pre"]
             if source_name not in files:
                 continue
-
-            # Convert file to ordered line dict
             source_lines = files[source_name].split("\n")
-            line_dict = OrderedDict(
-                (i + 1, line) for i, line in enumerate(source_lines)
+            skipped = []
+            files[diff["filename_post"]] = "\n".join(
+                _apply_hunks(source_lines, diff["hunks"], skipped)
             )
-
-            for hunk in diff["hunks"]:
-                current_line = hunk["hunk_start"]
-                for action, content in hunk["lines"]:
-                    if action == " ":
-                        current_line += 1
-                    elif action == "+":
-                        # Insert after current position
-                        current_line -= 1
-                        if current_line in line_dict and line_dict[current_line] != REMOVE_FLAG:
-                            line_dict[current_line] += "\n" + content
-                        else:
-                            line_dict[current_line] = content
-                        current_line += 1
-                    elif action == "-":
-                        line_dict[current_line] = REMOVE_FLAG
-                        current_line += 1
-
-            # Remove flagged lines and reassemble
-            line_dict = {
-                k: v for k, v in line_dict.items() if REMOVE_FLAG not in v
-            }
-            files[diff["filename_post"]] = "\n".join(line_dict.values())
+            if rejected is not None:
+                rejected.extend(
+                    {"filename": source_name, "hunk_start": hunk["hunk_start"]}
+                    for hunk in skipped
+                )
 
     return files
+
+
+def _apply_hunks(
+    source: list[str], hunks: list[dict], skipped: list[dict]
+) -> list[str]:
+    """Apply hunks to a list of lines in one linear pass.
+
+    Each hunk is located at or after the end of the previous one, searching
+    outward from its header line number (adjusted by the drift observed on
+    earlier hunks). Unchanged spans between hunks are copied as slices.
+    Hunks that can't be located are appended to `skipped`.
+    """
+    locator = _HunkLocator(source)
+    out: list[str] = []
+    cursor = 0  # first source line not yet copied
+    drift = 0  # actual position minus header position of the last hunk
+
+    for hunk in hunks:
+        lines = hunk["lines"]
+        # Blank context at the end is usually padding before the closing
+        # fence, not lines of the file; it must not stop the hunk matching
+        end = len(lines)
+        while end and lines[end - 1][0] == " " and not lines[end - 1][1].strip():
+            end -= 1
+        lines = lines[:end]
+
+        old = [text for action, text in lines if action != "+"]
+        expected = hunk["hunk_start"] - 1 + drift
+        if not old:
+            # Pure insertion: nothing to anchor on, trust the header
+            at = min(max(expected, cursor), len(source))
+        else:
+            at = locator.find(old, expected, cursor)
+            if at is None:
+                skipped.append(hunk)
+                continue
+
+        out.extend(source[cursor:at])
+        pos = at
+        for action, text in lines:
+            if action == "+":
+                out.append(text)
+            elif action == " ":
+                # Keep the file's own context line (the LLM's may differ in whitespace)
+                out.append(source[pos])
+                pos += 1
+            else:
+                pos += 1
+        cursor = pos
+        drift = at - (hunk["hunk_start"] - 1)
+
+    out.extend(source[cursor:])
+    return out
+
+
+class _HunkLocator:
+    """Finds a block of lines in a file, exactly or ignoring whitespace."""
+
+    # Lines scanned either side of the expected position before using the index
+    WINDOW = 64
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.stripped = None
+        # line -> sorted positions, built lazily per variant of the file
+        self._positions = {}
+
+    def find(self, block: list[str], expected: int, lo: int) -> int | None:
+        """Position >= lo where block starts, closest to expected, or None."""
+        at = self._search(self.lines, block, expected, lo)
+        if at is None:
+            if self.stripped is None:
+                self.stripped = [line.strip() for line in self.lines]
+            block = [line.strip() for line in block]
+            at = self._search(self.stripped, block, expected, lo)
+        return at
+
+    def _search(
+        self, lines: list[str], block: list[str], expected: int, lo: int
+    ) -> int | None:
+        hi = len(lines) - len(block)
+        if hi < lo:
+            return None
+        n = len(block)
+        first = block[0]
+
+        # Usually the hunk is at (or right next to) where the header says
+        start = min(max(expected, lo), hi)
+        for distance in range(self.WINDOW):
+            for i in (start - distance, start + distance):
+                if lo <= i <= hi and lines[i] == first and lines[i:i + n] == block:
+                    return i
+
+        index = self._positions.get(id(lines))
+        if index is None:
+            index = self._positions[id(lines)] = {}
+            for i, line in enumerate(lines):
+                index.setdefault(line, []).append(i)
+        positions = index.get(first, [])
+
+        # Walk candidate starts outward from the expected position, which may
+        # be behind lo when hunks are out of order
+        expected = max(expected, lo)
+        right = bisect_left(positions, expected)
+        left = right - 1
+        while left >= 0 or right < len(positions):
+            if left < 0 or positions[left] < lo:
+                left = -1
+            if right < len(positions) and positions[right] > hi:
+                right = len(positions)
+            if left < 0 and right >= len(positions):
+                return None
+            if right >= len(positions) or (
+                left >= 0 and expected - positions[left] <= positions[right] - expected
+            ):
+                i = positions[left]
+                left -= 1
+            else:
+                i = positions[right]
+                right += 1
+            if lines[i:i + n] == block:
+                return i
+        return None
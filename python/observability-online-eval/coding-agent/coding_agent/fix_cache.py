@@ -0,0 +1,288 @@
+"""
+Error-signature cache for debug-loop fixes.
+
+When a fix makes a failing run succeed, the change is stored as a patch
+(apply_diffs hunks) under a key made of the normalized error signature and a
+hash of the code region the error points at. The next time the same error
+comes from the same code, the patch is replayed before paying for a fix_code
+call. Hunks are anchored by content, so a patch still applies when the rest
+of the project differs.
+
+Keys include a scope (the session id), so a patch learned from one user's
+code is never replayed into another's.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from time import time
+
+from coding_agent.execution import ExecutionResult
+from coding_agent.files import FilesDict, apply_diffs
+
+_EXCEPTION_LINE = re.compile(
+    r"^\s*(?:[A-Za-z_][\w.]*\.)?[A-Za-z_]\w*(?:Error|Exception|Exit|Interrupt)\b.*$"
+)
+_PY_FRAME = re.compile(r'File "([^"]+)", line (\d+)')
+_SHELL_LOCATION = re.compile(r"(\S+\.sh): line (\d+)")
+_ABS_PATH = re.compile(r"(?<![\w.])/(?:[^\s'\":,()]+/)*([^\s'\":,()]+)")
+_HEX = re.compile(r"0x[0-9a-fA-F]+")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+class FixCache:
+    """LRU map of scope + error signature + code region -> patch that fixed it.
+
+    Pass `path` to keep the entries in a SQLite database instead of memory,
+    so they survive restarts and are shared safely by several workers.
+    """
+
+    # Lines around the failing line hashed into the key
+    REGION_RADIUS = 3
+    # Context lines kept around each change in a stored patch
+    PATCH_CONTEXT = 3
+
+    def __init__(self, max_entries: int = 512, path: str = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: OrderedDict[str, list[dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fixes ("
+                    "key TEXT PRIMARY KEY, patch TEXT NOT NULL, "
+                    "used_at REAL NOT NULL)"
+                )
+
+    # ── Keys ─────────────────────────────────────────────────────────
+
+    def key(self, result: ExecutionResult, files: FilesDict, scope: str = "") -> str:
+        """Scope + normalized error signature + hash of the region it points at."""
+        output = f"{result.stdout}\n{result.stderr}"
+        signature = _normalize(_error_line(output), files)
+        region = _error_region(output, files, self.REGION_RADIUS)
+        return hashlib.sha256(
+            f"{scope}\0{signature}\0{region}".encode()
+        ).hexdigest()[:32]
+
+    # ── Lookup / store ───────────────────────────────────────────────
+
+    def replay(self, key: str, files: FilesDict) -> FilesDict | None:
+        """Apply the cached patch for `key`; None on a miss, or if the patch
+        doesn't apply cleanly or changes nothing."""
+        patch = self._get(key)
+        if patch is None:
+            return None
+        rejected = []
+        patched = apply_diffs(patch, files, rejected)
+        # A patch that only partly applies is not the fix that worked
+        if rejected or patched == files:
+            return None
+        return patched
+
+    def put(self, key: str, before: FilesDict, after: FilesDict):
+        """Store the change from `before` to `after` as the fix for `key`."""
+        patch = make_patch(before, after, self.PATCH_CONTEXT)
+        if not patch:
+            return
+        with self._lock:
+            if self._conn is None:
+                self._entries[key] = patch
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO fixes (key, patch, used_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET "
+                    "patch = excluded.patch, used_at = excluded.used_at",
+                    (key, json.dumps(patch), time()),
+                )
+                self._conn.execute(
+                    "DELETE FROM fixes WHERE key NOT IN "
+                    "(SELECT key FROM fixes ORDER BY used_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def discard(self, key: str):
+        """Forget a patch that didn't fix the error when replayed."""
+        with self._lock:
+            if self._conn is None:
+                self._entries.pop(key, None)
+                return
+            with self._conn:
+                self._conn.execute("DELETE FROM fixes WHERE key = ?", (key,))
+
+    def _get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            if self._conn is None:
+                patch = self._entries.get(key)
+                if patch is not None:
+                    self._entries.move_to_end(key)
+                return patch
+            with self._conn:
+                row = self._conn.execute(
+                    "SELECT patch FROM fixes WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "UPDATE fixes SET used_at = ? WHERE key = ?", (time(), key)
+                )
+        return json.loads(row[0])
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return len(self._entries)
+            return self._conn.execute("SELECT COUNT(*) FROM fixes").fetchone()[0]
+
+
+@dataclass
+class FixTracker:
+    """FixCache bookkeeping for one debug loop.
+
+    lookup() is called for every failed run: it replays a cached patch (hit)
+    or remembers the failing state so succeeded() can store whatever fix
+    makes the next run pass (miss). A replayed patch that leaves the same
+    error in place is discarded, and each key is replayed at most once.
+    """
+
+    cache: FixCache
+    # Entries are only shared within a scope (the session id)
+    scope: str = ""
+    hits: int = 0
+    misses: int = 0
+    tried: set[str] = field(default_factory=set)
+    replayed: str | None = None
+    pending: tuple[str, FilesDict] | None = None
+
+    def lookup(self, result: ExecutionResult, files: FilesDict) -> FilesDict | None:
+        key = self.cache.key(result, files, self.scope)
+        if key == self.replayed:
+            self.cache.discard(key)
+        self.replayed = None
+
+        patched = None
+        if key not in self.tried:
+            self.tried.add(key)
+            patched = self.cache.replay(key, files)
+        if patched is None:
+            self.misses += 1
+            self.pending = (key, files.copy())
+            return None
+        self.hits += 1
+        self.replayed = key
+        self.pending = None
+        return patched
+
+    def succeeded(self, files: FilesDict):
+        if self.pending is not None:
+            key, before = self.pending
+            self.cache.put(key, before, files)
+            self.pending = None
+
+
+def make_patch(before: FilesDict, after: FilesDict, context: int = 3) -> list[dict]:
+    """Diff two FilesDicts into apply_diffs-style diff dicts."""
+    diffs = []
+    for name, content in after.items():
+        old = before.get(name)
+        if old == content:
+            continue
+        new_lines = content.split("\n")
+        if old is None:
+            diffs.append({
+                "filename_pre": name,
+                "filename_post": name,
+                "is_new": True,
+                "hunks": [
+                    {"hunk_start": 1, "lines": [["+", line] for line in new_lines]}
+                ],
+            })
+            continue
+
+        old_lines = old.split("\n")
+        matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        hunks = []
+        for group in matcher.get_grouped_opcodes(context):
+            lines = []
+            for tag, i1, i2, j1, j2 in group:
+                if tag == "equal":
+                    lines.extend([" ", line] for line in old_lines[i1:i2])
+                    continue
+                lines.extend(["-", line] for line in old_lines[i1:i2])
+                lines.extend(["+", line] for line in new_lines[j1:j2])
+            hunks.append({"hunk_start": group[0][1] + 1, "lines": lines})
+        diffs.append({
+            "filename_pre": name,
+            "filename_post": name,
+            "is_new": False,
+            "hunks": hunks,
+        })
+    return diffs
+
+
+def _error_line(output: str) -> str:
+    """The line that names the error: last exception line, else last line."""
+    lines = [line for line in output.splitlines() if line.strip()]
+    for line in reversed(lines):
+        if _EXCEPTION_LINE.match(line):
+            return line.strip()
+    return lines[-1].strip() if lines else ""
+
+
+def _normalize(line: str, files: FilesDict) -> str:
+    """Strip what varies between runs: sandbox paths, addresses, numbers."""
+    line = _ABS_PATH.sub(lambda m: _project_path(m.group(0), files) or m.group(1), line)
+    line = _HEX.sub("0x?", line)
+    return _NUMBER.sub("N", line)
+
+
+def _project_path(path: str, files: FilesDict) -> str | None:
+    """Map an absolute sandbox path back to the project filename it names."""
+    matches = [name for name in files if path == name or path.endswith("/" + name)]
+    return max(matches, key=len) if matches else None
+
+
+def _error_region(output: str, files: FilesDict, radius: int) -> str:
+    """filename:hash of the lines around the last project location in output."""
+    location = None
+    for match in _PY_FRAME.finditer(output):
+        name = _project_path(match.group(1), files)
+        if name is not None:
+            location = (name, int(match.group(2)))
+    if location is None:
+        for match in _SHELL_LOCATION.finditer(output):
+            name = _project_path(match.group(1), files) or match.group(1)
+            if name in files:
+                location = (name, int(match.group(2)))
+
+    if location is None:
+        # Errors without a location (missing file, bad command) come from
+        # how the project is launched
+        if "run.sh" not in files:
+            return ""
+        name, region = "run.sh", files["run.sh"]
+    else:
+        name, line = location
+        lines = files[name].split("\n")
+        start = max(0, line - 1 - radius)
+        region = "\n".join(lines[start:line + radius])
+    return f"{name}:{hashlib.sha256(region.encode()).hexdigest()[:16]}"
@@ -0,0 +1,191 @@
+"""
+Tiered mode detection: deterministic rules, then a local classifier, then
+the LLM.
+
+Rules catch unambiguous messages (a pasted traceback, "run it", "start over
+from scratch"); weaker hints ("it crashes") are only logged and left to the
+later tiers. A multinomial naive Bayes model over word unigrams/bigrams,
+trained on past mode_selection decisions, handles most of the rest. Only
+messages neither tier is confident about go to the mode_selection LLM call,
+and those decisions are fed back as training examples.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Iterable
+
+MODES = ("generate", "improve", "debug")
+
+_DEBUG_RULES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"traceback \(most recent call last\)",
+        r"\b[A-Z]\w*(?:Error|Exception):",
+        r"^\s*(?:please\s+)?(?:re)?run (?:it|this|the (?:code|app|project|tests?))\b",
+        r"\b(?:does(?:n't| not)|won't|isn't|is not) (?:work|run|start|compile)",
+        r"\b(?:command not found|non-zero exit)\b",
+    )
+]
+# Also used for feature requests ("add a crash reporter", "fix the error
+# handling"), so they don't skip the LLM on their own
+_WEAK_DEBUG_RULES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"\b(?:crash(?:es|ed|ing)?|segfault|stack ?trace)\b",
+        r"\bfix (?:the |this |that )?(?:bug|error|crash|exception|failure)s?\b",
+        r"\bexit code\b",
+    )
+]
+# Generate replaces the whole project, so only explicit restarts qualify
+_GENERATE_RULES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"\bstart(?:ing)? (?:over|again from scratch)\b",
+        r"\b(?:rewrite|redo|rebuild|recreate) (?:it|this|everything|the "
+        r"(?:whole |entire )?(?:project|app|codebase)) from scratch\b",
+        r"^\s*(?:let's\s+|please\s+)?(?:start\s+)?from scratch\b",
+    )
+]
+_IMPROVE_RULES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"^\s*(?:please\s+)?(?:add|refactor|rename|extract|remove|delete|"
+        r"replace|change|update|move|split|convert|optimi[sz]e|document)\b",
+    )
+]
+_WORD = re.compile(r"[a-z][a-z0-9_']*")
+
+
+@dataclass
+class ModeDecision:
+    mode: str | None  # None: not confident, ask the LLM
+    tier: str  # "rules" | "classifier" | "none"
+    confidence: float
+
+
+class ModeClassifier:
+    """Rules + naive Bayes front for the mode_selection LLM call.
+
+    Pass `examples_path` (JSONL of {"message": ..., "mode": ...}) to train
+    from logged decisions at startup; every LLM decision passed to learn()
+    is appended there, so the model keeps improving across restarts.
+    """
+
+    # Posterior needed to skip the LLM
+    MIN_CONFIDENCE = 0.9
+    # Confidence of a weak rule hit: below MIN_CONFIDENCE, so it never decides
+    WEAK_RULE_CONFIDENCE = 0.6
+    # Don't trust the model until it has seen this many examples
+    MIN_EXAMPLES = 50
+
+    def __init__(self, examples_path: str = None):
+        self.examples_path = examples_path
+        self._class_counts: Counter = Counter()
+        self._feature_counts: dict[str, Counter] = defaultdict(Counter)
+        self._feature_totals: Counter = Counter()
+        self._vocabulary: set[str] = set()
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        if examples_path and os.path.exists(examples_path):
+            self.train(_read_examples(examples_path))
+
+    # ── Classification ───────────────────────────────────────────────
+
+    def classify(self, message: str) -> ModeDecision:
+        """Decide a mode for a project that already has files."""
+        mode, confidence = self._rules(message)
+        if mode is not None and confidence >= self.MIN_CONFIDENCE:
+            return ModeDecision(mode, "rules", confidence)
+
+        mode, confidence = self._predict(message)
+        if mode is not None and confidence >= self.MIN_CONFIDENCE:
+            return ModeDecision(mode, "classifier", confidence)
+        return ModeDecision(None, "none", confidence)
+
+    def _rules(self, message: str) -> tuple[str | None, float]:
+        fired = {}
+        for mode, rules, confidence in (
+            ("debug", _DEBUG_RULES, 1.0),
+            ("debug", _WEAK_DEBUG_RULES, self.WEAK_RULE_CONFIDENCE),
+            ("generate", _GENERATE_RULES, 1.0),
+            ("improve", _IMPROVE_RULES, 1.0),
+        ):
+            if any(rule.search(message) for rule in rules):
+                fired[mode] = max(fired.get(mode, 0.0), confidence)
+        # Conflicting signals ("add X, it crashes") are left to later tiers
+        if len(fired) != 1:
+            return None, 0.0
+        return fired.popitem()
+
+    def _predict(self, message: str) -> tuple[str | None, float]:
+        with self._lock:
+            if sum(self._class_counts.values()) < self.MIN_EXAMPLES:
+                return None, 0.0
+            features = _features(message)
+            total = sum(self._class_counts.values())
+            vocab = len(self._vocabulary) + 1
+            log_posts = {}
+            for mode, count in self._class_counts.items():
+                counts = self._feature_counts[mode]
+                denominator = self._feature_totals[mode] + vocab
+                log_posts[mode] = math.log(count / total) + sum(
+                    math.log((counts[f] + 1) / denominator) for f in features
+                )
+        best = max(log_posts, key=log_posts.get)
+        # Softmax over log posteriors for a calibrated-ish confidence
+        peak = log_posts[best]
+        norm = sum(math.exp(v - peak) for v in log_posts.values())
+        return best, 1.0 / norm
+
+    # ── Training ─────────────────────────────────────────────────────
+
+    def train(self, examples: Iterable[tuple[str, str]]):
+        with self._lock:
+            for message, mode in examples:
+                self._add(message, mode)
+
+    def learn(self, message: str, mode: str):
+        """Add an LLM decision as a training example (and log it).
+
+        Appends to examples_path, so async callers run it in a thread.
+        """
+        if mode not in MODES:
+            return
+        with self._lock:
+            self._add(message, mode)
+        if self.examples_path:
+            # Separate lock: classify() must not wait on the file
+            with self._file_lock:
+                with open(self.examples_path, "a") as f:
+                    f.write(json.dumps({"message": message, "mode": mode}) + "\n")
+
+    def _add(self, message: str, mode: str):
+        if mode not in MODES:
+            return
+        features = _features(message)
+        self._class_counts[mode] += 1
+        self._feature_counts[mode].update(features)
+        self._feature_totals[mode] += len(features)
+        self._vocabulary.update(features)
+
+
+def _features(message: str) -> list[str]:
+    words = _WORD.findall(message.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _read_examples(path: str) -> list[tuple[str, str]]:
+    examples = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                examples.append((record["message"], record["mode"].strip().lower()))
+            except (ValueError, KeyError, AttributeError):
+                continue
+    return examples
@@ -3,11 +3,134 @@ Maxim observability wrapper — tracing, spans, generations, and evaluator wirin
 
 Uses the Maxim Python SDK to create structured traces for every agent interaction
 and attach 5 coding-specific evaluators to each trace.
+
+Nothing here touches the SDK on the caller's thread: every call is queued to a
+background exporter that applies them in order, so tracing never adds latency
+to agent turns. start_trace/start_span return handles that stand in for the
+SDK objects until the exporter creates them.
+
+Large message contents (system prompts, file context) are logged in full the
+first time they appear in a session; later generations reference them by
+content hash instead of repeating them.
 """
 
-from time import time
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from time import monotonic, time
 
 from maxim import Maxim
+from maxim.logger import FileDataAttachment
+
+
+class _Handle:
+    """Stand-in for a trace/span that the exporter creates asynchronously."""
+
+    __slots__ = ("id", "obj", "scope")
+
+    def __init__(self, id: str, scope: str = None):
+        self.id = id
+        self.obj = None
+        # Session (or trace) whose logged blobs generations under it can reference
+        self.scope = scope or id
+
+
+def _resolve(parent):
+    obj = parent.obj if isinstance(parent, _Handle) else parent
+    if obj is None:
+        raise RuntimeError("parent trace/span was never created (dropped?)")
+    return obj
+
+
+class _Exporter:
+    """Single background worker applying queued SDK calls in FIFO order.
+
+    submit() never blocks. Once `max_queue` calls are waiting, droppable
+    calls (generations, events, metrics) are dropped and counted; critical
+    calls (trace/span start and end, evaluators) are always queued, so the
+    traces that do get exported are well-formed. Critical calls are a few
+    small records per turn, so they can't grow the queue much on their own.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue: int, batch_size: int):
+        # Unbounded so critical calls never wait; max_queue is enforced in
+        # submit() for droppable ones. One queue keeps them all in FIFO order.
+        self.queue: queue.Queue = queue.Queue()
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._stats = {
+            "enqueued": 0,
+            "exported": 0,
+            "dropped": 0,
+            "errors": 0,
+            "batches": 0,
+            "max_depth": 0,
+        }
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="maxim-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, fn, critical: bool = False) -> bool:
+        if not critical and self.queue.qsize() >= self.max_queue:
+            self._count("dropped")
+            return False
+        self.queue.put_nowait(fn)
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], depth)
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for fn in batch:
+                try:
+                    if fn is self._STOP:
+                        return
+                    fn()
+                    self._count("exported")
+                except Exception:
+                    self._count("errors")
+                finally:
+                    self.queue.task_done()
+            self._count("batches")
+
+    def _count(self, name: str, amount: float = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until everything queued so far is exported."""
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = None):
+        self.flush(timeout)
+        self.queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self.queue.qsize()
+        return stats
 
 
 class CodingAgentObservability:
@@ -21,9 +144,27 @@ class CodingAgentObservability:
         "Code Readability",
     ]
 
+    # Exporter queue and batching
+    MAX_QUEUE = 10_000
+    BATCH_SIZE = 256
+    # Message/response text above this size is truncated in the generation
+    # and attached in full as a text file
+    MAX_CONTENT_CHARS = 32_000
+    TRUNCATED_HEAD_CHARS = 8_000
+    TRUNCATED_TAIL_CHARS = 2_000
+    # Message contents at least this long are deduplicated per session
+    MIN_DEDUP_CHARS = 512
+    MAX_DEDUP_SCOPES = 1_000
+    MAX_BLOBS_PER_SCOPE = 4_096
+
     def __init__(self):
         self.maxim = Maxim()
         self.logger = self.maxim.logger()
+        self.exporter = _Exporter(self.MAX_QUEUE, self.BATCH_SIZE)
+        # scope -> content hash -> id of the generation that logged it in full.
+        # Only touched on the exporter thread.
+        self._blobs: OrderedDict[str, OrderedDict[str, str]] = OrderedDict()
+        self._dedup_stats = {"deduplicated_blobs": 0, "deduplicated_chars": 0}
 
     def start_trace(
         self,
@@ -42,13 +183,27 @@ class CodingAgentObservability:
         }
         if session_id:
             config["session_id"] = session_id
-        return self.logger.trace(config)
+        handle = _Handle(trace_id, session_id)
+
+        def create():
+            handle.obj = self.logger.trace(config)
+
+        self.exporter.submit(create, critical=True)
+        return handle
 
     def start_span(
         self, parent, span_id: str, name: str, tags: dict = None
     ) -> object:
         """Start a span under a trace or another span."""
-        return parent.span({"id": span_id, "name": name, "tags": tags or {}})
+        handle = _Handle(span_id, getattr(parent, "scope", None))
+
+        def create():
+            handle.obj = _resolve(parent).span(
+                {"id": span_id, "name": name, "tags": tags or {}}
+            )
+
+        self.exporter.submit(create, critical=True)
+        return handle
 
     def log_generation(
         self,
@@ -61,49 +216,121 @@ class CodingAgentObservability:
         usage: dict,
         model_parameters: dict = None,
     ) -> None:
-        """Log an LLM call as a generation under a trace or span."""
-        generation = parent.generation({
-            "id": gen_id,
-            "provider": "openai",
-            "model": model,
-            "model_parameters": model_parameters or {},
-            "messages": [
+        """Log an LLM call as a generation under a trace or span.
+
+        The payload (including truncation of oversized messages and blob
+        deduplication) is built on the exporter thread, not the caller's.
+        """
+        created = int(time())
+        scope = getattr(parent, "scope", None)
+
+        def export():
+            attachments, logged = [], []
+            payload_messages = [
                 {
                     "role": m["role"],
-                    "content": m.get("content", ""),
-                }
-                for m in messages
-            ],
-            "name": name,
-        })
-        generation.result({
-            "id": gen_id,
-            "object": "chat.completion",
-            "created": int(time()),
-            "model": model,
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {
-                        "content": response_text,
-                        "role": "assistant",
-                    },
-                    "finish_reason": "stop",
+                    "content": self._dedup(
+                        m.get("content", ""), scope, gen_id,
+                        f"{name}-message-{i}.txt", attachments, logged,
+                    ),
                 }
-            ],
-            "usage": usage,
-        })
+                for i, m in enumerate(messages)
+            ]
+            content = self._fit(response_text, f"{name}-response.txt", attachments)
+            generation = _resolve(parent).generation({
+                "id": gen_id,
+                "provider": "openai",
+                "model": model,
+                "model_parameters": model_parameters or {},
+                "messages": payload_messages,
+                "name": name,
+            })
+            for attachment in attachments:
+                generation.add_attachment(attachment)
+            generation.result({
+                "id": gen_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "content": content,
+                            "role": "assistant",
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            })
+            # Only reference blobs once a generation holding them was exported
+            self._remember(scope, logged, gen_id)
+
+        self.exporter.submit(export)
+
+    def _dedup(
+        self, content, scope, gen_id, filename, attachments, logged
+    ) -> str:
+        """Replace content already logged in this scope with a hash reference."""
+        if (
+            scope is None
+            or not isinstance(content, str)
+            or len(content) < self.MIN_DEDUP_CHARS
+        ):
+            return self._fit(content, filename, attachments)
+        digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+        first = self._blobs.get(scope, {}).get(digest)
+        if first is None:
+            logged.append(digest)
+            return self._fit(content, filename, attachments)
+        self._blobs[scope].move_to_end(digest)
+        self._dedup_stats["deduplicated_blobs"] += 1
+        self._dedup_stats["deduplicated_chars"] += len(content)
+        return f"[blob sha256:{digest}, {len(content)} chars, logged in generation {first}]"
+
+    def _remember(self, scope, digests: list[str], gen_id: str):
+        if scope is None or not digests:
+            return
+        blobs = self._blobs.setdefault(scope, OrderedDict())
+        self._blobs.move_to_end(scope)
+        for digest in digests:
+            blobs.setdefault(digest, gen_id)
+            blobs.move_to_end(digest)
+        while len(blobs) > self.MAX_BLOBS_PER_SCOPE:
+            blobs.popitem(last=False)
+        while len(self._blobs) > self.MAX_DEDUP_SCOPES:
+            self._blobs.popitem(last=False)
+
+    def _fit(self, content, filename: str, attachments: list) -> str:
+        """Truncate oversized text, offloading the full text to an attachment."""
+        if not isinstance(content, str) or len(content) <= self.MAX_CONTENT_CHARS:
+            return content
+        attachments.append(FileDataAttachment(
+            data=content.encode(),
+            name=filename,
+            mime_type="text/plain",
+        ))
+        omitted = len(content) - self.TRUNCATED_HEAD_CHARS - self.TRUNCATED_TAIL_CHARS
+        return (
+            content[: self.TRUNCATED_HEAD_CHARS]
+            + f"\n... [{omitted} chars truncated, full text in {filename}] ...\n"
+            + content[-self.TRUNCATED_TAIL_CHARS:]
+        )
 
     def attach_evaluators(
         self, trace, input_text: str, output_text: str
     ) -> None:
         """Attach all 5 coding agent evaluators to the trace."""
-        trace.evaluate().with_evaluators(
-            *self.EVALUATOR_NAMES
-        ).with_variables({
-            "input": input_text,
-            "output": output_text,
-        })
+        def attach():
+            _resolve(trace).evaluate().with_evaluators(
+                *self.EVALUATOR_NAMES
+            ).with_variables({
+                "input": input_text,
+                "output": output_text,
+            })
+
+        self.exporter.submit(attach, critical=True)
 
     def log_event(
         self,
@@ -114,24 +341,40 @@ class CodingAgentObservability:
         metadata: dict = None,
     ) -> None:
         """Log an event on a trace or span."""
-        parent.event(event_id, name, tags=tags, metadata=metadata)
+        self.exporter.submit(
+            lambda: _resolve(parent).event(event_id, name, tags=tags, metadata=metadata)
+        )
+
+    def log_metric(self, parent, name: str, value: float) -> None:
+        """Attach a numeric metric to a trace or generation."""
+        self.exporter.submit(lambda: _resolve(parent).add_metric(name, value))
 
     def end_span(self, span) -> None:
         """End a span."""
-        span.end()
+        self.exporter.submit(lambda: _resolve(span).end(), critical=True)
 
     def end_trace(self, trace, output_text: str) -> None:
         """Set output and end a trace."""
-        output_method = getattr(trace, "output", None)
-        if callable(output_method):
-            output_method(output_text)
-        else:
-            set_output_method = getattr(trace, "set_output", None)
-            if callable(set_output_method):
-                set_output_method(output_text)
-        trace.end()
-
-    def cleanup(self) -> None:
-        """Flush pending logs and clean up resources."""
+        def end():
+            obj = _resolve(trace)
+            output_method = getattr(obj, "output", None)
+            if callable(output_method):
+                output_method(output_text)
+            else:
+                set_output_method = getattr(obj, "set_output", None)
+                if callable(set_output_method):
+                    set_output_method(output_text)
+            obj.end()
+
+        self.exporter.submit(end, critical=True)
+
+    def stats(self) -> dict:
+        """Exporter counters: enqueued/exported/dropped/errors, queue depth,
+        and how many message blobs were replaced by hash references."""
+        return {**self.exporter.stats(), **self._dedup_stats}
+
+    def cleanup(self, timeout: float = 10.0) -> None:
+        """Export queued calls, flush pending logs and clean up resources."""
+        self.exporter.close(timeout)
         self.logger.flush()
         self.maxim.cleanup()
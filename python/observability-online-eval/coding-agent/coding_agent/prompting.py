@@ -0,0 +1,126 @@
+"""
+System prompt assembly.
+
+Composite system prompts (roadmap + mode prompt with the file format inlined +
+philosophy) are built once, so every call for a given step sends a
+byte-identical system message. Together with putting volatile content (the
+user's request, errors) at the end of the user message, this keeps a long
+stable prefix that the provider's prompt cache can reuse across calls.
+
+PromptRegistry loads the prompt files once per process and hot-reloads them
+when they change on disk, recomposing the system prompts on reload only.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from time import monotonic
+from types import MappingProxyType
+from typing import Mapping
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You are a coding assistant. Summarize what was done in 2-3 sentences. "
+    "Be specific about files created or modified."
+)
+
+
+def compose_system_prompts(prompts: dict[str, str]) -> dict[str, str]:
+    """Build the system prompt for every agent step from the raw prompt files.
+
+    Returns a dict keyed by step: generate, improve, fix, entrypoint,
+    mode_selection, summary.
+    """
+    roadmap = prompts["roadmap"]
+    philosophy = prompts["philosophy"]
+    generate = prompts["generate"].replace("FILE_FORMAT", prompts["file_format"])
+    improve = prompts["improve"].replace("FILE_FORMAT", prompts["file_format_diff"])
+    return {
+        "generate": f"{roadmap}\n\n{generate}\n\n{philosophy}",
+        "improve": f"{roadmap}\n\n{improve}\n\n{philosophy}",
+        "fix": f"{roadmap}\n\n{prompts['file_format_fix']}\n\n{philosophy}",
+        "entrypoint": prompts["entrypoint"],
+        "mode_selection": prompts["mode_selection"],
+        "summary": SUMMARY_SYSTEM_PROMPT,
+    }
+
+
+@dataclass(frozen=True)
+class PromptSet:
+    """One immutable version of the prompt files and the composed prompts."""
+
+    raw: Mapping[str, str]
+    system: Mapping[str, str]
+    version: int
+
+
+class PromptRegistry:
+    """Prompt .md files of one directory, loaded once and hot-reloaded.
+
+    current() returns the latest PromptSet. At most every `check_interval`
+    seconds it stats the directory; if a file was added, removed or changed
+    it reloads and recomposes everything, then swaps the set in one step, so
+    callers holding the previous set are unaffected. A reload that fails
+    (e.g. a prompt deleted mid-edit) keeps serving the previous set and is
+    retried on the next check.
+    """
+
+    CHECK_INTERVAL = 2.0
+
+    _shared: dict[str, "PromptRegistry"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory: str, check_interval: float = None):
+        self.directory = directory
+        self.check_interval = (
+            self.CHECK_INTERVAL if check_interval is None else check_interval
+        )
+        self._lock = threading.Lock()
+        self._stamps: dict[str, tuple[int, int]] = {}
+        self._next_check = monotonic() + self.check_interval
+        self._set = self._load(self._scan(), version=1)
+
+    @classmethod
+    def shared(cls, directory: str) -> "PromptRegistry":
+        """The process-wide registry for `directory`."""
+        key = os.path.abspath(directory)
+        with cls._shared_lock:
+            registry = cls._shared.get(key)
+            if registry is None:
+                registry = cls._shared[key] = cls(key)
+            return registry
+
+    def current(self) -> PromptSet:
+        if monotonic() < self._next_check:
+            return self._set
+        with self._lock:
+            now = monotonic()
+            if now < self._next_check:  # another thread just checked
+                return self._set
+            self._next_check = now + self.check_interval
+            try:
+                stamps = self._scan()
+                if stamps != self._stamps:
+                    self._set = self._load(stamps, self._set.version + 1)
+            except (OSError, KeyError):
+                pass
+        return self._set
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """filename -> (mtime_ns, size) for every .md prompt file."""
+        stamps = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".md") and entry.is_file():
+                    stat = entry.stat()
+                    stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def _load(self, stamps: dict[str, tuple[int, int]], version: int) -> PromptSet:
+        raw = {}
+        for filename in stamps:
+            with open(os.path.join(self.directory, filename)) as f:
+                # Strip the .md extension for the key
+                raw[filename.removesuffix(".md")] = f.read()
+        system = compose_system_prompts(raw)
+        self._stamps = stamps
+        return PromptSet(MappingProxyType(raw), MappingProxyType(system), version)
@@ -0,0 +1,190 @@
+"""
+Record/replay for LLM calls, so the agent can run offline (benchmarks, CI).
+
+ReplayAI / AsyncReplayAI override AI._complete: each completion request is
+hashed (model, messages, temperature, ...) and answered from a JSON fixture
+file. In "record" mode misses are sent to the API and saved; in "replay"
+mode a miss raises MissingFixture and nothing touches the network.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable
+
+from coding_agent.ai import AI, AsyncAI
+
+# Sandbox workdirs show up in run output (tracebacks) that is sent back to
+# the model, and differ on every run
+_TEMP_PATH = re.compile(re.escape(tempfile.gettempdir()) + r"/[^/\s'\"]+")
+
+
+class MissingFixture(KeyError):
+    """No recorded response for a request while replaying."""
+
+
+class FixtureStore:
+    """Recorded completions keyed on a hash of the request."""
+
+    MODES = ("replay", "record")
+
+    def __init__(self, path: str, mode: str = "replay"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown fixture mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._fixtures: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self._fixtures = json.load(f)
+
+    @staticmethod
+    def key(request: dict) -> str:
+        # Streaming flags don't change the answer
+        request = {
+            k: v for k, v in request.items() if k not in ("stream", "stream_options")
+        }
+        canonical = _TEMP_PATH.sub("<tmp>", json.dumps(request, sort_keys=True))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def lookup(self, request: dict) -> dict | None:
+        """The recorded fixture, or None if it should be recorded now."""
+        with self._lock:
+            fixture = self._fixtures.get(self.key(request))
+            if fixture is not None:
+                self.hits += 1
+                return fixture
+            self.misses += 1
+        if self.mode == "replay":
+            preview = request["messages"][-1].get("content", "")[:80]
+            raise MissingFixture(
+                f"No fixture for request ({preview!r}...); re-record with mode='record'"
+            )
+        return None
+
+    def record(self, request: dict, text: str, raw_usage, latency: float):
+        with self._lock:
+            self._fixtures[self.key(request)] = {
+                "text": text,
+                "usage": _usage_dict(raw_usage),
+                "latency": round(latency, 4),
+            }
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self._fixtures, indent=1, sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def __len__(self) -> int:
+        return len(self._fixtures)
+
+
+def _usage_dict(raw_usage) -> dict:
+    return {
+        "prompt_tokens": getattr(raw_usage, "prompt_tokens", 0),
+        "completion_tokens": getattr(raw_usage, "completion_tokens", 0),
+        "total_tokens": getattr(raw_usage, "total_tokens", 0),
+        "cached_tokens": AI._cached_tokens(raw_usage),
+    }
+
+
+def _raw_usage(usage: dict) -> SimpleNamespace:
+    """Rebuild an object shaped like the SDK's usage from a fixture."""
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        total_tokens=usage.get("total_tokens", 0),
+        prompt_tokens_details=SimpleNamespace(
+            cached_tokens=usage.get("cached_tokens", 0)
+        ),
+    )
+
+
+class _OfflineClient:
+    """Client used while replaying; any API call is a bug."""
+
+    def __getattr__(self, name):
+        raise RuntimeError("ReplayAI in replay mode must not call the API")
+
+
+class ReplayAI(AI):
+    """AI that answers from a FixtureStore (recording misses if asked to).
+
+    With simulate_latency the recorded API latency is slept on replay, so
+    end-to-end timings stay comparable with live runs.
+    """
+
+    def __init__(
+        self,
+        fixtures: FixtureStore,
+        simulate_latency: bool = False,
+        client=None,
+        **kwargs,
+    ):
+        if client is None and fixtures.mode == "replay":
+            client = _OfflineClient()
+        super().__init__(client=client, **kwargs)
+        self.fixtures = fixtures
+        self.simulate_latency = simulate_latency
+
+    def _complete(self, request: dict) -> tuple[str, Any]:
+        fixture = self.fixtures.lookup(request)
+        if fixture is not None:
+            if self.simulate_latency:
+                time.sleep(fixture["latency"])
+            return fixture["text"], _raw_usage(fixture["usage"])
+        started = time.perf_counter()
+        text, raw_usage = super()._complete(request)
+        self.fixtures.record(request, text, raw_usage, time.perf_counter() - started)
+        return text, raw_usage
+
+
+class AsyncReplayAI(AsyncAI):
+    """Async ReplayAI. Replayed responses are streamed in small chunks."""
+
+    # Characters per on_delta call when replaying a streamed completion
+    REPLAY_CHUNK_CHARS = 16
+
+    def __init__(
+        self,
+        fixtures: FixtureStore,
+        simulate_latency: bool = False,
+        client=None,
+        **kwargs,
+    ):
+        if client is None and fixtures.mode == "replay":
+            client = _OfflineClient()
+        super().__init__(client=client, **kwargs)
+        self.fixtures = fixtures
+        self.simulate_latency = simulate_latency
+
+    async def _complete(
+        self, request: dict, on_delta: Callable[[str], None] = None
+    ) -> tuple[str, Any]:
+        fixture = self.fixtures.lookup(request)
+        if fixture is not None:
+            if self.simulate_latency:
+                await asyncio.sleep(fixture["latency"])
+            text = fixture["text"]
+            if on_delta is not None:
+                for i in range(0, len(text or ""), self.REPLAY_CHUNK_CHARS):
+                    on_delta(text[i:i + self.REPLAY_CHUNK_CHARS])
+            return text, _raw_usage(fixture["usage"])
+        started = time.perf_counter()
+        text, raw_usage = await super()._complete(request, on_delta)
+        self.fixtures.record(request, text, raw_usage, time.perf_counter() - started)
+        return text, raw_usage
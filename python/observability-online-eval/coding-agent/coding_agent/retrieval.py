@@ -0,0 +1,219 @@
+"""
+Relevant-file selection for improve mode.
+
+A session keeps a ProjectIndex over its files: a symbol table (functions,
+classes, top-level names) plus per-file term counts for BM25 scoring. The
+index is updated incrementally, so only files whose content changed since the
+last turn are re-tokenized. When the full project doesn't fit the context
+budget, select() ranks files against the user's request and renders the best
+ones whole, and excerpts (with their original line numbers) of large files
+that only match in a few places.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable
+
+from coding_agent.files import FilesDict
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_SYMBOL_DEF = re.compile(
+    r"^\s*(?:export\s+)?(?:async\s+)?"
+    r"(?:def|class|function|func|fn|struct|interface|type|enum"
+    r"|const|let|var)\s+([A-Za-z_][A-Za-z0-9_]*)"
+    r"|^([A-Za-z_][A-Za-z0-9_]*)\s*(?::[^=]+)?=(?!=)",
+    re.MULTILINE,
+)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in into is it its "
+    "make me my of on or please self should so that the this to use we with "
+    "you your add change code file files fix update".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased identifier terms, with snake_case/camelCase parts split out."""
+    terms = []
+    for ident in _IDENT.findall(text):
+        lowered = ident.lower()
+        terms.append(lowered)
+        parts = [p.lower() for chunk in ident.split("_") for p in _CAMEL.findall(chunk)]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def extract_symbols(content: str) -> set[str]:
+    """Names defined in a file (functions, classes, top-level assignments)."""
+    return {
+        (m.group(1) or m.group(2)).lower() for m in _SYMBOL_DEF.finditer(content)
+    }
+
+
+@dataclass
+class _FileEntry:
+    stamp: int
+    terms: Counter
+    length: int
+    symbols: set[str]
+
+
+@dataclass
+class Selection:
+    context: str
+    files: list[str]  # files rendered in full
+    excerpts: list[str]  # files rendered as excerpts
+    omitted: list[str]  # files left out of the context
+
+
+@dataclass
+class ProjectIndex:
+    """Incremental BM25 + symbol index over a session's files."""
+
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+    # Score bonus for defining a symbol the request names, and for naming the file
+    SYMBOL_BOOST = 3.0
+    FILENAME_BOOST = 10.0
+    # Lines of context around each matching line in an excerpt
+    EXCERPT_RADIUS = 6
+
+    entries: dict[str, _FileEntry] = field(default_factory=dict)
+    doc_freq: Counter = field(default_factory=Counter)
+    total_length: int = 0
+
+    def update(self, files: FilesDict) -> list[str]:
+        """Bring the index in line with `files`. Returns the re-indexed names."""
+        for name in [n for n in self.entries if n not in files]:
+            self._remove(name)
+
+        changed = []
+        for name, content in files.items():
+            stamp = hash(content)
+            entry = self.entries.get(name)
+            if entry is not None and entry.stamp == stamp:
+                continue
+            if entry is not None:
+                self._remove(name)
+            terms = Counter(tokenize(name)) + Counter(tokenize(content))
+            entry = _FileEntry(
+                stamp=stamp,
+                terms=terms,
+                length=sum(terms.values()),
+                symbols=extract_symbols(content),
+            )
+            self.entries[name] = entry
+            self.doc_freq.update(terms.keys())
+            self.total_length += entry.length
+            changed.append(name)
+        return changed
+
+    def _remove(self, name: str):
+        entry = self.entries.pop(name)
+        self.doc_freq.subtract(entry.terms.keys())
+        self.total_length -= entry.length
+
+    def rank(self, query: str) -> list[tuple[str, float]]:
+        """Files ordered by relevance to `query` (highest first)."""
+        query_terms = {t for t in tokenize(query) if t not in _STOPWORDS}
+        n_docs = len(self.entries)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs or 1.0
+        lowered_query = query.lower()
+
+        scores = []
+        for name, entry in self.entries.items():
+            score = 0.0
+            norm = self.K1 * (1 - self.B + self.B * entry.length / avg_length)
+            for term in query_terms:
+                df = self.doc_freq.get(term, 0)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                tf = entry.terms.get(term, 0)
+                if tf:
+                    score += idf * tf * (self.K1 + 1) / (tf + norm)
+                if term in entry.symbols:
+                    score += self.SYMBOL_BOOST * idf
+            basename = name.rsplit("/", 1)[-1].lower()
+            if basename in lowered_query:
+                score += self.FILENAME_BOOST
+            scores.append((name, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores
+
+    def select(
+        self,
+        query: str,
+        files: FilesDict,
+        budget: int,
+        count_tokens: Callable[[str], int],
+    ) -> Selection:
+        """Render the files most relevant to `query` within `budget` tokens."""
+        self.update(files)
+        query_terms = {t for t in tokenize(query) if t not in _STOPWORDS}
+
+        chosen, excerpts, rendered = [], {}, {}
+        used = 0
+        for name, score in self.rank(query):
+            if score <= 0 and chosen:
+                break
+            full = files.to_context(only=[name])
+            cost = count_tokens(full)
+            if used + cost <= budget:
+                chosen.append(name)
+                rendered[name] = full
+                used += cost
+                continue
+            excerpt = self._excerpt(name, files[name], query_terms)
+            cost = count_tokens(excerpt) if excerpt else 0
+            if excerpt and used + cost <= budget:
+                excerpts[name] = excerpt
+                rendered[name] = excerpt
+                used += cost
+
+        # Keep project order so the prompt stays stable across turns
+        ordered = [name for name in files if name in rendered]
+        omitted = [name for name in files if name not in rendered]
+        parts = [rendered[name] for name in ordered]
+        if omitted:
+            parts.append("Other files in the project (not shown): " + ", ".join(omitted))
+        return Selection(
+            context="\n\n".join(parts),
+            files=[name for name in ordered if name not in excerpts],
+            excerpts=[name for name in ordered if name in excerpts],
+            omitted=omitted,
+        )
+
+    def _excerpt(self, name: str, content: str, query_terms: set[str]) -> str:
+        """Numbered windows around the lines that mention query terms."""
+        if not query_terms:
+            return ""
+        lines = content.split("\n")
+        hits = [
+            i for i, line in enumerate(lines)
+            if query_terms.intersection(tokenize(line))
+        ]
+        if not hits:
+            return ""
+
+        radius = self.EXCERPT_RADIUS
+        windows = []
+        for i in hits:
+            start, end = max(0, i - radius), min(len(lines), i + radius + 1)
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = end
+            else:
+                windows.append([start, end])
+
+        parts = []
+        for start, end in windows:
+            parts.append("\n".join(
+                f"{i + 1} {lines[i]}" for i in range(start, end)
+            ))
+        return f"File: {name} (excerpt)\n" + "\n...\n".join(parts)
@@ -0,0 +1,476 @@
+"""
+Pluggable session storage for the API.
+
+MemorySessionStore keeps live SessionState objects in an LRU with an optional
+TTL (single process). SQLiteSessionStore and FileSessionStore persist
+sessions so they survive restarts and can be shared by several uvicorn
+workers. Both store file contents as zlib-compressed, content-addressed
+blobs: a session record only holds filename -> hash, so files that didn't
+change between turns (or are identical across sessions) are stored once.
+prune() removes expired sessions and blobs no session references any more.
+
+Every save is a compare-and-swap on the session's version: a worker saving
+a session another worker saved since it was loaded gets SessionConflict
+instead of silently overwriting that turn.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+
+from coding_agent.agent import SessionState
+from coding_agent.compaction import CompactionState
+from coding_agent.files import FilesDict
+
+
+class SessionConflict(RuntimeError):
+    """The session was saved by someone else since it was loaded."""
+
+
+class SessionStore(ABC):
+    """Interface: load/save/delete SessionState by id."""
+
+    @abstractmethod
+    def load(self, session_id: str) -> SessionState | None: ...
+
+    @abstractmethod
+    def save(self, session: SessionState) -> None:
+        """Store the session and bump session.version.
+
+        Raises SessionConflict if the stored version is not session.version.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None: ...
+
+    def prune(self) -> int:
+        """Drop expired sessions and unused data. Returns the number removed."""
+        return 0
+
+    def get_or_create(self, session_id: str) -> SessionState:
+        session = self.load(session_id)
+        if session is None:
+            session = SessionState(session_id=session_id)
+            try:
+                self.save(session)
+            except SessionConflict:
+                # Created concurrently by another worker
+                return self.load(session_id) or self.get_or_create(session_id)
+        return session
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local LRU of live sessions, with an optional idle TTL."""
+
+    def __init__(self, max_sessions: int = 50, ttl: float = None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, tuple[SessionState, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> SessionState | None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            session, last_used = entry
+            now = time.time()
+            if self.ttl is not None and now - last_used > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (session, now)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session: SessionState) -> None:
+        # Single process: turns of a session are serialized by the caller
+        with self._lock:
+            session.version += 1
+            self._sessions[session.session_id] = (session, time.time())
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)  # evict least recently used
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def prune(self) -> int:
+        """Drop expired sessions. Returns sessions removed."""
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                session_id
+                for session_id, (_, last_used) in self._sessions.items()
+                if last_used < cutoff
+            ]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+
+class _BlobSessionStore(SessionStore):
+    """Shared record/blob (de)serialization for the persistent stores."""
+
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl
+
+    # Subclasses implement the storage primitives
+    @abstractmethod
+    def _read_record(self, session_id: str) -> tuple[dict, float, int] | None:
+        """(record, updated_at, version) or None."""
+
+    @abstractmethod
+    def _write_record(self, session_id: str, record: dict, expected: int) -> bool:
+        """Store the record at version expected + 1 if the stored version is
+        `expected` (0: no record yet). Returns False otherwise."""
+
+    @abstractmethod
+    def _read_blobs(self, hashes: set[str]) -> dict[str, bytes]: ...
+
+    @abstractmethod
+    def _write_blobs(self, blobs: dict[str, bytes]) -> None:
+        """Store blobs that aren't stored yet (existing hashes are skipped)."""
+
+    def load(self, session_id: str) -> SessionState | None:
+        found = self._read_record(session_id)
+        if found is None:
+            return None
+        record, updated_at, version = found
+        if self.ttl is not None and time.time() - updated_at > self.ttl:
+            self.delete(session_id)
+            return None
+        blobs = self._read_blobs(set(record["files"].values()))
+        files = FilesDict({
+            name: zlib.decompress(blobs[digest]).decode()
+            for name, digest in record["files"].items()
+        })
+        return SessionState(
+            session_id=session_id,
+            history=record["history"],
+            files=files,
+            compaction=CompactionState(**record["compaction"]),
+            version=version,
+        )
+
+    def save(self, session: SessionState) -> None:
+        hashes, blobs = {}, {}
+        for name, content in session.files.items():
+            data = content.encode()
+            digest = hashlib.sha256(data).hexdigest()
+            hashes[name] = digest
+            blobs[digest] = data
+        record = {
+            "history": session.history,
+            "files": hashes,
+            "compaction": asdict(session.compaction),
+        }
+        if not self._write(session.session_id, record, blobs, session.version):
+            raise SessionConflict(
+                f"Session {session.session_id!r} was modified concurrently"
+            )
+        session.version += 1
+
+    def _write(
+        self, session_id: str, record: dict, blobs: dict[str, bytes], expected: int
+    ) -> bool:
+        # Blobs first, so a record never references a missing blob
+        self._write_blobs(blobs)
+        return self._write_record(session_id, record, expected)
+
+    @staticmethod
+    def _compress(blobs: dict[str, bytes]) -> dict[str, bytes]:
+        return {digest: zlib.compress(data) for digest, data in blobs.items()}
+
+
+class SQLiteSessionStore(_BlobSessionStore):
+    """Sessions in a SQLite database (WAL mode, safe for several workers).
+
+    session_files mirrors each record's file hashes, so prune() finds
+    unreferenced blobs in SQL without decoding every record.
+    """
+
+    def __init__(self, path: str = "sessions.db", ttl: float = None):
+        super().__init__(ttl)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, record TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, version INTEGER NOT NULL DEFAULT 1)"
+            )
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")
+            }
+            if "version" not in columns:
+                # Databases created before versioned saves
+                self._conn.execute(
+                    "ALTER TABLE sessions "
+                    "ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "hash TEXT PRIMARY KEY, data BLOB NOT NULL)"
+            )
+            indexed = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'session_files'"
+            ).fetchone()
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_files ("
+                "session_id TEXT NOT NULL, digest TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, digest))"
+            )
+            if not indexed:
+                # Databases created before session_files: index them once
+                for session_id, record in self._conn.execute(
+                    "SELECT session_id, record FROM sessions"
+                ).fetchall():
+                    self._index_files(session_id, json.loads(record))
+
+    def _read_record(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record, updated_at, version FROM sessions "
+                "WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def _write_record(self, session_id, record, expected):
+        with self._lock, self._conn:
+            return self._swap_record(session_id, record, expected)
+
+    def _write(self, session_id, record, blobs, expected):
+        # One transaction, so prune() never sees the new blobs without the
+        # record that references them (and a conflict stores neither)
+        with self._lock, self._conn:
+            if not self._swap_record(session_id, record, expected):
+                return False
+            self._insert_blobs(blobs)
+            return True
+
+    def _swap_record(self, session_id: str, record: dict, expected: int) -> bool:
+        if expected == 0:
+            cursor = self._conn.execute(
+                "INSERT INTO sessions (session_id, record, updated_at, version) "
+                "VALUES (?, ?, ?, 1) ON CONFLICT(session_id) DO NOTHING",
+                (session_id, json.dumps(record), time.time()),
+            )
+        else:
+            cursor = self._conn.execute(
+                "UPDATE sessions SET record = ?, updated_at = ?, version = ? "
+                "WHERE session_id = ? AND version = ?",
+                (json.dumps(record), time.time(), expected + 1, session_id, expected),
+            )
+        if cursor.rowcount != 1:
+            return False
+        self._conn.execute(
+            "DELETE FROM session_files WHERE session_id = ?", (session_id,)
+        )
+        self._index_files(session_id, record)
+        return True
+
+    def _index_files(self, session_id: str, record: dict):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO session_files (session_id, digest) VALUES (?, ?)",
+            ((session_id, digest) for digest in set(record["files"].values())),
+        )
+
+    def _read_blobs(self, hashes):
+        if not hashes:
+            return {}
+        placeholders = ",".join("?" * len(hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT hash, data FROM blobs WHERE hash IN ({placeholders})",
+                tuple(hashes),
+            ).fetchall()
+        return dict(rows)
+
+    def _write_blobs(self, blobs):
+        with self._lock, self._conn:
+            self._insert_blobs(blobs)
+
+    def _insert_blobs(self, blobs: dict[str, bytes]):
+        if not blobs:
+            return
+        placeholders = ",".join("?" * len(blobs))
+        existing = {
+            row[0]
+            for row in self._conn.execute(
+                f"SELECT hash FROM blobs WHERE hash IN ({placeholders})",
+                tuple(blobs),
+            )
+        }
+        missing = {d: data for d, data in blobs.items() if d not in existing}
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)",
+            self._compress(missing).items(),
+        )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            self._conn.execute(
+                "DELETE FROM session_files WHERE session_id = ?", (session_id,)
+            )
+
+    def prune(self) -> int:
+        """Drop expired sessions and unreferenced blobs. Returns blobs removed."""
+        with self._lock, self._conn:
+            if self.ttl is not None:
+                cutoff = time.time() - self.ttl
+                self._conn.execute(
+                    "DELETE FROM session_files WHERE session_id IN "
+                    "(SELECT session_id FROM sessions WHERE updated_at < ?)",
+                    (cutoff,),
+                )
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE updated_at < ?", (cutoff,)
+                )
+            return self._conn.execute(
+                "DELETE FROM blobs WHERE hash NOT IN "
+                "(SELECT digest FROM session_files)"
+            ).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileSessionStore(_BlobSessionStore):
+    """Sessions as JSON files plus a blob directory, written atomically.
+
+    Record writes hold an exclusive flock on a lock file in the root, so the
+    version check and the write are atomic across processes.
+    """
+
+    PRUNE_GRACE_S = 300
+
+    def __init__(self, root: str = "sessions", ttl: float = None):
+        super().__init__(ttl)
+        self.root = Path(root)
+        self.records = self.root / "records"
+        self.blobs = self.root / "blobs"
+        self.records.mkdir(parents=True, exist_ok=True)
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.root / "records.lock"
+
+    def _record_path(self, session_id: str) -> Path:
+        # Session ids are client-supplied; never use them as paths directly
+        return self.records / f"{hashlib.sha256(session_id.encode()).hexdigest()}.json"
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blobs / digest[:2] / digest
+
+    def _read_record(self, session_id):
+        path = self._record_path(session_id)
+        try:
+            with path.open() as f:
+                record = json.load(f)
+            return record, path.stat().st_mtime, record.pop("version", 1)
+        except FileNotFoundError:
+            return None
+
+    def _write_record(self, session_id, record, expected):
+        with self.lock_path.open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            found = self._read_record(session_id)
+            if (found[2] if found else 0) != expected:
+                return False
+            data = json.dumps({**record, "version": expected + 1}).encode()
+            _atomic_write(self._record_path(session_id), data)
+            return True
+
+    def _read_blobs(self, hashes):
+        return {digest: self._blob_path(digest).read_bytes() for digest in hashes}
+
+    def _write_blobs(self, blobs):
+        missing = {
+            digest: data
+            for digest, data in blobs.items()
+            if not self._blob_path(digest).exists()
+        }
+        for digest, data in self._compress(missing).items():
+            path = self._blob_path(digest)
+            path.parent.mkdir(exist_ok=True)
+            _atomic_write(path, data)
+
+    def delete(self, session_id: str) -> None:
+        self._record_path(session_id).unlink(missing_ok=True)
+
+    def prune(self) -> int:
+        """Drop expired sessions and unreferenced blobs. Returns blobs removed.
+
+        Blobs (and temp files) written in the last PRUNE_GRACE_S are kept: a
+        concurrent save writes its blobs before the record that references
+        them.
+        """
+        started = time.time()
+        referenced = set()
+        for path in self.records.glob("*.json"):
+            try:
+                if self.ttl is not None and started - path.stat().st_mtime > self.ttl:
+                    path.unlink()
+                    continue
+                with path.open() as f:
+                    referenced.update(json.load(f)["files"].values())
+            except FileNotFoundError:
+                continue
+        removed = 0
+        for path in self.blobs.glob("*/*"):
+            if path.name in referenced:
+                continue
+            try:
+                if started - path.stat().st_mtime > self.PRUNE_GRACE_S:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _atomic_write(path: Path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def session_store_from_env() -> SessionStore:
+    """Build the store selected by SESSION_STORE (memory | sqlite | file).
+
+    SESSION_STORE_PATH sets the database file / directory, SESSION_TTL_SECONDS
+    expires idle sessions and MAX_SESSIONS caps the memory store.
+    """
+    # Empty values (e.g. "SESSION_STORE_PATH=" in .env) mean unset
+    kind = (os.getenv("SESSION_STORE") or "memory").lower()
+    ttl = os.getenv("SESSION_TTL_SECONDS")
+    ttl = float(ttl) if ttl else None
+    if kind == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_STORE_PATH") or "sessions.db", ttl)
+    if kind == "file":
+        return FileSessionStore(os.getenv("SESSION_STORE_PATH") or "sessions", ttl)
+    if kind == "memory":
+        return MemorySessionStore(int(os.getenv("MAX_SESSIONS") or "50"), ttl)
+    raise ValueError(f"Unknown SESSION_STORE: {kind!r}")
@@ -0,0 +1,64 @@
+"""
+Tiny dependency-graph scheduler for the LLM steps of a chat turn.
+
+Each step starts as soon as all of its dependencies have finished and
+receives their results as keyword arguments, so independent steps (e.g.
+entrypoint generation and the summary) overlap instead of running back to back.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+
+class StepGraph:
+    """Named steps with dependencies, run with threads or on an event loop."""
+
+    def __init__(self):
+        self._steps: dict[str, tuple[Callable[..., Any], tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: tuple[str, ...] = ()):
+        """Register a step. Dependencies must already be registered (no cycles)."""
+        for dep in deps:
+            if dep not in self._steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+        self._steps[name] = (fn, tuple(deps))
+
+    def run(self, max_workers: int = 4) -> dict[str, Any]:
+        """Run sync steps on a thread pool. Returns {step_name: result}."""
+        results: dict[str, Any] = {}
+        pending = dict(self._steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        # Threads don't inherit context variables; give each
+                        # step a copy of the caller's (e.g. the turn's prompts)
+                        context = contextvars.copy_context()
+                        running[pool.submit(context.run, fn, **kwargs)] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    async def arun(self) -> dict[str, Any]:
+        """Run async steps as tasks. Returns {step_name: result}."""
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_step(fn, deps):
+            kwargs = {dep: await tasks[dep] for dep in deps}
+            return await fn(**kwargs)
+
+        for name, (fn, deps) in self._steps.items():
+            tasks[name] = asyncio.ensure_future(run_step(fn, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return {name: task.result() for name, task in tasks.items()}
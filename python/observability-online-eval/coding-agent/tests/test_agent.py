@@ -0,0 +1,145 @@
+"""Tests for how CodingAgent runs turns and applies model output."""
+
+import asyncio
+import time
+
+import pytest
+
+from coding_agent.agent import CodingAgent, SessionState
+from coding_agent.execution import ExecutionResult
+from coding_agent.files import FilesDict
+
+
+class RecordingObservability:
+    """Stands in for CodingAgentObservability; records logged events."""
+
+    def __init__(self):
+        self.events = []
+
+    def start_span(self, parent, span_id, name):
+        return name
+
+    def end_span(self, span):
+        pass
+
+    def log_event(self, parent, event_id, name, metadata=None):
+        self.events.append((name, metadata))
+
+
+class ScriptedAI:
+    """Sync AI answering by generation name; records the calls."""
+
+    temperature = 0.1
+
+    def __init__(self, answers: dict[str, str]):
+        self.answers = answers
+        self.calls = []
+
+    def chat(self, system_prompt, user_message, *args, generation_name=None, **kwargs):
+        self.calls.append(generation_name)
+        return self.answers[generation_name], {}
+
+
+@pytest.fixture
+def agent():
+    agent = CodingAgent(ai=None, obs=RecordingObservability(), speculative_fixes=1)
+    yield agent
+    agent.sandboxes.cleanup()
+
+
+FULL_FILES = """main.py
+```python
+print("rewritten")
+```
+
+big.py
+```python
+def only_the_excerpt():
+    pass
+```
+
+new.py
+```python
+print("new")
+```
+"""
+
+
+def test_full_file_fallback_skips_partially_sent_files(agent):
+    session = SessionState(
+        session_id="s",
+        files=FilesDict({"main.py": "print(1)", "big.py": "x = 1\n" * 500}),
+    )
+    updated = agent._apply_improvement(FULL_FILES, session, {"big.py"}, span=None)
+    assert updated["main.py"] == 'print("rewritten")'
+    assert updated["new.py"] == 'print("new")'
+    assert updated["big.py"] == session.files["big.py"]
+    assert agent.obs.events == [("Rejected Full Files", {"files": ["big.py"]})]
+
+
+def test_sync_chat_runs_the_async_pipeline_with_a_sync_ai(agent):
+    agent.ai = ScriptedAI({
+        "gen_code": "main.py\n```python\nprint(1)\n```\n",
+        "gen_entrypoint": "run.sh\n```bash\npython main.py\n```\n",
+        "generate_summary": "Prints 1.",
+    })
+    session = SessionState(session_id="s")
+    result = agent.chat("print 1", session, trace=None)
+    assert result.mode == "generate"
+    assert dict(result.files) == {"main.py": "print(1)", "run.sh": "python main.py"}
+    assert result.summary == "Prints 1."
+    assert sorted(agent.ai.calls) == ["gen_code", "gen_entrypoint", "generate_summary"]
+    assert session.files is result.files
+    assert [m["role"] for m in session.history] == ["user", "assistant"]
+
+
+def _result(success: bool, stderr: str = "") -> ExecutionResult:
+    return ExecutionResult(success=success, stdout="", stderr=stderr, return_code=0 if success else 1)
+
+
+def test_pick_fix_prefers_success_then_fewest_errors(agent):
+    files, failed = FilesDict({"main.py": "0"}), _result(False, "Error")
+    noisy = (FilesDict({"main.py": "1"}), _result(False, "Error\nError\nTraceback"))
+    quiet = (FilesDict({"main.py": "2"}), _result(False, "Error"))
+    fixed = (FilesDict({"main.py": "3"}), _result(True))
+    assert agent._pick_fix([noisy, quiet, fixed], [], files, failed) is fixed
+    assert agent._pick_fix([noisy, quiet], [], files, failed) is quiet
+    # No candidate produced files: retry from the same state
+    assert agent._pick_fix([], [], files, failed) == (files, failed)
+    with pytest.raises(RuntimeError):
+        agent._pick_fix([], [RuntimeError("API down")], files, failed)
+
+
+class TemperatureAI(ScriptedAI):
+    """Answers fix_code by temperature, i.e. by speculative candidate."""
+
+    def __init__(self, fixes: dict[float, str]):
+        super().__init__({})
+        self.fixes = fixes
+
+    def chat(self, system_prompt, user_message, *args, temperature=None, **kwargs):
+        return self.fixes[round(temperature, 1)], {}
+
+
+def test_speculative_fix_takes_first_success_and_kills_the_rest(agent):
+    agent.speculative_fixes = 3
+    agent.ai = TemperatureAI({
+        0.1: "run.sh\n```bash\nsleep 30\n```\n",
+        0.4: "run.sh\n```bash\necho fixed\n```\n",
+        0.7: "run.sh\n```bash\nsleep 30\n```\n",
+    })
+    session = SessionState(session_id="s", files=FilesDict({"run.sh": "exit 1"}))
+
+    async def fix():
+        return await agent._speculative_fix(
+            "fix it", session.files, _result(False, "Error"), session, span=None, attempt=0
+        )
+
+    started = time.monotonic()
+    files, result = asyncio.run(fix())
+    # asyncio.run also waits for the losers' worker threads: they were killed
+    assert time.monotonic() - started < 10
+    assert result.success and result.stdout.strip() == "fixed"
+    assert files["run.sh"] == "echo fixed"
+    # Every candidate's sandbox went back to the pool
+    assert sorted(agent.sandboxes._idle) == ["s:fix0", "s:fix1", "s:fix2"]
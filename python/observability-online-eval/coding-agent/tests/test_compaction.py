@@ -0,0 +1,121 @@
+"""Tests for incremental history compaction."""
+
+from coding_agent.ai import AI
+from coding_agent.compaction import CompactionState, TokenCounter
+
+
+class CharCounter(TokenCounter):
+    """One token per 4 characters (no tokenizer); records what it counted."""
+
+    def __init__(self):
+        super().__init__("test")
+        self._encoding_loaded = True
+        self.counted = []
+
+    def count(self, text: str) -> int:
+        self.counted.append(text)
+        return super().count(text)
+
+
+class SummarizingAI(AI):
+    """AI whose completions are canned; records summary requests."""
+
+    COMPACTION_THRESHOLD = 100
+    KEEP_RECENT = 2
+
+    def __init__(self):
+        super().__init__(client=object())
+        self.counter = CharCounter()
+        self.summary_requests = []
+
+    def _complete(self, request):
+        if request.get("max_tokens") == 2000:
+            self.summary_requests.append(request["messages"][1]["content"])
+            return f"summary {len(self.summary_requests)}", None
+        return "ok", None
+
+
+def _turns(start: int, count: int) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 40}
+        for i in range(start, start + count)
+    ]
+
+
+def test_history_tokens_only_counts_new_messages():
+    counter = CharCounter()
+    state = CompactionState()
+    history = _turns(0, 4)
+    total = state.history_tokens(history, counter)
+    assert total == sum(counter.count_message(m) for m in history)
+    assert state.counted == 4
+
+    counter.counted.clear()
+    history += _turns(4, 2)
+    state.history_tokens(history, counter)
+    assert counter.counted == [m["content"] for m in history[4:]]
+
+
+def test_history_replaced_resets_state():
+    counter = CharCounter()
+    state = CompactionState(summary="old", folded=2, counted=6, tokens=50)
+    history = _turns(0, 2)
+    assert state.history_tokens(history, counter) == sum(
+        counter.count_message(m) for m in history
+    )
+    assert (state.summary, state.folded) == ("", 0)
+
+
+def test_fold_moves_tokens_out_of_the_window():
+    counter = CharCounter()
+    state = CompactionState()
+    history = _turns(0, 4)
+    total = state.history_tokens(history, counter)
+    state.fold(history, 2, "summary", counter)
+    assert state.folded == 2
+    assert state.summary == "summary"
+    assert state.tokens == total - sum(counter.count_message(m) for m in history[:2])
+
+
+def test_below_threshold_nothing_is_summarized():
+    ai = SummarizingAI()
+    state = CompactionState()
+    ai.chat("system", "hi", _turns(0, 2), compaction=state)
+    assert ai.summary_requests == []
+    assert state.folded == 0
+
+
+def test_compaction_folds_only_newly_aged_out_turns():
+    ai = SummarizingAI()
+    state = CompactionState()
+    history = _turns(0, 10)
+    ai.chat("system", "next", history, compaction=state)
+    # Everything but the KEEP_RECENT most recent messages is folded once
+    assert state.folded == 8
+    assert len(ai.summary_requests) == 1
+    assert "message 0" in ai.summary_requests[0]
+    assert "message 8" not in ai.summary_requests[0]
+
+    history += _turns(10, 6)
+    ai.chat("system", "next", history, compaction=state)
+    assert state.folded == 14
+    # The second fold sends the previous summary and only the new turns
+    request = ai.summary_requests[1]
+    assert request.startswith("Current summary:\nsummary 1")
+    assert "message 7" not in request
+    assert "message 8" in request and "message 13" in request
+    assert "message 14" not in request
+    assert state.summary == "summary 2"
+
+
+def test_failed_summary_keeps_previous_summary():
+    ai = SummarizingAI()
+    state = CompactionState(summary="earlier")
+
+    def failing(request):
+        raise RuntimeError("API down")
+
+    ai._complete = failing
+    history = _turns(0, 10)
+    ai._maybe_compact("system", "next", history, state)
+    assert (state.summary, state.folded) == ("earlier", 8)
@@ -0,0 +1,98 @@
+"""Tests for subprocess execution of generated code."""
+
+import os
+import stat
+import time
+from pathlib import Path
+
+import pytest
+
+from coding_agent.execution import ExecutionEnvironment, SandboxPool, VenvCache
+from coding_agent.files import FilesDict
+
+
+@pytest.fixture
+def env():
+    env = ExecutionEnvironment()
+    yield env
+    env.cleanup()
+
+
+def run(env: ExecutionEnvironment, script: str, timeout: int = 5):
+    env.write_files(FilesDict({"run.sh": script}))
+    return env.execute(timeout=timeout)
+
+
+def test_captures_output_and_exit_code(env):
+    result = run(env, "echo out; echo err >&2; exit 3")
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert result.return_code == 3
+    assert not result.success
+
+
+def test_timeout_kills_process_group(env):
+    started = time.monotonic()
+    result = run(env, "sleep 30 & sleep 30", timeout=1)
+    assert time.monotonic() - started < 5
+    assert result.timed_out and not result.success
+
+
+def test_timeout_after_pipes_closed(env):
+    # Closing stdout/stderr must not let the process outlive the deadline
+    started = time.monotonic()
+    result = run(env, "exec >/dev/null 2>&1; sleep 30", timeout=1)
+    assert time.monotonic() - started < 5
+    assert result.timed_out and not result.success
+
+
+def test_cancel_before_start_kills_the_command():
+    pool = SandboxPool(cache_venvs=False)
+    env = pool.acquire("s")
+    try:
+        env.cancel()  # e.g. a speculative fix that lost before it ran
+        started = time.monotonic()
+        result = run(env, "sleep 30", timeout=20)
+        assert time.monotonic() - started < 5
+        assert not result.success
+        pool.release(env)
+        # Handed out again: no longer cancelled
+        assert run(pool.acquire("s"), "echo ok").success
+    finally:
+        env.cleanup()
+
+
+def test_rlimits_applied():
+    env = ExecutionEnvironment(memory_limit_mb=512, cpu_limit_s=7)
+    try:
+        result = run(env, "ulimit -S -t; ulimit -H -t; ulimit -v")
+    finally:
+        env.cleanup()
+    assert result.stdout.split() == ["7", "8", str(512 * 1024)]
+
+
+def test_venv_cache_is_private_and_read_only(tmp_path):
+    cache = VenvCache(str(tmp_path / "venvs"))
+    assert stat.S_IMODE(os.stat(cache.root).st_mode) == 0o700
+    path = cache.get("# no packages\n")
+    assert path == cache.get("")  # comments and blanks don't change the key
+    site = next(path.glob("lib/python*/site-packages"))
+    for target in (path, site, next(site.iterdir())):
+        assert not os.stat(target).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def test_venv_cache_falls_back_to_private_venv(env, tmp_path):
+    env.venv_cache = VenvCache(str(tmp_path / "venvs"))
+    env.write_files(FilesDict({"requirements.txt": "-e ./missing\n"}))
+    assert env.venv == Path(env.workdir) / ".venv"
+    assert not any(env.venv_cache.root.iterdir())
+
+
+def test_venv_cache_evicts_idle_venvs(tmp_path, monkeypatch):
+    cache = VenvCache(str(tmp_path / "venvs"))
+    monkeypatch.setattr(VenvCache, "MAX_VENVS", 1)
+    monkeypatch.setattr(VenvCache, "EVICT_IDLE_S", -60)
+    monkeypatch.setattr(VenvCache, "_build", lambda self, path, _: path.mkdir() or True)
+    first = cache.get("")
+    second = cache.get("# other\nsetuptools\n")
+    assert not first.exists() and second.exists()
@@ -0,0 +1,109 @@
+"""Tests for diff application and FilesDict."""
+
+from coding_agent.files import FilesDict, apply_diffs, parse_diffs
+
+
+def _diff(filename: str, *hunks: tuple[int, list[tuple[str, str]]]) -> dict:
+    return {
+        "filename_pre": filename,
+        "filename_post": filename,
+        "hunks": [{"hunk_start": start, "lines": lines} for start, lines in hunks],
+        "is_new": False,
+    }
+
+
+def test_new_file_diff():
+    diffs = parse_diffs("```diff\n--- /dev/null\n+++ new.py\n@@ -0,0 +1,2 @@\n+a\n+b\n```\n")
+    files = apply_diffs(diffs, FilesDict())
+    assert files["new.py"] == "a\nb"
+
+
+def test_apply_diffs_tolerates_wrong_line_numbers():
+    source = FilesDict({"a.py": "\n".join(f"l{i}" for i in range(100))})
+    # Header says line 10, content is at line 51
+    diff = _diff("a.py", (10, [(" ", "l49"), ("-", "l50"), ("+", "X"), (" ", "l51")]))
+    lines = apply_diffs([diff], source)["a.py"].split("\n")
+    assert lines[49:52] == ["l49", "X", "l51"]
+    assert len(lines) == 100
+
+
+def test_apply_diffs_ignores_whitespace_in_context():
+    source = FilesDict({"a.py": "def f():\n    return 1\n"})
+    diff = _diff("a.py", (1, [(" ", "def f():"), ("-", "return 1"), ("+", "    return 2")]))
+    assert apply_diffs([diff], source)["a.py"] == "def f():\n    return 2\n"
+
+
+def test_apply_diffs_skips_and_reports_unanchored_hunk():
+    source = FilesDict({"a.py": "a\nb\nc"})
+    diff = _diff("a.py", (2, [("-", "missing"), ("+", "x")]))
+    rejected = []
+    assert apply_diffs([diff], source, rejected)["a.py"] == "a\nb\nc"
+    assert rejected == [{"filename": "a.py", "hunk_start": 2}]
+
+
+def test_apply_diffs_blank_line_before_fence():
+    # The blank line before the closing fence must not be taken as context
+    source = FilesDict({"a.py": "def f():\n    return 1"})
+    response = "```diff\n--- a.py\n+++ a.py\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 2\n\n```\n"
+    rejected = []
+    assert apply_diffs(parse_diffs(response), source, rejected)["a.py"] == "def f():\n    return 2"
+    assert rejected == []
+
+    diff = _diff("a.py", (1, [(" ", "def f():"), ("-", "    return 1"), ("+", "    return 2"), (" ", "")]))
+    assert apply_diffs([diff], source)["a.py"] == "def f():\n    return 2"
+
+
+def test_apply_diffs_out_of_order_hunks():
+    # The second hunk's header points before the first hunk and its only
+    # match is already consumed; it must not be applied behind the cursor
+    body = [f"l{i}" for i in range(200)]
+    source = FilesDict({"a.py": "\n".join(["X", *body, "X", "tail"])})
+    diff = _diff("a.py", (202, [("-", "X"), ("+", "Y")]), (1, [("-", "X"), ("+", "Z")]))
+    lines = apply_diffs([diff], source)["a.py"].split("\n")
+    assert lines == ["X", *body, "Y", "tail"]
+
+
+def test_files_dict_versions():
+    files = FilesDict({"a.py": "a"})
+    snapshot = files.versions()
+    files["a.py"] = "a"  # unchanged content keeps the version
+    assert files.changed_since(snapshot) == []
+    files["a.py"] = "b"
+    files["b.py"] = "b"
+    assert files.changed_since(snapshot) == ["a.py", "b.py"]
+
+    version = files.version("a.py")
+    del files["a.py"]
+    assert files.version("a.py") == 0
+    files["a.py"] = "b"
+    assert files.version("a.py") > version
+
+
+def test_files_dict_context_follows_every_mutation():
+    files = FilesDict({"a.py": "a", "b.py": "b"})
+    assert files.to_context() == "File: a.py\n1 a\n\nFile: b.py\n1 b"
+
+    files |= {"a.py": "x"}
+    assert files.to_context() == "File: a.py\n1 x\n\nFile: b.py\n1 b"
+    files.update(b="y")
+    assert files.to_context().endswith("File: b\n1 y")
+    assert files.popitem() == ("b", "y")
+    files.pop("b.py")
+    assert files.to_context() == "File: a.py\n1 x"
+    files.setdefault("c.py", "c")
+    merged = files | {"a.py": "z"}
+    assert isinstance(merged, FilesDict)
+    assert merged.to_context() == "File: a.py\n1 z\n\nFile: c.py\n1 c"
+    assert files.to_context() == "File: a.py\n1 x\n\nFile: c.py\n1 c"
+    files.clear()
+    assert files.to_context() == ""
+
+
+def test_files_dict_context_only():
+    files = FilesDict({"a.py": "a", "b.py": "b", "c.py": "c"})
+    # Project order, unknown names ignored
+    assert files.to_context(only=["c.py", "a.py", "x.py"]) == "File: a.py\n1 a\n\nFile: c.py\n1 c"
+    copy = files.copy()
+    copy["c.py"] = "d"
+    assert copy.to_context(only=["c.py"]) == "File: c.py\n1 d"
+    assert files.to_context(only=["c.py"]) == "File: c.py\n1 c"
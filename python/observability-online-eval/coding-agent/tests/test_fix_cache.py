@@ -0,0 +1,72 @@
+"""Tests for the debug-loop fix cache."""
+
+import pytest
+
+from coding_agent.execution import ExecutionResult
+from coding_agent.files import FilesDict
+from coding_agent.fix_cache import FixCache, FixTracker
+
+BROKEN = FilesDict({"main.py": "import sys\nprint(1 / 0)\n", "run.sh": "python main.py"})
+FIXED = FilesDict({"main.py": "import sys\nprint(1)\n", "run.sh": "python main.py"})
+FAILED = ExecutionResult(
+    success=False,
+    stdout="",
+    stderr=(
+        "Traceback (most recent call last):\n"
+        '  File "/tmp/coding_agent_x/main.py", line 2, in <module>\n'
+        "ZeroDivisionError: division by zero\n"
+    ),
+    return_code=1,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    cache = FixCache(path=str(tmp_path / "fixes.db") if request.param == "sqlite" else None)
+    yield cache
+    cache.close()
+
+
+def _learn(cache: FixCache, scope: str):
+    tracker = FixTracker(cache, scope=scope)
+    assert tracker.lookup(FAILED, BROKEN) is None
+    tracker.succeeded(FIXED)
+
+
+def test_replays_within_scope(cache):
+    _learn(cache, "session-a")
+    assert FixTracker(cache, scope="session-a").lookup(FAILED, BROKEN) == FIXED
+    assert len(cache) == 1
+
+
+def test_never_replays_across_scopes(cache):
+    _learn(cache, "session-a")
+    assert FixTracker(cache, scope="session-b").lookup(FAILED, BROKEN) is None
+
+
+def test_sqlite_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "fixes.db")
+    first, second = FixCache(path=path), FixCache(path=path)
+    try:
+        _learn(first, "s")
+        _learn(second, "t")
+        assert len(first) == len(second) == 2
+        key = second.key(FAILED, BROKEN, "s")
+        assert second.replay(key, BROKEN) == FIXED
+        first.discard(key)
+        assert second.replay(key, BROKEN) is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FixCache(max_entries=2, path=str(tmp_path / "fixes.db"))
+    try:
+        for scope in ("a", "b", "c"):
+            _learn(cache, scope)
+        assert len(cache) == 2
+        assert cache.replay(cache.key(FAILED, BROKEN, "a"), BROKEN) is None
+        assert cache.replay(cache.key(FAILED, BROKEN, "c"), BROKEN) == FIXED
+    finally:
+        cache.close()
@@ -0,0 +1,118 @@
+"""Tests for tiered mode detection (rules, naive Bayes, LLM fallback)."""
+
+import asyncio
+import json
+
+import pytest
+
+from coding_agent.agent import CodingAgent, SessionState, _turn_prompts
+from coding_agent.files import FilesDict
+from coding_agent.mode_detection import ModeClassifier
+
+
+@pytest.mark.parametrize("message, mode", [
+    ("Traceback (most recent call last):\n  File 'main.py'", "debug"),
+    ("I get ValueError: bad input when I submit", "debug"),
+    ("run it", "debug"),
+    ("the server doesn't start", "debug"),
+    ("let's start over", "generate"),
+    ("rewrite the whole project from scratch", "generate"),
+    ("add a --verbose flag", "improve"),
+])
+def test_rules_decide_unambiguous_messages(message, mode):
+    decision = ModeClassifier().classify(message)
+    assert (decision.mode, decision.tier, decision.confidence) == (mode, "rules", 1.0)
+
+
+@pytest.mark.parametrize("message", [
+    # Not requests to replace the project
+    "build a brand new project layout for the existing code",
+    "implement the parser from scratch instead of using the library",
+    # Weak debug hints: left to the classifier / LLM
+    "show a stack trace page when a request fails",
+    "log every crash to sentry",
+    # Conflicting rules
+    "add logging, it crashes on start",
+])
+def test_ambiguous_messages_skip_rules(message):
+    classifier = ModeClassifier()
+    assert classifier._rules(message)[1] < classifier.MIN_CONFIDENCE
+    assert classifier.classify(message).mode is None
+
+
+def test_classifier_needs_examples_then_decides():
+    classifier = ModeClassifier()
+    message = "show a stack trace page when a request fails"
+    classifier.train([("make a page showing the stack trace", "improve")] * 10)
+    # Too few examples: still goes to the LLM
+    assert classifier.classify(message).mode is None
+
+    classifier.train(
+        [("a page showing a stack trace for failed requests", "improve")] * 30
+        + [("why is the output empty", "debug")] * 20
+    )
+    decision = classifier.classify(message)
+    assert (decision.mode, decision.tier) == ("improve", "classifier")
+    assert decision.confidence >= classifier.MIN_CONFIDENCE
+
+
+def test_learn_appends_examples_and_reloads(tmp_path):
+    path = tmp_path / "examples.jsonl"
+    classifier = ModeClassifier(str(path))
+    classifier.learn("why is the output empty", "debug")
+    classifier.learn("ignored", "unknown")
+    assert [json.loads(line) for line in path.read_text().splitlines()] == [
+        {"message": "why is the output empty", "mode": "debug"}
+    ]
+    assert ModeClassifier(str(path))._class_counts == {"debug": 1}
+
+
+class _Observability:
+    def start_span(self, parent, span_id, name):
+        return object()
+
+    def end_span(self, span):
+        pass
+
+    def log_event(self, parent, event_id, name, metadata=None):
+        pass
+
+
+class _ModeAI:
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.calls = 0
+
+    def chat(self, system_prompt, user_msg, **kwargs):
+        self.calls += 1
+        return self.answer, None
+
+
+@pytest.fixture
+def agent():
+    agent = CodingAgent(ai=_ModeAI("debug"), obs=_Observability())
+    yield agent
+    agent.sandboxes.cleanup()
+
+
+def _detect(agent: CodingAgent, message: str) -> str:
+    session = SessionState(session_id="s", files=FilesDict({"main.py": "print(1)"}))
+
+    async def detect():
+        token = _turn_prompts.set(agent.prompt_registry.current())
+        try:
+            return await agent._detect_mode(message, session, trace=None)
+        finally:
+            _turn_prompts.reset(token)
+
+    return asyncio.run(detect())
+
+
+def test_llm_decides_when_rules_and_classifier_are_unsure(agent):
+    assert _detect(agent, "run it") == "debug"
+    assert agent.ai.calls == 0
+
+    assert _detect(agent, "the stack trace looks odd") == "debug"
+    assert agent.ai.calls == 1
+    # The LLM's label becomes a training example
+    assert agent.mode_classifier._class_counts == {"debug": 1}
@@ -0,0 +1,123 @@
+"""Tests for the background trace exporter and blob deduplication."""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("maxim")
+
+import coding_agent.observability as observability  # noqa: E402
+from coding_agent.observability import (  # noqa: E402
+    CodingAgentObservability,
+    _Exporter,
+)
+
+
+def test_submit_never_blocks_when_full():
+    exporter = _Exporter(max_queue=2, batch_size=8)
+    release = threading.Event()
+    exporter.submit(release.wait)  # keeps the worker busy
+    time.sleep(0.05)
+    order = []
+    try:
+        started = time.monotonic()
+        assert exporter.submit(lambda: order.append("generation 1"))
+        assert exporter.submit(lambda: order.append("generation 2"))
+        assert not exporter.submit(lambda: order.append("dropped"))
+        assert exporter.submit(lambda: order.append("span end"), critical=True)
+        assert time.monotonic() - started < 0.1
+    finally:
+        release.set()
+    assert exporter.flush(timeout=5)
+    assert order == ["generation 1", "generation 2", "span end"]
+    assert exporter.stats()["dropped"] == 1
+    exporter.close(timeout=5)
+
+
+class _Node:
+    """Stands in for Maxim traces, spans and generations."""
+
+    def __init__(self, generations: list):
+        self.generations = generations
+
+    def trace(self, config):
+        return self
+
+    def span(self, config):
+        return self
+
+    def generation(self, config):
+        self.generations.append(config)
+        return self
+
+    def add_attachment(self, attachment):
+        pass
+
+    def result(self, result):
+        pass
+
+
+class _Maxim:
+    def __init__(self):
+        self.generations = []
+
+    def logger(self):
+        return _Node(self.generations)
+
+
+@pytest.fixture
+def obs(monkeypatch):
+    monkeypatch.setattr(observability, "Maxim", _Maxim)
+    obs = CodingAgentObservability()
+    yield obs
+    obs.exporter.close(timeout=5)
+
+
+def _log(obs, parent, gen_id: str, *contents: str):
+    obs.log_generation(
+        parent, gen_id, "gen", "model",
+        [{"role": "user", "content": c} for c in contents],
+        "ok", usage={},
+    )
+
+
+def _logged(obs) -> list[list[str]]:
+    assert obs.exporter.flush(timeout=5)
+    return [[m["content"] for m in g["messages"]] for g in obs.maxim.generations]
+
+
+def test_repeated_content_is_logged_once_per_session(obs):
+    prompt, short = "p" * 600, "short message"
+    trace = obs.start_trace("t1", "turn", "hi", session_id="s1")
+    _log(obs, trace, "g1", prompt, short)
+    _log(obs, obs.start_span(trace, "sp", "step"), "g2", prompt, short)
+    # Another session logs it in full again
+    _log(obs, obs.start_trace("t2", "turn", "hi", session_id="s2"), "g3", prompt)
+
+    first, second, other = _logged(obs)
+    assert first == [prompt, short]
+    assert second[0].startswith("[blob sha256:") and "generation g1" in second[0]
+    assert second[1] == short  # too short to deduplicate
+    assert other == [prompt]
+    assert obs.stats()["deduplicated_blobs"] == 1
+    assert obs.stats()["deduplicated_chars"] == len(prompt)
+
+
+def test_dedup_scopes_and_blobs_are_bounded(obs):
+    obs.MAX_BLOBS_PER_SCOPE = 2
+    obs.MAX_DEDUP_SCOPES = 1
+    trace = obs.start_trace("t1", "turn", "hi", session_id="s1")
+    a, b, c = "a" * 600, "b" * 600, "c" * 600
+    _log(obs, trace, "g1", a)
+    _log(obs, trace, "g2", b)
+    _log(obs, trace, "g3", c)  # evicts a, the least recently used
+    _log(obs, trace, "g4", a, c)
+    contents = _logged(obs)[-1]
+    assert contents[0] == a
+    assert "generation g3" in contents[1]
+
+    # A new scope evicts the old one
+    _log(obs, obs.start_trace("t2", "turn", "hi", session_id="s2"), "g5", b)
+    _log(obs, trace, "g6", c)
+    assert _logged(obs)[-1] == [c]
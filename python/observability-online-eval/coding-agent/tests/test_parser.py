@@ -0,0 +1,68 @@
+"""Tests for response parsing (whole responses and streamed chunks)."""
+
+from coding_agent.files import (
+    ChatStreamParser,
+    parse_chat_to_files,
+    parse_diffs,
+    parse_response,
+)
+
+RESPONSE = """Here is the code.
+
+main.py
+```python
+print("hi")
+```
+
+```diff
+--- main.py
++++ main.py
+@@ -1,1 +1,2 @@
+ print("hi")
++print("bye")
+```
+"""
+
+
+def _stream(text: str, size: int = 7) -> list[dict]:
+    parser = ChatStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return events + parser.close()
+
+
+def test_parse_chat_to_files():
+    files = parse_chat_to_files(RESPONSE)
+    assert dict(files) == {"main.py": 'print("hi")'}
+
+
+def test_parse_chat_to_files_keeps_empty_files():
+    response = "pkg/__init__.py\n```python\n\n```\npkg/main.py\n```python\nx = 1\n```\n"
+    assert dict(parse_chat_to_files(response)) == {"pkg/__init__.py": "", "pkg/main.py": "x = 1"}
+
+
+def test_parse_diffs():
+    (diff,) = parse_diffs(RESPONSE)
+    assert diff["filename_pre"] == diff["filename_post"] == "main.py"
+    assert not diff["is_new"]
+    assert diff["hunks"] == [
+        {"hunk_start": 1, "lines": [(" ", 'print("hi")'), ("+", 'print("bye")')]}
+    ]
+
+
+def test_parse_diffs_drops_blank_lines_before_fence():
+    response = "```diff\n--- a.py\n+++ a.py\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 2  \n\n \n```\n"
+    (diff,) = parse_diffs(response)
+    assert diff["hunks"][0]["lines"] == [
+        (" ", "def f():"), ("-", "    return 1"), ("+", "    return 2")
+    ]
+
+
+def test_stream_parser_matches_whole_response():
+    assert _stream(RESPONSE) == parse_response(RESPONSE)
+
+
+def test_stream_parser_emits_empty_file():
+    events = _stream("pkg/__init__.py\n```python\n\n```\n", size=3)
+    assert events == [{"type": "file", "path": "pkg/__init__.py", "content": ""}]
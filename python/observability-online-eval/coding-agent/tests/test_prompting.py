@@ -0,0 +1,97 @@
+"""Tests for prompt composition and hot reload."""
+
+import os
+import shutil
+
+import pytest
+
+from coding_agent.agent import PROMPTS_DIR, CodingAgent, SessionState
+from coding_agent.prompting import PromptRegistry
+
+
+@pytest.fixture
+def prompts_dir(tmp_path):
+    directory = tmp_path / "prompts"
+    shutil.copytree(PROMPTS_DIR, directory)
+    return directory
+
+
+def _edit(path, text: str):
+    path.write_text(text)
+    # Make the change visible even on filesystems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_reload_recomposes_changed_prompts(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    first = registry.current()
+    assert first.version == 1
+    assert registry.current() is first  # nothing changed
+
+    _edit(prompts_dir / "roadmap.md", "NEW ROADMAP")
+    second = registry.current()
+    assert second.version == 2
+    assert second.system["generate"].startswith("NEW ROADMAP")
+    assert second.system["fix"].startswith("NEW ROADMAP")
+    # Holders of the previous set are unaffected
+    assert not first.system["generate"].startswith("NEW ROADMAP")
+
+
+def test_failed_reload_keeps_previous_prompts(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    roadmap = (prompts_dir / "roadmap.md").read_text()
+    (prompts_dir / "roadmap.md").unlink()  # mid-edit
+    assert registry.current().version == 1
+    _edit(prompts_dir / "roadmap.md", roadmap + "\nv2")
+    assert registry.current().version == 2
+
+
+def test_check_interval_limits_rescans(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=3600)
+    _edit(prompts_dir / "roadmap.md", "NEW ROADMAP")
+    assert registry.current().version == 1
+
+
+def test_shared_registry_per_directory(prompts_dir):
+    assert PromptRegistry.shared(str(prompts_dir)) is PromptRegistry.shared(
+        str(prompts_dir) + "/."
+    )
+
+
+class _Observability:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class EditingAI:
+    """Sync AI that edits a prompt file during the first call of a turn."""
+
+    temperature = 0.1
+
+    def __init__(self, prompts_dir):
+        self.prompts_dir = prompts_dir
+        self.system_prompts = {}
+
+    def chat(self, system_prompt, user_message, *args, generation_name=None, **kwargs):
+        self.system_prompts[generation_name] = system_prompt
+        if generation_name == "gen_code":
+            _edit(self.prompts_dir / "entrypoint.md", "EDITED ENTRYPOINT PROMPT")
+            return "main.py\n```python\nprint(1)\n```\n", {}
+        if generation_name == "gen_entrypoint":
+            return "run.sh\n```bash\npython main.py\n```\n", {}
+        return "Done.", {}
+
+
+def test_turn_uses_one_prompt_version(prompts_dir):
+    agent = CodingAgent(ai=EditingAI(prompts_dir), obs=_Observability())
+    agent.prompt_registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    try:
+        original = agent.prompt_registry.current().system["entrypoint"]
+        agent.chat("print 1", SessionState(session_id="s"), trace=None)
+        # Edited mid-turn: the turn keeps the prompts it started with
+        assert agent.ai.system_prompts["gen_entrypoint"] == original
+        # The next turn picks the edit up
+        assert agent.system_prompts["entrypoint"] == "EDITED ENTRYPOINT PROMPT"
+    finally:
+        agent.sandboxes.cleanup()
@@ -0,0 +1,170 @@
+"""Tests for the session stores."""
+
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from coding_agent.agent import SessionState
+from coding_agent.files import FilesDict
+from coding_agent.sessions import (
+    FileSessionStore,
+    MemorySessionStore,
+    SessionConflict,
+    SessionStore,
+    SQLiteSessionStore,
+    session_store_from_env,
+)
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    else:
+        store = FileSessionStore(str(tmp_path / "sessions"))
+        store.PRUNE_GRACE_S = 0
+    yield store
+    store.close()
+
+
+def _session(session_id: str, **files: str) -> SessionState:
+    return SessionState(session_id=session_id, files=FilesDict(files))
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_round_trip(store):
+    store.save(_session("a", **{"main.py": "print(1)"}))
+    loaded = store.load("a")
+    assert dict(loaded.files) == {"main.py": "print(1)"}
+    assert store.load("missing") is None
+
+
+def test_save_rejects_stale_version(store):
+    session = store.get_or_create("a")
+    assert session.version == 1
+    other = store.load("a")  # e.g. another worker's turn
+
+    other.files["main.py"] = "theirs"
+    store.save(other)
+    session.files["main.py"] = "mine"
+    with pytest.raises(SessionConflict):
+        store.save(session)
+    loaded = store.load("a")
+    assert (dict(loaded.files), loaded.version) == ({"main.py": "theirs"}, 2)
+
+    # A second create of the same id conflicts too
+    with pytest.raises(SessionConflict):
+        store.save(_session("a"))
+
+
+def test_concurrent_saves_only_one_wins(store):
+    store.get_or_create("a")
+    sessions = [store.load("a") for _ in range(8)]
+    results = []
+
+    def save(session):
+        try:
+            store.save(session)
+            results.append("saved")
+        except SessionConflict:
+            results.append("conflict")
+
+    threads = [threading.Thread(target=save, args=(s,)) for s in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == ["conflict"] * 7 + ["saved"]
+    assert store.load("a").version == 2
+
+
+def test_memory_store_bumps_version():
+    store = MemorySessionStore()
+    session = store.get_or_create("a")
+    store.save(session)
+    assert store.load("a").version == 2
+
+
+def test_sqlite_store_migrates_unversioned_database(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, "
+        "record TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO sessions VALUES ('a', ?, ?)",
+        ('{"history": [], "files": {}, "compaction": {}}', time.time()),
+    )
+    conn.commit()
+    conn.close()
+
+    store = SQLiteSessionStore(path)
+    try:
+        session = store.load("a")
+        assert session.version == 1
+        store.save(session)
+        assert store.load("a").version == 2
+    finally:
+        store.close()
+
+
+def test_sqlite_store_indexes_existing_records_for_prune(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path)
+    store.save(_session("a", **{"main.py": "kept"}))
+    store.save(_session("b", **{"main.py": "orphan"}))
+    with store._conn:
+        store._conn.execute("DROP TABLE session_files")
+        store._conn.execute("DELETE FROM sessions WHERE session_id = 'b'")
+    store.close()
+
+    store = SQLiteSessionStore(path)
+    try:
+        assert store.prune() == 1
+        assert dict(store.load("a").files) == {"main.py": "kept"}
+    finally:
+        store.close()
+
+
+def test_prune_removes_unreferenced_blobs(store):
+    session = _session("a", **{"main.py": "v1", "util.py": "shared"})
+    store.save(session)
+    session.files["main.py"] = "v2"
+    store.save(session)
+    store.save(_session("b", **{"util.py": "shared"}))
+    time.sleep(0.01)
+    assert store.prune() == 1  # only "v1" is unreferenced
+    assert dict(store.load("a").files) == {"main.py": "v2", "util.py": "shared"}
+    store.delete("a")
+    assert store.prune() == 1
+    assert dict(store.load("b").files) == {"util.py": "shared"}
+
+
+def test_prune_drops_expired_sessions(store):
+    store.ttl = 0.05
+    store.save(_session("old", **{"main.py": "old"}))
+    time.sleep(0.1)
+    store.save(_session("new", **{"main.py": "new"}))
+    assert store.prune() == 1
+    assert store.load("old") is None
+    assert store.load("new") is not None
+
+
+def test_empty_store_path_uses_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SESSION_STORE", "sqlite")
+    monkeypatch.setenv("SESSION_STORE_PATH", "")
+    store = session_store_from_env()
+    try:
+        store.save(_session("a"))
+    finally:
+        store.close()
+    assert os.path.exists(tmp_path / "sessions.db")
@@ -0,0 +1,115 @@
+"""Tests for the StepGraph scheduler."""
+
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from coding_agent.steps import StepGraph
+
+_value = contextvars.ContextVar("value", default=None)
+
+
+def test_unknown_dependency_is_rejected():
+    graph = StepGraph()
+    with pytest.raises(ValueError):
+        graph.add("summary", lambda files: files, deps=("files",))
+
+
+def test_run_passes_results_and_overlaps_independent_steps():
+    graph = StepGraph()
+    started = {}
+    both_running = threading.Barrier(2, timeout=5)
+
+    def step(name, result):
+        def fn(**deps):
+            started[name] = deps
+            if name in ("entrypoint", "summary"):
+                both_running.wait()  # deadlocks unless they run concurrently
+            return result
+        return fn
+
+    graph.add("files", step("files", {"a.py": "1"}))
+    graph.add("entrypoint", step("entrypoint", "run.sh"), deps=("files",))
+    graph.add("summary", step("summary", "done"), deps=("files",))
+    graph.add("final", step("final", "ok"), deps=("entrypoint", "summary"))
+
+    results = graph.run()
+    assert results == {
+        "files": {"a.py": "1"}, "entrypoint": "run.sh", "summary": "done", "final": "ok"
+    }
+    assert started["entrypoint"] == {"files": {"a.py": "1"}}
+    assert started["final"] == {"entrypoint": "run.sh", "summary": "done"}
+
+
+def test_run_propagates_step_errors():
+    graph = StepGraph()
+    graph.add("files", lambda: {})
+    graph.add("broken", lambda files: 1 / 0, deps=("files",))
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+
+
+def test_run_steps_see_the_callers_context():
+    graph = StepGraph()
+    graph.add("files", lambda: _value.get())
+    token = _value.set("turn prompts")
+    try:
+        assert graph.run() == {"files": "turn prompts"}
+    finally:
+        _value.reset(token)
+
+
+def test_arun_orders_steps_by_dependencies():
+    order = []
+
+    def step(name, delay=0.0):
+        async def fn(**deps):
+            order.append(("start", name, tuple(sorted(deps))))
+            await asyncio.sleep(delay)
+            order.append(("end", name))
+            return name
+        return fn
+
+    graph = StepGraph()
+    graph.add("files", step("files"))
+    graph.add("entrypoint", step("entrypoint", 0.05), deps=("files",))
+    graph.add("summary", step("summary", 0.01), deps=("files",))
+
+    results = asyncio.run(graph.arun())
+    assert results == {"files": "files", "entrypoint": "entrypoint", "summary": "summary"}
+    assert order[:2] == [("start", "files", ()), ("end", "files")]
+    # The summary doesn't wait for the slower entrypoint step
+    assert order.index(("end", "summary")) < order.index(("end", "entrypoint"))
+    assert ("start", "summary", ("files",)) in order
+
+
+def test_arun_cancels_other_steps_on_error():
+    cancelled = []
+
+    async def slow(**deps):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def broken(**deps):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("step failed")
+
+    graph = StepGraph()
+    graph.add("slow", slow)
+    graph.add("broken", broken)
+
+    async def run():
+        started = time.monotonic()
+        with pytest.raises(RuntimeError, match="step failed"):
+            await graph.arun()
+        await asyncio.sleep(0)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 5
+    assert cancelled == ["slow"]
@@ -1,6 +1,29 @@
+"""
+Multi-agent (web research / RAG / NL2SQL) LangGraph service behind Flask.
+
+Heavy resources (Chroma + embedding model, the Chinook database and
+NL2SQL chain, the compiled graphs) are built lazily on first use.
+STARTUP_MODE selects when:
+  - background (default): warmed up in background threads right after
+    import, so /health answers immediately and /ready turns 200 once done
+  - lazy: only when a request first needs them
+  - eager: synchronously at import (the old behaviour)
+Set PROFILE_STARTUP=1 to print import and per-resource init timings; for a
+per-module breakdown run `python -X importtime agent.py 2> importtime.log`.
+"""
+
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import functools
 import os
 import re
+import sqlite3
 import subprocess
+import sys
+import threading
+from collections import OrderedDict
 from operator import itemgetter
 from typing import (
     Callable,
@@ -13,14 +36,14 @@ from typing import (
     Union,
     cast,
 )
+from uuid import uuid4
 
+import numpy as np
 from dotenv.main import load_dotenv
 from flask import Flask, jsonify, request
-from IPython.display import Image, display
 from langchain.chains import create_sql_query_chain
 from langchain.tools import tool
 from langchain_chroma import Chroma
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader
 from langchain_community.embeddings.sentence_transformer import (
     SentenceTransformerEmbeddings,
 )
@@ -46,7 +69,6 @@ from langchain_core.runnables import (
     RunnablePassthrough,
 )
 from langchain_openai import ChatOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph._api.deprecation import deprecated_parameter
 from langgraph.errors import ErrorCode, create_error_message
 from langgraph.graph import END, START, MessagesState, StateGraph
@@ -67,10 +89,15 @@ from maxim.logger.components.generation import Generation, GenerationConfig
 from maxim.logger.components.span import Span, SpanConfig
 from maxim.logger.components.toolCall import ToolCall, ToolCallConfig
 from maxim.logger.components.trace import Trace
-from mock_tracer import MockTracer
 from pydantic import BaseModel
 from typing_extensions import Annotated, TypedDict
 
+from ingestion import ingest
+from mock_tracer import MockTracer
+from sql_cleaning import clean_sql_query
+
+_IMPORTS_DONE = time.perf_counter()
+
 load_dotenv()
 
 
@@ -92,61 +119,78 @@ llm = ChatOpenAI(model_name="gpt-4o")
 
 web_search_tool = TavilySearchResults(max_results=2)
 
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background").lower()
+if STARTUP_MODE not in ("background", "lazy", "eager"):
+    raise ValueError(f"Unknown STARTUP_MODE: {STARTUP_MODE!r}")
+PROFILE_STARTUP = os.environ.get("PROFILE_STARTUP", "") not in ("", "0")
 
-def load_documents(folder_path: str) -> List[Document]:
-    documents = []
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        if filename.endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-        elif filename.endswith(".docx"):
-            loader = Docx2txtLoader(file_path)
-        else:
-            # print(f"Unsupported file type: {filename}")
-            
-            continue
-        documents.extend(loader.load())
-    return documents
+# resource name -> {"ready", "seconds", "error"}, reported by /ready
+startup_status = {}
 
 
-def vector_store() -> Chroma:
-    embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+def _profile(message: str):
+    if PROFILE_STARTUP:
+        print(f"[startup] {message}", file=sys.stderr, flush=True)
+
+
+def lazy_resource(fn):
+    """Build fn() once, on first call, even with concurrent callers.
+
+    A failed build is recorded in startup_status and retried on the next call.
+    """
+    name = fn.__name__.removeprefix("get_")
+    status = startup_status[name] = {"ready": False, "seconds": None, "error": None}
+    lock = threading.Lock()
+    value = []
+
+    @functools.wraps(fn)
+    def get():
+        if not value:
+            with lock:
+                if not value:
+                    started = time.perf_counter()
+                    try:
+                        value.append(fn())
+                    except Exception as e:
+                        status["error"] = repr(e)
+                        raise
+                    status.update(
+                        ready=True,
+                        seconds=round(time.perf_counter() - started, 3),
+                        error=None,
+                    )
+                    _profile(f"{name} ready in {status['seconds'] * 1000:.0f}ms")
+        return value[0]
+
+    return get
+
+
+CHROMA_DIR = "./chroma_db"
+
+
+@lazy_resource
+def get_embeddings() -> SentenceTransformerEmbeddings:
+    """Shared by the RAG store and the NL2SQL question cache."""
+    return SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
 
-    # Check if the database already exists
-    if os.path.exists("./chroma_db"):
-        # print("Loading existing vector store from './chroma_db'")
-        vectorstore = Chroma(
-            collection_name="my_collection",
-            embedding_function=embedding_function,
-            persist_directory="./chroma_db",
-        )
-    else:
-        # print("Creating new vector store...")
-        folder_path = os.path.join(os.path.dirname(__file__), "content", "docs")
-        documents = load_documents(folder_path)
-        # print(f"Loaded {len(documents)} documents from the folder.")
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, length_function=len
-        )
 
-        splits = text_splitter.split_documents(documents)
-        # print(f"Split the documents into {len(splits)} chunks.")
+def vector_store() -> Chroma:
+    """Open the Chroma store, embedding only docs that are new or changed."""
+    folder_path = os.path.join(os.path.dirname(__file__), "content", "docs")
 
-        vectorstore = Chroma.from_documents(
+    def open_store() -> Chroma:
+        return Chroma(
             collection_name="my_collection",
-            documents=splits,
-            embedding=embedding_function,
-            persist_directory="./chroma_db",
+            embedding_function=get_embeddings(),
+            persist_directory=CHROMA_DIR,
         )
-        # print("Vector store created and persisted to './chroma_db'")
-
-    return vectorstore
 
+    return ingest(folder_path, CHROMA_DIR, open_store)
 
-vectorstore = vector_store()
 
-retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
+@lazy_resource
+def get_vectorstore() -> Chroma:
+    return vector_store()
 
 
 class RagToolSchema(BaseModel):
@@ -157,94 +201,309 @@ class RagToolSchema(BaseModel):
 def retriever_tool(question):
     """Tool to Retrieve Semantically Similar documents to answer User Questions related to FutureSmart AI"""
     # print("INSIDE RETRIEVER NODE")
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
+    retriever = get_vectorstore().as_retriever(search_kwargs={"k": 2})
     retriever_results = retriever.invoke(question)
     return "\n\n".join(doc.page_content for doc in retriever_results)
 
 
-if not os.path.exists("Chinook.db"):
-    # print("Downloading Chinook database...")
-    subprocess.run(
-        [
-            "wget",
-            "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite",
-        ]
-    )
-    subprocess.run(["mv", "Chinook_Sqlite.sqlite", "Chinook.db"])
-else:
-    # print("Chinook database already exists")
-    pass
+CHINOOK_URI = "sqlite:///Chinook.db"
+
 
+def download_chinook():
+    if not os.path.exists("Chinook.db"):
+        # print("Downloading Chinook database...")
+        subprocess.run(
+            [
+                "wget",
+                "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite",
+            ]
+        )
+        subprocess.run(["mv", "Chinook_Sqlite.sqlite", "Chinook.db"])
 
-db = SQLDatabase.from_uri("sqlite:///Chinook.db")
 
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase that introspects each table set (schema + sample rows) once.
 
-def clean_sql_query(text: str) -> str:
+    create_sql_query_chain asks for the table info on every call. It only
+    changes with the schema, and NL2SQLChain replaces the whole database
+    object when SQLite's schema_version changes, so it is never stale.
     """
-    Clean SQL query by removing code block syntax, various SQL tags, backticks,
-    prefixes, and unnecessary whitespace while preserving the core SQL query.
 
-    Args:
-        text (str): Raw SQL query text that may contain code blocks, tags, and backticks
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._table_info = {}
+        self.version = self.schema_version()
+
+    def schema_version(self) -> int:
+        with self._engine.connect() as connection:
+            return connection.exec_driver_sql("PRAGMA schema_version").scalar()
+
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        key = tuple(sorted(table_names)) if table_names else None
+        info = self._table_info.get(key)
+        if info is None:
+            info = self._table_info[key] = super().get_table_info(table_names)
+        return info
+
+
+_NUMBERS_AND_QUOTES = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+_WORD = re.compile(r"\w+")
+# Words that don't change which query a question asks for
+_STOPWORDS = frozenset(
+    "a an the of in on at to for by from and is are was were be been do does did "
+    "what which who whom whose please show list give find get tell me us i we you "
+    "can could would will there their its it this that these those".split()
+)
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.casefold().split()).rstrip("?.! ")
+
+
+def _content_words(key: str) -> frozenset:
+    return frozenset(_WORD.findall(key)) - _STOPWORDS
+
+
+def _normalize_sql(sql: str) -> str:
+    # Whitespace and trailing semicolons only: case matters inside literals
+    return " ".join(sql.split()).rstrip("; ")
+
+
+def _similarity_threshold():
+    value = os.environ.get("NL2SQL_SIMILARITY_THRESHOLD", "")
+    return float(value) if value else None
+
 
-    Returns:
-        str: Cleaned SQL query
+class QuestionCache:
+    """Question -> cleaned SQL, matched exactly or by embedding similarity.
+
+    Similar matching is off unless a threshold is given, because questions
+    that differ in one word ("most" / "fewest tracks", "from Brazil" /
+    "Canada") embed almost identically but need different SQL. When it is
+    on, a similar match is only used when both questions contain the same
+    numbers, quoted values and words other than stopwords, so it only
+    catches rephrasings like "show me the top artists" / "top artists".
+    """
+
+    MAX_ENTRIES = 1000
+
+    def __init__(self, embed: Callable[[str], List[float]], threshold: float = None):
+        self.embed = embed
+        self.threshold = threshold
+        self.hits = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._sql = OrderedDict()  # normalized question -> SQL
+            self._keys = []
+            self._vectors = np.empty((0, 0))
+
+    def lookup(self, question: str):
+        """Returns (sql, similarity, vector); sql is None on a miss.
+
+        vector is the question's embedding when one was computed, to be
+        passed on to add() so a miss doesn't embed the question twice.
+        """
+        key = _normalize_question(question)
+        with self._lock:
+            self.lookups += 1
+            sql = self._sql.get(key)
+            if sql is not None:
+                self.hits += 1
+                return sql, 1.0, None
+            if self.threshold is None or not self._keys:
+                return None, 0.0, None
+        vector = self._unit(question)
+        with self._lock:
+            if not self._keys:
+                return None, 0.0, vector
+            scores = self._vectors @ vector
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            match = self._keys[best]
+            if (
+                similarity >= self.threshold
+                and _content_words(match) == _content_words(key)
+                and sorted(_NUMBERS_AND_QUOTES.findall(match))
+                == sorted(_NUMBERS_AND_QUOTES.findall(key))
+            ):
+                self.hits += 1
+                return self._sql[match], similarity, vector
+        return None, similarity, vector
+
+    def add(self, question: str, sql: str, vector: np.ndarray = None):
+        key = _normalize_question(question)
+        if self.threshold is not None and vector is None:
+            vector = self._unit(question)
+        with self._lock:
+            if key in self._sql:
+                return
+            self._sql[key] = sql
+            self._keys.append(key)
+            if vector is not None:
+                rows = [self._vectors] if len(self._vectors) else []
+                self._vectors = np.vstack(rows + [vector])
+            if len(self._keys) > self.MAX_ENTRIES:  # drop the oldest
+                self._sql.pop(self._keys.pop(0))
+                if vector is not None:
+                    self._vectors = self._vectors[1:]
+
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def _unit(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed(_normalize_question(question)), dtype=float)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class ResultCache:
+    """LRU of normalized SQL -> query result for one database data version."""
+
+    MAX_ENTRIES = 512
+
+    def __init__(self):
+        self.hits = 0
+        self.lookups = 0
+        self._results = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, sql: str, version):
+        with self._lock:
+            self.lookups += 1
+            if version != self._version:
+                # Something was written since these results were cached
+                self._results.clear()
+                self._version = version
+            result = self._results.get(_normalize_sql(sql))
+            if result is not None:
+                self._results.move_to_end(_normalize_sql(sql))
+                self.hits += 1
+            return result
+
+    def put(self, sql: str, version, result: str):
+        if not _normalize_sql(sql).upper().startswith(("SELECT", "WITH")):
+            return  # only cache reads
+        with self._lock:
+            if version != self._version:
+                return
+            self._results[_normalize_sql(sql)] = result
+            while len(self._results) > self.MAX_ENTRIES:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class NL2SQLChain:
+    """Question -> SQL -> result, built once per schema version and cached.
+
+    Each call checks PRAGMA schema_version (a cheap read); when the schema
+    changed the database is re-reflected, the chain rebuilt and both caches
+    cleared. In front of the LLM and the database sit
+      - a QuestionCache from question to cleaned SQL, and
+      - a ResultCache from normalized SQL to result, dropped whenever
+        PRAGMA data_version shows that the database was written to.
+    Both only keep SQL that executed without an error.
+    Cache hit rates are reported on the current Maxim trace.
     """
-    # Step 1: Remove code block syntax and any SQL-related tags
-    # This handles variations like ```sql, ```SQL, ```SQLQuery, etc.
-    block_pattern = r"```(?:sql|SQL|SQLQuery|mysql|postgresql)?\s*(.*?)\s*```"
-    text = re.sub(block_pattern, r"\1", text, flags=re.DOTALL)
-
-    # Step 2: Handle "SQLQuery:" prefix and similar variations
-    # This will match patterns like "SQLQuery:", "SQL Query:", "MySQL:", etc.
-    prefix_pattern = r"^(?:SQL\s*Query|SQLQuery|MySQL|PostgreSQL|SQL)\s*:\s*"
-    text = re.sub(prefix_pattern, "", text, flags=re.IGNORECASE)
-
-    # Step 3: Extract the first SQL statement if there's random text after it
-    # Look for a complete SQL statement ending with semicolon
-    sql_statement_pattern = r"(SELECT.*?;)"
-    sql_match = re.search(sql_statement_pattern, text, flags=re.IGNORECASE | re.DOTALL)
-    if sql_match:
-        text = sql_match.group(1)
-
-    # Step 4: Remove backticks around identifiers
-    text = re.sub(r"`([^`]*)`", r"\1", text)
-
-    # Step 5: Normalize whitespace
-    # Replace multiple spaces with single space
-    text = re.sub(r"\s+", " ", text)
-
-    # Step 6: Preserve newlines for main SQL keywords to maintain readability
-    keywords = [
-        "SELECT",
-        "FROM",
-        "WHERE",
-        "GROUP BY",
-        "HAVING",
-        "ORDER BY",
-        "LIMIT",
-        "JOIN",
-        "LEFT JOIN",
-        "RIGHT JOIN",
-        "INNER JOIN",
-        "OUTER JOIN",
-        "UNION",
-        "VALUES",
-        "INSERT",
-        "UPDATE",
-        "DELETE",
-    ]
-
-    # Case-insensitive replacement for keywords
-    pattern = "|".join(r"\b{}\b".format(k) for k in keywords)
-    text = re.sub(f"({pattern})", r"\n\1", text, flags=re.IGNORECASE)
-
-    # Step 7: Final cleanup
-    # Remove leading/trailing whitespace and extra newlines
-    text = text.strip()
-    text = re.sub(r"\n\s*\n", "\n", text)
-
-    return text
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.questions = QuestionCache(
+            lambda text: get_embeddings().embed_query(text), _similarity_threshold()
+        )
+        self.results = ResultCache()
+        self._lock = threading.Lock()
+        self._db = None
+        self._write_query = None
+        self._execute_query = None
+        # data_version only changes for commits made on *other* connections,
+        # so it is read on a connection that never writes
+        self._watch = sqlite3.connect(
+            uri.removeprefix("sqlite:///"), check_same_thread=False
+        )
+        self._watch_lock = threading.Lock()
+        self._refresh()
+
+    def run(self, question: str) -> str:
+        self._refresh()
+        sql, similarity, vector = self.questions.lookup(question)
+        sql_hit = sql is not None
+        if not sql_hit:
+            sql = self._write_query.invoke({"question": question})
+
+        version = self._data_version()
+        result = self.results.get(sql, version)
+        result_hit = result is not None
+        if not result_hit:
+            result = self._execute_query.invoke(sql)
+        # The tool returns failures as "Error: ..." instead of raising;
+        # neither the SQL nor its error is worth reusing
+        if not str(result).startswith("Error:"):
+            if not result_hit:
+                self.results.put(sql, version, result)
+            if not sql_hit:
+                self.questions.add(question, sql, vector)
+
+        self._report(sql, similarity, sql_hit, result_hit)
+        return result
+
+    def _refresh(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    db = CachedSQLDatabase.from_uri(self.uri)
+                    db.get_table_info()  # precompute schema + sample rows
+                    self._write_query = create_sql_query_chain(
+                        llm, db
+                    ) | RunnableLambda(clean_sql_query)
+                    self._execute_query = QuerySQLDataBaseTool(db=db)
+                    self.questions.clear()
+                    self.results.clear()
+                    self._db = db
+
+    def _stale(self) -> bool:
+        return self._db is None or self._db.schema_version() != self._db.version
+
+    def _data_version(self) -> int:
+        with self._watch_lock:
+            return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _report(self, sql: str, similarity: float, sql_hit: bool, result_hit: bool):
+        trace = current_trace()
+        if trace is None:
+            return
+        rates = {
+            "nl2sql_sql_cache_hit_rate": round(self.questions.hit_rate(), 4),
+            "nl2sql_result_cache_hit_rate": round(self.results.hit_rate(), 4),
+        }
+        trace.event(
+            str(uuid4()),
+            "nl2sql_cache",
+            tags={
+                "sql_cache": "hit" if sql_hit else "miss",
+                "result_cache": "hit" if result_hit else "miss",
+            },
+            metadata={"sql": sql, "similarity": round(similarity, 4), **rates},
+        )
+        add_metric = getattr(trace, "add_metric", None)  # newer maxim-py only
+        if add_metric is not None:
+            for name, value in rates.items():
+                add_metric(name, value)
+
+
+@lazy_resource
+def get_nl2sql() -> NL2SQLChain:
+    download_chinook()
+    return NL2SQLChain(CHINOOK_URI)
 
 
 class SQLToolSchema(BaseModel):
@@ -255,15 +514,7 @@ class SQLToolSchema(BaseModel):
 def nl2sql_tool(question):
     """Tool to Generate and Execute SQL Query to answer User Questions related to chinook DB"""
     # print("INSIDE NL2SQL TOOL")
-    execute_query = QuerySQLDataBaseTool(db=db)
-    write_query = create_sql_query_chain(llm, db)
-
-    chain = RunnablePassthrough.assign(
-        query=write_query | RunnableLambda(clean_sql_query)
-    ).assign(result=itemgetter("query") | execute_query)
-
-    response = chain.invoke({"question": question})
-    return response["result"]
+    return get_nl2sql().run(question)
 
 
 members = ["web_researcher", "rag", "nl2sql"]
@@ -330,16 +581,24 @@ def create_agent(llm, tools):
     return graph
 
 
-websearch_agent = create_agent(llm, [web_search_tool])
+@lazy_resource
+def get_workers() -> dict:
+    """Compiled tool-calling subgraph for each worker."""
+    return {
+        "web_researcher": create_agent(llm, [web_search_tool]),
+        "rag": create_agent(llm, [retriever_tool]),
+        "nl2sql": create_agent(llm, [nl2sql_tool]),
+    }
+
 
 # try:
-#     print(websearch_agent.get_graph().draw_mermaid_png())
+#     print(get_workers()["web_researcher"].get_graph().draw_mermaid_png())
 # except Exception:
 #     pass
 
 
 def web_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = websearch_agent.invoke(state)
+    result = get_workers()["web_researcher"].invoke(state)
     return Command(
         update={
             "messages": [
@@ -352,11 +611,8 @@ def web_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
     )
 
 
-rag_agent = create_agent(llm, [retriever_tool])
-
-
 def rag_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = rag_agent.invoke(state)
+    result = get_workers()["rag"].invoke(state)
     return Command(
         update={
             "messages": [
@@ -367,11 +623,8 @@ def rag_node(state: MessagesState) -> Command[Literal["supervisor"]]:
     )
 
 
-nl2sql_agent = create_agent(llm, [nl2sql_tool])
-
-
 def nl2sql_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = nl2sql_agent.invoke(state)
+    result = get_workers()["nl2sql"].invoke(state)
     return Command(
         update={
             "messages": [
@@ -382,20 +635,22 @@ def nl2sql_node(state: MessagesState) -> Command[Literal["supervisor"]]:
     )
 
 
-builder = StateGraph(MessagesState)
-builder.add_edge(START, "supervisor")
-builder.add_node("supervisor", supervisor_node)
-builder.add_node("web_researcher", web_research_node)
-builder.add_node("rag", rag_node)
-builder.add_node("nl2sql", nl2sql_node)
-graph = builder.compile()
+@lazy_resource
+def get_graph() -> CompiledGraph:
+    builder = StateGraph(MessagesState)
+    builder.add_edge(START, "supervisor")
+    builder.add_node("supervisor", supervisor_node)
+    builder.add_node("web_researcher", web_research_node)
+    builder.add_node("rag", rag_node)
+    builder.add_node("nl2sql", nl2sql_node)
+    return builder.compile()
 
 
 @langgraph_agent(name="multi-agent-work")
 def ask_agent(user_message: str):
     config = {"callbacks": [langchain_callback()]}
     repsonse = ""
-    for s in graph.stream(
+    for s in get_graph().stream(
         input={
             "messages": [("user", user_message)],
         },
@@ -417,7 +672,55 @@ def chat():
     return jsonify({"result": response})
 
 
-flask_app.run(port=8000)
+@flask_app.get("/health")
+def health():
+    """Liveness: answers as soon as the module is imported."""
+    return jsonify({"status": "ok"})
+
+
+@flask_app.get("/ready")
+def ready():
+    """Readiness: 503 until the background warm-up has built everything."""
+    resources = {name: dict(status) for name, status in startup_status.items()}
+    is_ready = STARTUP_MODE == "lazy" or all(s["ready"] for s in resources.values())
+    return (
+        jsonify({"ready": is_ready, "mode": STARTUP_MODE, "resources": resources}),
+        200 if is_ready else 503,
+    )
+
+
+WARM_UP = (get_graph, get_workers, get_nl2sql, get_vectorstore)
+
+
+def _warm(get):
+    try:
+        get()
+    except Exception:
+        pass  # recorded in startup_status; retried on first use
+
+
+def warm_up():
+    """Build every lazy resource in background threads (one per resource)."""
+    for get in WARM_UP:
+        threading.Thread(
+            target=_warm, args=(get,), name=f"warm-up-{get.__name__}", daemon=True
+        ).start()
+
+
+_profile(
+    f"imports {(_IMPORTS_DONE - _IMPORT_STARTED) * 1000:.0f}ms, "
+    f"module init {(time.perf_counter() - _IMPORTS_DONE) * 1000:.0f}ms"
+)
+
+if STARTUP_MODE == "eager":
+    for get in WARM_UP:
+        get()
+elif STARTUP_MODE == "background":
+    warm_up()
+
+
+if __name__ == "__main__":
+    flask_app.run(port=8000)
 
 # from langfuse.callback import CallbackHandler
 # langfuse_handler = CallbackHandler()
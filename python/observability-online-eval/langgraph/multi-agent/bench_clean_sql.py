@@ -0,0 +1,164 @@
+"""
+Benchmark: precompiled clean_sql_query vs the previous seven-regex version.
+
+Checks that both return identical output on a corpus of LLM-style SQL
+responses (hand-written edge cases plus randomly generated variations of
+fences, prefixes, backticks, keyword case, whitespace and trailing chatter),
+then reports the time per call.
+
+Usage:
+    python bench_clean_sql.py [--samples 5000] [--repeat 5] [--seed 0]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from sql_cleaning import KEYWORDS, clean_sql_query
+
+
+# ── Previous implementation (reference) ─────────────────────────────
+
+
+def legacy_clean_sql_query(text: str) -> str:
+    block_pattern = r"```(?:sql|SQL|SQLQuery|mysql|postgresql)?\s*(.*?)\s*```"
+    text = re.sub(block_pattern, r"\1", text, flags=re.DOTALL)
+
+    prefix_pattern = r"^(?:SQL\s*Query|SQLQuery|MySQL|PostgreSQL|SQL)\s*:\s*"
+    text = re.sub(prefix_pattern, "", text, flags=re.IGNORECASE)
+
+    sql_statement_pattern = r"(SELECT.*?;)"
+    sql_match = re.search(sql_statement_pattern, text, flags=re.IGNORECASE | re.DOTALL)
+    if sql_match:
+        text = sql_match.group(1)
+
+    text = re.sub(r"`([^`]*)`", r"\1", text)
+
+    text = re.sub(r"\s+", " ", text)
+
+    keywords = [
+        "SELECT",
+        "FROM",
+        "WHERE",
+        "GROUP BY",
+        "HAVING",
+        "ORDER BY",
+        "LIMIT",
+        "JOIN",
+        "LEFT JOIN",
+        "RIGHT JOIN",
+        "INNER JOIN",
+        "OUTER JOIN",
+        "UNION",
+        "VALUES",
+        "INSERT",
+        "UPDATE",
+        "DELETE",
+    ]
+
+    pattern = "|".join(r"\b{}\b".format(k) for k in keywords)
+    text = re.sub(f"({pattern})", r"\n\1", text, flags=re.IGNORECASE)
+
+    text = text.strip()
+    text = re.sub(r"\n\s*\n", "\n", text)
+
+    return text
+
+
+# ── Corpus ──────────────────────────────────────────────────────────
+
+
+EDGE_CASES = [
+    "",
+    "   \n\t ",
+    "SELECT 1;",
+    "SQLQuery: SELECT * FROM Artist LIMIT 5;",
+    "```sql\nSELECT `Name` FROM `Artist`\nWHERE ArtistId = 1;\n```",
+    "SQL Query :  select name from artist;  Explanation: this lists names.",
+    "```SQLQuery\nSELECT a.Title, COUNT(*) FROM Album a LEFT JOIN Track t\n"
+    "ON a.AlbumId = t.AlbumId GROUP\n\nBY a.Title ORDER   BY 2 DESC;```",
+    "Here is the query:\n```\nSELECT 1 UNION SELECT 2;\n```\nand another ```sql SELECT 3;```",
+    "INSERT INTO Genre (Name) VALUES ('Jazz fusion')",
+    "select fromage from selection where wherever = 'GROUP BY';",
+    "SELECT x FROM t LEFT  OUTER JOIN u ON 1 INNER\tJOIN v ON 2;",
+    "MySQL: UPDATE t SET `x` = 1 WHERE id = 2",
+    "SELECT `unterminated FROM t;",
+    "select * from　t;",
+]
+
+_COLUMNS = ["Name", "Title", "t.TrackId", "SUM(il.UnitPrice * il.Quantity)", "*"]
+_TABLES = ["Artist", "Album a", "Track t", "Invoice", "InvoiceLine il", "Genre"]
+_CHATTER = [
+    "",
+    "\n\nThis query returns the top results.",
+    " -- done",
+    "\nNote: SELECT is case-insensitive.",
+]
+
+
+def _word(rng: random.Random, word: str) -> str:
+    """Random case and inner whitespace for a (possibly multi-word) keyword."""
+    word = rng.choice([word.upper(), word.lower(), word.title()])
+    return rng.choice([" ", "  ", "\n", "\t", " \n "]).join(word.split(" "))
+
+
+def _space(rng: random.Random) -> str:
+    return rng.choice([" ", " ", "  ", "\n", "\n    ", "\t", "\n\n"])
+
+
+def random_response(rng: random.Random) -> str:
+    parts = [_word(rng, "SELECT")]
+    parts.append(", ".join(
+        f"`{c}`" if rng.random() < 0.3 else c for c in rng.sample(_COLUMNS, 2)
+    ))
+    parts += [_word(rng, "FROM"), rng.choice(_TABLES)]
+    for _ in range(rng.randint(0, 4)):
+        keyword = rng.choice(KEYWORDS + ["AND", "ON", "DESC"])
+        parts += [_word(rng, keyword), rng.choice(_TABLES + _COLUMNS + ["1", "'x y'"])]
+    sql = _space(rng).join(p for p in parts)
+    if rng.random() < 0.7:
+        sql += rng.choice([";", " ;", ";\n"])
+
+    fence = rng.choice(["", "sql", "SQL", "SQLQuery", "mysql", "postgresql", None])
+    if fence is not None:
+        sql = f"```{fence}{_space(rng)}{sql}{_space(rng)}```"
+    prefix = rng.choice(["", "SQLQuery: ", "SQL Query:", "sql :  ", "PostgreSQL:\n"])
+    lead = rng.choice(["", "Here is the query:\n", "  "])
+    return lead + prefix + sql + rng.choice(_CHATTER)
+
+
+def best_of(fn, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = EDGE_CASES + [random_response(rng) for _ in range(args.samples)]
+    for i, text in enumerate(corpus):
+        expected = legacy_clean_sql_query(text)
+        actual = clean_sql_query(text)
+        assert actual == expected, f"sample {i}: {text!r}\n{expected!r}\n{actual!r}"
+    print(f"{len(corpus)} samples: identical output")
+
+    t_old = best_of(legacy_clean_sql_query, corpus, args.repeat)
+    t_new = best_of(clean_sql_query, corpus, args.repeat)
+    print(f"{'legacy':<12}{t_old / len(corpus) * 1e6:>8.1f}us/call")
+    print(f"{'precompiled':<12}{t_new / len(corpus) * 1e6:>8.1f}us/call")
+    print(f"{'speedup':<12}{t_old / t_new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
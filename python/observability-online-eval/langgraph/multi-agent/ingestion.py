@@ -0,0 +1,159 @@
+"""
+Incremental, parallel ingestion of the RAG documents into Chroma.
+
+PDF/DOCX files are loaded and split in a process pool and the chunks are
+embedded in batches. The pool runs in a separate `python ingestion.py`
+process, so it is forked from a fresh single-threaded interpreter rather
+than from the (multithreaded) app. A manifest of per-file content hashes is
+kept next to the index, so only new or changed files are re-embedded and the
+chunks of deleted files are removed, instead of rebuilding the whole store.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from langchain_chroma import Chroma
+from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+LOADERS = {".pdf": PyPDFLoader, ".docx": Docx2txtLoader}
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks per add_documents call (one embedding batch)
+EMBED_BATCH_SIZE = 256
+MANIFEST_NAME = "ingest_manifest.json"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_and_split(file_path: str) -> List[Document]:
+    """Load one file and split it into chunks (runs in a worker process)."""
+    loader = LOADERS[os.path.splitext(file_path)[1].lower()](file_path)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len
+    )
+    return text_splitter.split_documents(loader.load())
+
+
+def _load_all(paths: List[str], max_workers: int = None) -> Dict[str, List[Document]]:
+    """Load and split paths in a worker process pool (or in-process).
+
+    Forking the calling process isn't safe once it runs threads (agent.py
+    warms up resources and logs traces in background threads), and spawn /
+    forkserver workers re-import the calling script. So the pool is started
+    from a child interpreter running this module, which doesn't import the
+    app and is single-threaded when it forks.
+    """
+    if len(paths) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return {path: load_and_split(path) for path in paths}
+    command = [
+        sys.executable, os.path.abspath(__file__), "--workers", str(max_workers or 0)
+    ]
+    loaded = subprocess.run(command + paths, stdout=subprocess.PIPE, check=True)
+    return pickle.loads(loaded.stdout)
+
+
+def _load_in_pool(
+    paths: List[str], max_workers: int = None
+) -> Dict[str, List[Document]]:
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        return dict(zip(paths, pool.map(load_and_split, paths)))
+
+
+def _read_manifest(path: str) -> Dict[str, str]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(path: str, manifest: Dict[str, str]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _delete_source(vectorstore: Chroma, file_path: str):
+    """Remove every chunk loaded from file_path (loaders set it as "source")."""
+    ids = vectorstore.get(where={"source": file_path}, include=[])["ids"]
+    if ids:
+        vectorstore.delete(ids=ids)
+
+
+def ingest(
+    folder_path: str,
+    persist_directory: str,
+    open_store: Callable[[], Chroma],
+    max_workers: int = None,
+) -> Chroma:
+    """Bring the store at persist_directory in sync with folder_path.
+
+    open_store is called after the changed files were loaded, so loading
+    overlaps with nothing else that needs the embedding model or Chroma.
+    """
+    manifest_path = os.path.join(persist_directory, MANIFEST_NAME)
+    manifest = _read_manifest(manifest_path)
+
+    current = {}
+    for filename in sorted(os.listdir(folder_path)):
+        if os.path.splitext(filename)[1].lower() in LOADERS:
+            current[filename] = file_hash(os.path.join(folder_path, filename))
+    changed = [name for name, digest in current.items() if manifest.get(name) != digest]
+    removed = [name for name in manifest if name not in current]
+
+    loaded = _load_all(
+        [os.path.join(folder_path, name) for name in changed], max_workers
+    )
+    vectorstore = open_store()
+    if not changed and not removed:
+        return vectorstore
+
+    # Stores built before the manifest existed have no entries, so their
+    # chunks are found (and replaced) by source path too
+    for name in changed + removed:
+        _delete_source(vectorstore, os.path.join(folder_path, name))
+
+    chunks, ids = [], []
+    for name in changed:
+        digest = current[name]
+        for i, chunk in enumerate(loaded[os.path.join(folder_path, name)]):
+            chunks.append(chunk)
+            ids.append(f"{name}:{digest[:16]}:{i}")
+    for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+        vectorstore.add_documents(
+            chunks[start:start + EMBED_BATCH_SIZE],
+            ids=ids[start:start + EMBED_BATCH_SIZE],
+        )
+
+    _write_manifest(manifest_path, current)
+    return vectorstore
+
+
+if __name__ == "__main__":
+    # Worker entry point for _load_all: python ingestion.py --workers N PATH...
+    workers, paths = int(sys.argv[2]), sys.argv[3:]
+    # Keep stdout for the result: anything else printed goes to stderr
+    result = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    with result:
+        pickle.dump(_load_in_pool(paths, workers or None), result)
@@ -0,0 +1,71 @@
+"""
+Normalization of LLM-generated SQL before it is executed.
+
+All patterns are compiled once at import, whitespace is collapsed with
+str.split instead of a regex, and the final blank-line cleanup of the old
+version is gone: it could never match (see clean_sql_query).
+"""
+
+import re
+
+# This handles variations like ```sql, ```SQL, ```SQLQuery, etc.
+_CODE_BLOCK = re.compile(
+    r"```(?:sql|SQL|SQLQuery|mysql|postgresql)?\s*(.*?)\s*```", re.DOTALL
+)
+# Matches prefixes like "SQLQuery:", "SQL Query:", "MySQL:", etc.
+_PREFIX = re.compile(
+    r"^(?:SQL\s*Query|SQLQuery|MySQL|PostgreSQL|SQL)\s*:\s*", re.IGNORECASE
+)
+# First complete statement, dropping any text the model added after it
+_STATEMENT = re.compile(r"(SELECT.*?;)", re.IGNORECASE | re.DOTALL)
+_BACKTICKS = re.compile(r"`([^`]*)`")
+
+KEYWORDS = [
+    "SELECT",
+    "FROM",
+    "WHERE",
+    "GROUP BY",
+    "HAVING",
+    "ORDER BY",
+    "LIMIT",
+    "JOIN",
+    "LEFT JOIN",
+    "RIGHT JOIN",
+    "INNER JOIN",
+    "OUTER JOIN",
+    "UNION",
+    "VALUES",
+    "INSERT",
+    "UPDATE",
+    "DELETE",
+]
+_KEYWORD = re.compile(
+    "({})".format("|".join(r"\b{}\b".format(k) for k in KEYWORDS)), re.IGNORECASE
+)
+
+
+def clean_sql_query(text: str) -> str:
+    """
+    Clean SQL query by removing code block syntax, various SQL tags, backticks,
+    prefixes, and unnecessary whitespace while preserving the core SQL query.
+
+    Args:
+        text (str): Raw SQL query text that may contain code blocks, tags, and backticks
+
+    Returns:
+        str: Cleaned SQL query
+    """
+    text = _CODE_BLOCK.sub(r"\1", text)
+    text = _PREFIX.sub("", text)
+
+    sql_match = _STATEMENT.search(text)
+    if sql_match:
+        text = sql_match.group(1)
+
+    text = _BACKTICKS.sub(r"\1", text)
+
+    # Collapse whitespace (str.split uses the same whitespace as \s), then
+    # put main keywords on their own lines. Every newline is followed by a
+    # keyword, so there are no blank lines to remove afterwards.
+    text = " ".join(text.split())
+    return _KEYWORD.sub("\n\\1", text).strip()